@@ -0,0 +1,83 @@
+"""Benchmark message body codecs on event queue payloads.
+
+Prints, for each codec of briefy.common.queue.codec, the size of the sent
+body and the time to encode and decode it, for a small and a large event::
+
+    python benchmarks/message_codec.py --repeat 2000
+"""
+from briefy.common.queue.codec import CODECS
+from briefy.common.queue.codec import decode
+from briefy.common.queue.codec import encode
+from uuid import uuid4
+
+import argparse
+import json
+import time
+
+
+def event_body(history: int) -> str:
+    """Return a realistic event queue message body with history entries."""
+    return json.dumps({
+        'event_name': 'leica.assignment.workflow.ready_for_upload',
+        'created_at': '2017-12-05T18:34:22.000000+00:00',
+        'guid': str(uuid4()),
+        'actor': str(uuid4()),
+        'request_id': str(uuid4()),
+        'data': {
+            'id': str(uuid4()),
+            'title': 'Assignment',
+            'description': 'Photo shoot of the rooms, facade and surroundings of the property.',
+            'state': 'ready_for_upload',
+            'price': 12000,
+            'location': {'country': 'DE', 'locality': 'Berlin', 'coordinates': [52.5, 13.4]},
+            'state_history': [
+                {
+                    'from': 'pending',
+                    'to': 'scheduled',
+                    'transition': 'schedule',
+                    'actor': str(uuid4()),
+                    'date': '2017-12-05T18:34:22.000000+00:00',
+                    'message': 'Scheduled by the professional',
+                }
+                for _ in range(history)
+            ],
+        },
+    })
+
+
+def timed(func, repeat: int) -> float:
+    """Return the best time, in microseconds, of func."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=500, help='Runs per measure')
+    args = parser.parse_args()
+
+    print('{0:8} {1:6} {2:>9} {3:>7} {4:>11} {5:>11}'.format(
+        'event', 'codec', 'bytes', 'ratio', 'encode us', 'decode us'
+    ))
+    for label, history in (('small', 2), ('large', 200)):
+        body = event_body(history)
+        size = len(body.encode('utf-8'))
+        print('{0:8} {1:6} {2:9d} {3:7.2f} {4:>11} {5:>11}'.format(
+            label, 'none', size, 1, '-', '-'
+        ))
+        for codec in sorted(CODECS):
+            data = encode(codec, body)
+            encode_time = timed(lambda: encode(codec, body), args.repeat)
+            decode_time = timed(lambda: decode(codec, data), args.repeat)
+            print('{0:8} {1:6} {2:9d} {3:7.2f} {4:11.1f} {5:11.1f}'.format(
+                label, codec, len(data), len(data) / size, encode_time, decode_time
+            ))
+
+
+if __name__ == '__main__':
+    main()
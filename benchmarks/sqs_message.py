@@ -0,0 +1,86 @@
+"""Benchmark SQSMessage deserialization of event queue messages.
+
+Compares building the colander schema for every message with the shared
+instance returned by briefy.common.queue.message.get_schema::
+
+    python benchmarks/sqs_message.py --messages 5000
+"""
+from briefy.common.queue.event import Schema
+from briefy.common.queue.message import get_schema
+from briefy.common.queue.message import SQSMessage
+from uuid import uuid4
+
+import argparse
+import json
+import time
+
+
+class RawMessage:
+    """A raw SQS message, as returned by boto3."""
+
+    def __init__(self, body: str):
+        """Initialize the message."""
+        self.body = body
+        self.receipt_handle = 'handle'
+
+
+class UncachedSQSMessage(SQSMessage):
+    """SQSMessage building its schema on every access, as before get_schema."""
+
+    @property
+    def schema(self):
+        """Return a new schema instance."""
+        return self._schema(unknown='ignore')
+
+
+def event_body(position: int) -> str:
+    """Return a realistic event queue message body."""
+    return json.dumps({
+        'event_name': 'leica.assignment.workflow.ready_for_upload',
+        'created_at': '2017-12-05T18:34:22.000000+00:00',
+        'guid': str(uuid4()),
+        'actor': str(uuid4()),
+        'request_id': str(uuid4()),
+        'data': {
+            'id': str(uuid4()),
+            'title': 'Assignment {0}'.format(position),
+            'state': 'ready_for_upload',
+            'price': 12000,
+            'location': {'country': 'DE', 'locality': 'Berlin', 'coordinates': [52.5, 13.4]},
+            'history': [
+                {'from': 'pending', 'to': 'scheduled', 'actor': str(uuid4())}
+                for _ in range(5)
+            ],
+        },
+    })
+
+
+def run(klass, raw_messages, repeat: int) -> float:
+    """Return the best messages per second over repeat runs."""
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for raw in raw_messages:
+            klass(Schema, message=raw).body
+        best = max(best, len(raw_messages) / (time.perf_counter() - start))
+    return best
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000, help='Messages per run')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per variant')
+    args = parser.parse_args()
+
+    raw_messages = [RawMessage(event_body(i)) for i in range(args.messages)]
+    get_schema(Schema)
+    uncached = run(UncachedSQSMessage, raw_messages, args.repeat)
+    cached = run(SQSMessage, raw_messages, args.repeat)
+    print('schema per message: {0:10.0f} messages/s'.format(uncached))
+    print('shared schema:      {0:10.0f} messages/s'.format(cached))
+    print('speedup:            {0:10.2f}x'.format(cached / uncached))
+
+
+if __name__ == '__main__':
+    main()
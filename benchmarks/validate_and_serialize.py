@@ -0,0 +1,64 @@
+"""Benchmark validate_and_serialize on event queue payloads.
+
+Compares the full validation (serialize, then deserialize) with the single
+pass validation used for trusted producers::
+
+    python benchmarks/validate_and_serialize.py --messages 5000
+"""
+from briefy.common.db import datetime_utcnow
+from briefy.common.queue.event import Schema
+from briefy.common.queue.message import get_schema
+from briefy.common.utils.schema import validate_and_serialize
+from uuid import uuid4
+
+import argparse
+import time
+
+
+def event_payload(position: int) -> dict:
+    """Return a payload as built by briefy.common.event.Event."""
+    return {
+        'event_name': 'leica.assignment.workflow.ready_for_upload',
+        'actor': str(uuid4()),
+        'id': str(uuid4()),
+        'guid': str(uuid4()),
+        'created_at': datetime_utcnow(),
+        'request_id': str(uuid4()),
+        'data': {
+            'id': str(uuid4()),
+            'title': 'Assignment {0}'.format(position),
+            'state': 'ready_for_upload',
+            'price': 12000,
+        },
+    }
+
+
+def run(payloads, trusted: bool, repeat: int) -> float:
+    """Return the best payloads per second over repeat runs."""
+    schema = get_schema(Schema)
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for payload in payloads:
+            validate_and_serialize(schema, payload, trusted=trusted)
+        best = max(best, len(payloads) / (time.perf_counter() - start))
+    return best
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000, help='Payloads per run')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per variant')
+    args = parser.parse_args()
+
+    payloads = [event_payload(i) for i in range(args.messages)]
+    full = run(payloads, False, args.repeat)
+    trusted = run(payloads, True, args.repeat)
+    print('serialize + deserialize: {0:10.0f} payloads/s'.format(full))
+    print('trusted, single pass:    {0:10.0f} payloads/s'.format(trusted))
+    print('speedup:                 {0:10.2f}x'.format(trusted / full))
+
+
+if __name__ == '__main__':
+    main()
@@ -75,5 +75,10 @@ setup(
     tests_require=test_requirements,
     install_requires=requires,
     extras_require={'db': requires_db},
-    entry_points="""""",
+    entry_points="""
+    [console_scripts]
+    briefy.cache_warmup = briefy.common.cache.warmup:main
+    briefy.event_replay = briefy.common.event.replay:main
+    briefy.worker_supervisor = briefy.common.worker.supervisor:main
+    """,
 )
@@ -1,14 +1,24 @@
 """Utility and helper functions to manage cached data."""
 from briefy.common import config
 from briefy.common.log import logger
+from briefy.common.utils.metrics import get_metrics_sink
 from dogpile.cache import make_region
+from dogpile.cache.api import NO_VALUE
 from dogpile.cache.proxy import ProxyBackend
+from functools import wraps
+from itertools import count
+from threading import Lock
 from threading import Thread
 from zope.component import getUtility
 from zope.interface import Attribute
 from zope.interface import implementer
 from zope.interface import Interface
 
+import inspect
+import pickle
+import time
+import typing as t
+
 
 BACKENDS_CONFIG = {
     'dogpile.cache.redis': {
@@ -16,7 +26,7 @@ BACKENDS_CONFIG = {
             'host': config.CACHE_HOST,
             'port': config.CACHE_REDIS_PORT,
             'db': 0,
-            'redis_expiration_time': config.CACHE_EXPIRATION_TIME,
+            'redis_expiration_time': int(config.CACHE_EXPIRATION_TIME) + config.CACHE_STALE_TIME,
             'distributed_lock': False,
             'socket_timeout': 30,
 
@@ -41,6 +51,9 @@ BACKENDS_CONFIG = {
     }
 }
 
+REDIS_BACKENDS = ('dogpile.cache.redis', )
+"""Backends evicting values config.CACHE_STALE_TIME seconds after they expire."""
+
 
 class ICacheManager(Interface):
     """Utility that manages the cache for model objects."""
@@ -66,14 +79,17 @@ def handle_workflow_transition(event):
     manager.refresh(obj)
 
 
+SERIALIZERS = ('to_dict', 'to_listing_dict', 'to_summary_dict')
+"""Model methods whose results are cached and refreshed."""
+
+
 def refresher(obj, *args, **kwargs):
     """Refresh model object cache."""
     logger.info('Starting async refresh for model {name} : {uid}'.format(
         **kwargs
     ))
-    obj.to_dict()
-    obj.to_listing_dict()
-    obj.to_summary_dict()
+    for name in SERIALIZERS:
+        getattr(obj, name)()
     logger.info('Finishing async refresh for model {name} : {uid}'.format(
         **kwargs
     ))
@@ -89,12 +105,100 @@ class LoggingProxy(ProxyBackend):
         logger.debug('Finish setting cache key: %s' % key)
 
 
+def key_namespace(key: str) -> str:
+    """Return the namespace part of a key created by BaseCacheManager.key_generator.
+
+    Keys have the form ``{model}.{function}{namespace}-{id}``.
+    """
+    return str(key).split('-', 1)[0]
+
+
+class MetricsProxy(ProxyBackend):
+    """Proxy to record hit, miss, latency and payload size metrics of cache operations.
+
+    Metrics are recorded per key namespace (model and function name) as:
+
+        * cache.{namespace}.hit and cache.{namespace}.miss counters
+        * cache.{namespace}.get and cache.{namespace}.set timings, in milliseconds
+        * cache.{namespace}.size histogram with the pickled payload size, in bytes,
+          sampled: measuring it pickles the value a second time
+    """
+
+    size_sample_rate = 10
+    """Measure the size of one in this number of values set."""
+
+    def __init__(self, sink=None, size_sample_rate=None):
+        """Initialize the proxy.
+
+        :param sink: Metrics sink to use, defaults to the configured one.
+        :param size_sample_rate: Measure one in this number of values set,
+                                 defaults to the class attribute.
+        """
+        super().__init__()
+        self.sink = sink if sink else get_metrics_sink()
+        if size_sample_rate is not None:
+            self.size_sample_rate = size_sample_rate
+        self._sets = count()
+
+    def _record_get(self, key, value):
+        """Record a hit or a miss for the key."""
+        status = 'miss' if value is NO_VALUE else 'hit'
+        self.sink.incr(f'cache.{key_namespace(key)}.{status}')
+
+    def _record_size(self, key, value):
+        """Record the serialized size of a value, for one in size_sample_rate values."""
+        if next(self._sets) % self.size_sample_rate:
+            return
+        try:
+            size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            return
+        self.sink.histogram(f'cache.{key_namespace(key)}.size', size)
+
+    def get(self, key):
+        """Proxy to record metrics when getting a cache value."""
+        start = time.perf_counter()
+        value = self.proxied.get(key)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.sink.timing(f'cache.{key_namespace(key)}.get', elapsed)
+        self._record_get(key, value)
+        return value
+
+    def get_multi(self, keys):
+        """Proxy to record metrics when getting multiple cache values."""
+        start = time.perf_counter()
+        values = self.proxied.get_multi(keys)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.sink.timing('cache.get_multi', elapsed)
+        for key, value in zip(keys, values):
+            self._record_get(key, value)
+        return values
+
+    def set(self, key, value):
+        """Proxy to record metrics when setting a cache value."""
+        start = time.perf_counter()
+        self.proxied.set(key, value)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.sink.timing(f'cache.{key_namespace(key)}.set', elapsed)
+        self._record_size(key, value)
+
+    def set_multi(self, mapping):
+        """Proxy to record metrics when setting multiple cache values."""
+        start = time.perf_counter()
+        self.proxied.set_multi(mapping)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.sink.timing('cache.set_multi', elapsed)
+        for key, value in mapping.items():
+            self._record_size(key, value)
+
+
 @implementer(ICacheManager)
 class BaseCacheManager:
     """Base implementation of a cache manager Utility."""
 
     _backend = config.CACHE_BACKEND
     _config = None
+    _enable_metrics = False
     _enable_refresh = False
     _region = None
 
@@ -102,6 +206,7 @@ class BaseCacheManager:
         """Initialize the cache manager."""
         self._backend = backend
         self._enable_refresh = config.CACHE_ASYNC_REFRESH
+        self._enable_metrics = config.CACHE_METRICS
 
     def refresh(self, obj):
         """Invalidate and refresh a given model object."""
@@ -125,7 +230,13 @@ class BaseCacheManager:
         """Create a new region instance."""
         backend = self._backend
         config = self._config = BACKENDS_CONFIG.get(backend)
-        config['wrap'] = [LoggingProxy]
+        wrap = [LoggingProxy]
+        if self._enable_metrics:
+            sink = get_metrics_sink()
+            # only pay for the proxy when metrics are actually being recorded
+            if sink.enabled:
+                wrap.append(MetricsProxy(sink))
+        config['wrap'] = wrap
         region = make_region(
             function_key_generator=self.key_generator
         ).configure(
@@ -142,12 +253,20 @@ class BaseCacheManager:
         return self._region
 
     def key_generator(self, namespace, fn, **kw):
-        """Generate keys for all models objects."""
+        """Generate keys for all models objects.
+
+        When the function is called with ``excludes`` or ``includes`` arguments
+        their values are appended to the key, so each combination is cached apart.
+        """
         namespace = namespace or ''
         namespace = '{fname}{namespace}'.format(
             fname=fn.__name__,
             namespace=namespace,
         )
+        try:
+            signature = inspect.signature(fn)
+        except (TypeError, ValueError):
+            signature = None
 
         def generate_key(*args, **kwargs):
             """Create unique key for each model using UID."""
@@ -158,11 +277,143 @@ class BaseCacheManager:
                 namespace=namespace,
                 id=obj.id,
             )
+            if signature and (len(args) > 1 or kwargs):
+                key += _attributes_suffix(signature, args, kwargs)
             return key
 
         return generate_key
 
 
+def _attributes_suffix(signature: inspect.Signature, args: tuple, kwargs: dict) -> str:
+    """Return a key suffix with the excludes and includes arguments of a call."""
+    try:
+        arguments = signature.bind(*args, **kwargs).arguments
+    except TypeError:
+        return ''
+    suffix = ''
+    for name in ('excludes', 'includes'):
+        value = arguments.get(name)
+        if value:
+            value = [value] if isinstance(value, str) else value
+            suffix += ':{name}={value}'.format(name=name, value=','.join(sorted(value)))
+    return suffix
+
+
+_revalidating = set()
+_revalidating_lock = Lock()
+
+
+def _get_cached(region, key: str, max_age: float) -> t.Tuple[t.Any, float]:
+    """Return a value not older than max_age seconds, and its age, with a single get.
+
+    :returns: The value, or NO_VALUE if missing, expired or invalidated, and its age.
+    """
+    mangled = region.key_mangler(key) if region.key_mangler else key
+    # read the CachedValue from the backend, region.get drops its creation time
+    cached = region.backend.get(mangled)
+    if cached is NO_VALUE:
+        return NO_VALUE, 0
+    created = cached.metadata['ct']
+    age = time.time() - created
+    if age > max_age or region.region_invalidator.is_invalidated(created):
+        return NO_VALUE, 0
+    return cached.payload, age
+
+
+def _revalidate(region, key: str, creator: t.Callable):
+    """Refresh a stale cache value in a background thread.
+
+    Only one refresh per key runs at a time, further calls are ignored until it finishes.
+    """
+    with _revalidating_lock:
+        if key in _revalidating:
+            return
+        _revalidating.add(key)
+
+    def refresh():
+        """Compute and store the new value."""
+        try:
+            region.set(key, creator())
+        except Exception:
+            logger.exception(f'Failed to revalidate cache key: {key}')
+        finally:
+            with _revalidating_lock:
+                _revalidating.discard(key)
+
+    logger.debug(f'Revalidating stale cache key: {key}')
+    thread = Thread(target=refresh)
+    thread.start()
+
+
+def serialization_cache(
+        namespace: t.Optional[str]=None,
+        expiration_time: t.Optional[float]=None,
+        stale_time: float=0
+) -> t.Callable:
+    """Decorate a model serialization method to cache its result in the manager region.
+
+    Keys are created by :meth:`ICacheManager.key_generator`, so the cached values are
+    invalidated by :meth:`ICacheManager.refresh` and calls with different ``excludes``
+    and ``includes`` arguments are cached apart.
+
+    Concurrent misses for the same key are computed once: dogpile locks the key while
+    the value is created and other callers wait for it (or get the expired value, if any).
+
+    :param namespace: Optional namespace added to the key.
+    :param expiration_time: Seconds a value is considered fresh. Defaults to the region
+                            expiration time or config.CACHE_EXPIRATION_TIME.
+    :param stale_time: Seconds, after expiration, during which the stale value is still
+                       returned while a background thread computes a new one. Backends
+                       evicting expired values (redis) must keep them for as long: with
+                       redis, it cannot exceed config.CACHE_STALE_TIME.
+    :raises ValueError: When called, if stale_time exceeds what the backend keeps.
+    :rtype: decorated callable
+    """
+    def decorator(fn: t.Callable):
+        generators = {}
+
+        @wraps(fn)
+        def wrapper(obj, *args, **kwargs):
+            manager = getUtility(ICacheManager)
+            region = manager.region()
+            if stale_time > config.CACHE_STALE_TIME and manager._backend in REDIS_BACKENDS:
+                raise ValueError(
+                    f'stale_time of {fn.__qualname__} ({stale_time}s) is larger than '
+                    f'CACHE_STALE_TIME ({config.CACHE_STALE_TIME}s): redis evicts the '
+                    'stale values before'
+                )
+            generate_key = generators.get(manager)
+            if generate_key is None:
+                generate_key = generators[manager] = manager.key_generator(namespace, fn)
+            key = generate_key(obj, *args, **kwargs)
+            expiration = expiration_time
+            if expiration is None:
+                expiration = region.expiration_time or config.CACHE_EXPIRATION_TIME
+            expiration = float(expiration)
+
+            def creator():
+                """Call the decorated method."""
+                return fn(obj, *args, **kwargs)
+
+            value, age = _get_cached(region, key, expiration + stale_time)
+            if value is not NO_VALUE:
+                if age > expiration:
+                    _revalidate(region, key, creator)
+                return value
+            return region.get_or_create(key, creator, expiration_time=expiration)
+
+        def invalidate(obj, *args, **kwargs):
+            """Remove the cached value for the given call arguments."""
+            manager = getUtility(ICacheManager)
+            key = manager.key_generator(namespace, fn)(obj, *args, **kwargs)
+            manager.region().delete(key)
+
+        wrapper.original = fn
+        wrapper.invalidate = invalidate
+        return wrapper
+    return decorator
+
+
 def get_cache_manager():
     """Create a new CacheManager instance."""
     return BaseCacheManager()
@@ -0,0 +1,277 @@
+"""Warm up the cache region with serialized model objects.
+
+Run it after a deploy or a cache flush, so requests do not all hit cold keys::
+
+    briefy.cache_warmup briefy.leica.models:Order briefy.leica.models:Assignment \\
+        --state accepted --state scheduled --workers 8
+
+Objects are serialized with the same methods refreshed by
+:func:`briefy.common.cache.refresher` and keys are created by the cache manager
+key_generator, so the values are the ones cached by the services.
+"""
+from briefy.common.cache import get_cache_manager
+from briefy.common.cache import ICacheManager
+from briefy.common.cache import SERIALIZERS
+from briefy.common.config import DATABASE_URL
+from briefy.common.log import logger
+from briefy.common.utils.imports import resolve
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from zope.component import queryUtility
+
+import argparse
+import time
+import typing as t
+
+
+class Progress:
+    """Track and report the progress of a model warm up."""
+
+    def __init__(self, name: str, total: int, report_interval: float=5.0):
+        """Initialize the progress tracker.
+
+        :param name: Name of the model being warmed up.
+        :param total: Number of objects to be processed.
+        :param report_interval: Minimum seconds between two progress log entries.
+        """
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.keys = 0
+        self.report_interval = report_interval
+        self.start = self._last_report = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the warm up started."""
+        return time.monotonic() - self.start
+
+    @property
+    def rate(self) -> float:
+        """Objects processed per second."""
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed else 0.0
+
+    @property
+    def eta(self) -> t.Optional[float]:
+        """Estimated seconds to finish."""
+        rate = self.rate
+        return (self.total - self.done) / rate if rate else None
+
+    def update(self, objects: int, keys: int):
+        """Account for a processed batch and log the progress, if due."""
+        self.done += objects
+        self.keys += keys
+        now = time.monotonic()
+        if now - self._last_report >= self.report_interval or self.done >= self.total:
+            self._last_report = now
+            self.report()
+
+    def report(self):
+        """Log throughput and ETA."""
+        eta = self.eta
+        eta = f'{eta:.0f}s' if eta is not None else 'unknown'
+        logger.info(
+            f'Cache warm up {self.name}: {self.done}/{self.total} objects, '
+            f'{self.keys} keys, {self.rate:.1f} objects/s, ETA {eta}'
+        )
+
+    def summary(self) -> dict:
+        """Return the warm up statistics."""
+        return {
+            'total': self.total,
+            'done': self.done,
+            'keys': self.keys,
+            'elapsed': self.elapsed,
+            'rate': self.rate,
+        }
+
+
+def _original(method: t.Callable) -> t.Callable:
+    """Return the undecorated function of a cached method."""
+    return getattr(method, 'original', method)
+
+
+def serialize_objects(
+        manager: ICacheManager,
+        objs: t.Iterable,
+        serializers: t.Sequence[str]=SERIALIZERS,
+        namespace: t.Optional[str]=None
+) -> dict:
+    """Serialize objects and return a mapping of cache keys and values.
+
+    Cached methods are called through their original (undecorated) function,
+    so computing the values does not read nor write the cache.
+    """
+    mapping = {}
+    generators = {}
+    for obj in objs:
+        klass = obj.__class__
+        for name in serializers:
+            method = getattr(klass, name, None)
+            if method is None:
+                continue
+            fn = _original(method)
+            generate_key = generators.get((klass, name))
+            if generate_key is None:
+                generate_key = generators[(klass, name)] = manager.key_generator(namespace, fn)
+            mapping[generate_key(obj)] = fn(obj)
+    return mapping
+
+
+def stream_ids(
+        session,
+        model,
+        states: t.Sequence[str]=(),
+        batch_size: int=100
+) -> t.Iterator[t.List]:
+    """Stream ids of a model, in batches, without loading the objects.
+
+    :param session: SQLAlchemy session.
+    :param model: Model class.
+    :param states: Only return objects in one of these workflow states.
+    :param batch_size: Number of ids in each batch.
+    """
+    query = session.query(model.id)
+    if states:
+        query = query.filter(model.state.in_(states))
+    query = query.execution_options(stream_results=True).yield_per(batch_size)
+    batch = []
+    for row in query:
+        batch.append(row[0])
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def count_objects(session, model, states: t.Sequence[str]=()) -> int:
+    """Count objects of a model, optionally filtered by workflow state."""
+    query = session.query(model)
+    if states:
+        query = query.filter(model.state.in_(states))
+    return query.count()
+
+
+def warm_batch(
+        session_factory: t.Callable,
+        manager: ICacheManager,
+        model,
+        ids: t.Sequence,
+        serializers: t.Sequence[str]=SERIALIZERS,
+        namespace: t.Optional[str]=None
+) -> int:
+    """Load and serialize a batch of objects and set them in the region.
+
+    Runs in a worker thread, using its own session.
+
+    :returns: Number of keys set in the region.
+    """
+    session = session_factory()
+    try:
+        objs = session.query(model).filter(model.id.in_(ids)).all()
+        mapping = serialize_objects(manager, objs, serializers, namespace)
+    finally:
+        session.close()
+    if mapping:
+        manager.region().set_multi(mapping)
+    return len(mapping)
+
+
+def warm_up(
+        models: t.Sequence,
+        session_factory: t.Callable,
+        manager: t.Optional[ICacheManager]=None,
+        states: t.Sequence[str]=(),
+        workers: int=4,
+        batch_size: int=100,
+        serializers: t.Sequence[str]=SERIALIZERS,
+        namespace: t.Optional[str]=None
+) -> dict:
+    """Populate the cache region with serialized objects of the given models.
+
+    Ids are streamed from the database and dispatched, in batches, to a pool of
+    threads, each batch loaded in its own session and written with a single
+    ``set_multi`` call. At most two batches per thread are kept in flight.
+
+    :param models: Model classes to warm up.
+    :param session_factory: Callable returning a new SQLAlchemy session.
+    :param manager: Cache manager, defaults to the registered ICacheManager utility.
+    :param states: Only warm up objects in one of these workflow states.
+    :param workers: Number of worker threads.
+    :param batch_size: Number of objects per batch.
+    :param serializers: Names of the methods to be cached.
+    :param namespace: Namespace used by the cached methods.
+    :returns: Warm up statistics, by model name.
+    """
+    if manager is None:
+        manager = queryUtility(ICacheManager) or get_cache_manager()
+    result = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for model in models:
+            name = model.__name__
+            session = session_factory()
+            try:
+                progress = Progress(name, count_objects(session, model, states))
+                logger.info(f'Cache warm up {name}: {progress.total} objects')
+                pending = {}
+                for ids in stream_ids(session, model, states, batch_size):
+                    if len(pending) >= workers * 2:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        _collect(done, pending, progress)
+                    future = executor.submit(
+                        warm_batch, session_factory, manager, model, ids, serializers, namespace
+                    )
+                    pending[future] = len(ids)
+                _collect(wait(pending).done, pending, progress)
+            finally:
+                session.close()
+            progress.report()
+            result[name] = progress.summary()
+    return result
+
+
+def _collect(done: set, pending: dict, progress: Progress):
+    """Account for finished batches."""
+    for future in done:
+        objects = pending.pop(future)
+        try:
+            keys = future.result()
+        except Exception:
+            logger.exception(f'Cache warm up {progress.name}: failed to warm up a batch')
+            keys = 0
+        progress.update(objects, keys)
+
+
+def main(argv: t.Optional[t.Sequence[str]]=None):
+    """Warm up the cache from the command line."""
+    parser = argparse.ArgumentParser(description='Warm up the cache with serialized models.')
+    parser.add_argument('models', nargs='+', help='Models to warm up, as package.module:Model')
+    parser.add_argument(
+        '--database-url', default=DATABASE_URL, help='Database URL'
+    )
+    parser.add_argument(
+        '--state', action='append', default=[], help='Only objects in this state (repeatable)'
+    )
+    parser.add_argument('--workers', type=int, default=4, help='Number of worker threads')
+    parser.add_argument('--batch-size', type=int, default=100, help='Objects per batch')
+    parser.add_argument('--namespace', default=None, help='Namespace of the cached methods')
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+
+    engine = create_engine(args.database_url, pool_size=args.workers + 1)
+    session_factory = sessionmaker(bind=engine)
+    models = [resolve(model) for model in args.models]
+    warm_up(
+        models,
+        session_factory,
+        states=args.state,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        namespace=args.namespace,
+    )
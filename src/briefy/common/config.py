@@ -39,15 +39,52 @@ _queue_suffix = ENV_MAP.get(ENV, {}).get('suffix', 'dev')
 AWS_ACCESS_KEY = config('AWS_ACCESS_KEY', default='')
 AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY', default='')
 
+# Database used by the command line tools (cache warm up)
+DATABASE_URL = config('DATABASE_URL', default='')
+
 
 # SQS Integration
 SQS_REGION = config('SQS_REGION', default=_region)
 SQS_IP = config('SQS_IP', default='127.0.0.1')
 SQS_PORT = config('SQS_PORT', default='5000')
 
+# Queue backend: 'sqs' or 'local' (SQLite database, see briefy.common.queue.local)
+QUEUE_BACKEND = config('QUEUE_BACKEND', default='sqs')
+LOCAL_QUEUE_PATH = config('LOCAL_QUEUE_PATH', default='queues.sqlite')
+
+# Compress message bodies: '' (disabled), 'gzip' or 'zlib'
+QUEUE_BODY_CODEC = config('QUEUE_BODY_CODEC', default='')
+
+# Bodies of messages larger than this (in bytes, attributes included, 0 disables it) are
+# stored in a blob store: 'local' (directory in QUEUE_BLOB_PATH, only readable by consumers
+# on the same host) or 's3' (QUEUE_BLOB_BUCKET)
+QUEUE_OFFLOAD_THRESHOLD = config('QUEUE_OFFLOAD_THRESHOLD', int, default=0)
+QUEUE_BLOB_STORE = config('QUEUE_BLOB_STORE', default='local')
+QUEUE_BLOB_PATH = config('QUEUE_BLOB_PATH', default='queue-blobs')
+QUEUE_BLOB_BUCKET = config('QUEUE_BLOB_BUCKET', default='')
+
+# Queue workers: skip messages whose event id was already processed, remembering the
+# last WORKER_IDEMPOTENCY_SIZE ids locally and, with WORKER_IDEMPOTENCY_REDIS, sharing
+# them between workers in Redis (CACHE_HOST) for WORKER_IDEMPOTENCY_TTL seconds
+WORKER_IDEMPOTENCY_SIZE = config('WORKER_IDEMPOTENCY_SIZE', int, default=10000)
+WORKER_IDEMPOTENCY_REDIS = config('WORKER_IDEMPOTENCY_REDIS', casts.Boolean(), default=False)
+WORKER_IDEMPOTENCY_TTL = config('WORKER_IDEMPOTENCY_TTL', int, default=24 * 3600)
+
 # Queues
 EVENT_QUEUE = config('EVENT_QUEUE', default='event-{0}'.format(_queue_suffix))
 
+# Events: store events in the outbox table, published by the outbox relay worker
+EVENT_OUTBOX = config('EVENT_OUTBOX', casts.Boolean(), default=False)
+# Events: write events after the transaction commits, coalescing updates of the same object
+EVENT_DEFERRED = config('EVENT_DEFERRED', casts.Boolean(), default=False)
+EVENT_COALESCE = config('EVENT_COALESCE', casts.Boolean(), default=False)
+# Events: write events from a background thread, spilling to a journal file when behind
+EVENT_BACKGROUND = config('EVENT_BACKGROUND', casts.Boolean(), default=False)
+EVENT_JOURNAL_PATH = config('EVENT_JOURNAL_PATH', default='events.journal')
+# Events: send only changed attributes, and the full object every N versions
+EVENT_DELTA = config('EVENT_DELTA', casts.Boolean(), default=False)
+EVENT_SNAPSHOT_EVERY = config('EVENT_SNAPSHOT_EVERY', int, default=10)
+
 # Thumbor
 THUMBOR_PREFIX_SOURCE = config('THUMBOR_PREFIX_SOURCE', default='source/')
 THUMBOR_PREFIX_RESULT = config('THUMBOR_PREFIX_SOURCE', default='result/')
@@ -73,7 +110,17 @@ CACHE_REDIS_PORT = config('CACHE_REDIS_PORT', default='6379')
 CACHE_MEMCACHED_PORT = config('CACHE_MEMCACHED_PORT', default='11211')
 CACHE_BACKEND = config('CACHE_BACKEND', default='dogpile.cache.redis')
 CACHE_EXPIRATION_TIME = config('CACHE_EXPIRATION_TIME', default=3600)
+# Seconds values are kept by redis after CACHE_EXPIRATION_TIME, to be served stale
+# by serialization_cache (see its stale_time) while they are refreshed
+CACHE_STALE_TIME = config('CACHE_STALE_TIME', int, default=0)
 CACHE_ASYNC_REFRESH = config('CACHE_ASYNC_REFRESH', casts.Boolean(), default=False)
+CACHE_METRICS = config('CACHE_METRICS', casts.Boolean(), default=False)
+
+# Metrics: sink to be used (memory, logging or statsd). Empty disables metrics.
+METRICS_SINK = config('METRICS_SINK', default='')
+STATSD_HOST = config('STATSD_HOST', default='localhost')
+STATSD_PORT = config('STATSD_PORT', default='8125')
+STATSD_PREFIX = config('STATSD_PREFIX', default='briefy')
 
 # AuthService utility config
 API_USERNAME = config('API_USERNAME', default='app@briefy.co')
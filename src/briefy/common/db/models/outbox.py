@@ -0,0 +1,63 @@
+"""Outbox of events waiting to be published."""
+from briefy.common.db import datetime_utcnow
+from briefy.common.db.model import Base
+from briefy.common.db.types import AwareDateTime
+
+import sqlalchemy as sa
+
+
+class OutboxEvent(Base):
+    """An event stored in the transaction that generated it.
+
+    Events are published to the events queue, in created_at order, by
+    :class:`briefy.common.worker.outbox.OutboxRelayWorker`, which also purges
+    them once published.
+
+    The table is opt-in: this module is not imported by briefy.common.db.models,
+    services using the outbox import it so the table is part of their metadata
+    (and migrations).
+    """
+
+    __tablename__ = 'event_outbox'
+    __table_args__ = (
+        sa.Index('event_outbox_pending', 'published_at', 'created_at', 'id'),
+    )
+
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    """Position of the event in the outbox, breaks created_at ties."""
+
+    event_id = sa.Column(sa.String(36), nullable=False, index=True)
+    """ID of the event."""
+
+    event_name = sa.Column(sa.String(255), nullable=False)
+    """Name of the event."""
+
+    guid = sa.Column(sa.String(36), nullable=False)
+    """ID of the object of the event."""
+
+    created_at = sa.Column(AwareDateTime(), nullable=False, default=datetime_utcnow)
+    """Datetime of the event."""
+
+    body = sa.Column(sa.Text, nullable=False)
+    """Event payload, serialized as JSON."""
+
+    published_at = sa.Column(AwareDateTime(), nullable=True)
+    """Datetime the event was written to the queue. None while pending."""
+
+    message_id = sa.Column(sa.String(255), nullable=True)
+    """ID of the message in the queue."""
+
+    attempts = sa.Column(sa.Integer, nullable=False, default=0)
+    """Number of attempts to publish the event."""
+
+    def __repr__(self) -> str:
+        """Representation of an OutboxEvent."""
+        return (
+            """<{0}(id={1} event_name='{2}' guid='{3}' published_at='{4}')>""".format(
+                self.__class__.__name__,
+                self.id,
+                self.event_name,
+                self.guid,
+                self.published_at,
+            )
+        )
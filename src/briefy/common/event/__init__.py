@@ -1,9 +1,22 @@
 """Briefy base events."""
+from briefy.common.config import EVENT_BACKGROUND
+from briefy.common.config import EVENT_COALESCE
+from briefy.common.config import EVENT_DEFERRED
+from briefy.common.config import EVENT_DELTA
+from briefy.common.config import EVENT_OUTBOX
+from briefy.common.config import EVENT_SNAPSHOT_EVERY
 from briefy.common.db import datetime_utcnow
 from briefy.common.db.model import Base
+from briefy.common.event.buffer import get_buffer
+from briefy.common.event.delta import changed_attributes
+from briefy.common.event.delta import track_changes
+from briefy.common.event.publisher import get_publisher
 from briefy.common.queue import IQueue
 from briefy.common.queue.event import Queue
 from briefy.common.users import SystemUser
+from briefy.common.utils.transformers import json_dumps
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm import Session
 from uuid import uuid4
 from zope.component import getUtility
 from zope.interface import Interface
@@ -16,6 +29,12 @@ logger = logging.getLogger(__name__)
 
 Attributes = t.Optional[t.List[str]]
 
+DELTA_KEY = '_changed'
+"""Key, in the data of delta payloads, listing the changed attributes."""
+
+if EVENT_DELTA:
+    track_changes(Session)
+
 
 class IEvent(Interface):
     """Interface for Events on Briefy."""
@@ -33,6 +52,19 @@ class Event:
     """A base event class used by all Briefy related events.
 
     Any event subclassing this one will write to an AWS SQS queue.
+
+    With 'outbox' enabled, events having a database session (see
+    :class:`BaseEvent`) are added to the outbox table instead, in the same
+    transaction as the object: they are published only if the transaction
+    commits, by :class:`briefy.common.worker.outbox.OutboxRelayWorker`.
+
+    With 'deferred' enabled, they are kept in the session instead, and
+    written to the queue in batches after commit (see
+    :mod:`briefy.common.event.buffer`); 'coalesce' then writes only the
+    latest event with the same name for each object.
+
+    With 'background' enabled, other events are written to the queue by a
+    background thread (see :mod:`briefy.common.event.publisher`).
     """
 
     event_name = ''
@@ -59,6 +91,18 @@ class Event:
     logger = logger
     data = None
 
+    outbox = EVENT_OUTBOX
+    """Add the event to the outbox table instead of writing it to the queue."""
+
+    deferred = EVENT_DEFERRED
+    """Write the event to the queue after the transaction commits."""
+
+    coalesce = EVENT_COALESCE
+    """When deferred, write only the latest event with this name for the object."""
+
+    background = EVENT_BACKGROUND
+    """Write the event to the queue from a background thread."""
+
     def __init__(self, guid: str, data: dict, actor: str, request_id: str):
         """Initialize the event.
 
@@ -79,13 +123,82 @@ class Event:
         """Return the events queue."""
         return getUtility(IQueue, 'events.queue')
 
+    @property
+    def session(self) -> t.Optional[Session]:
+        """Return the database session used by the outbox and deferred events, if any."""
+        return None
+
+    def add_to_outbox(self, session: Session, payload: dict) -> str:
+        """Add the event to the outbox table, to be published after commit.
+
+        :param session: Database session of the transaction generating the event
+        :param payload: Event payload
+        :returns: ID of the event
+        """
+        # the outbox table is opt-in: only registered in the metadata when used
+        from briefy.common.db.models.outbox import OutboxEvent
+        session.add(OutboxEvent(
+            event_id=self.id,
+            event_name=payload['event_name'],
+            guid=str(payload['guid']),
+            created_at=payload['created_at'],
+            body=json_dumps(payload),
+        ))
+        return self.id
+
+    def defer(self, session: Session, payload: dict) -> str:
+        """Add the event to the buffer of the session, to be written after commit.
+
+        :param session: Database session of the transaction generating the event
+        :param payload: Event payload
+        :returns: ID of the event
+        """
+        get_buffer(session, coalesce=self.coalesce).add(self.queue, payload)
+        return self.id
+
+    def dispatch(self, payload: dict) -> str:
+        """Write the payload to the events queue, directly or through the outbox or a buffer.
+
+        Errors are logged, not raised.
+
+        :param payload: Event payload
+        :returns: Id from message in the queue, or the event id if it is not written yet
+        """
+        logger = self.logger
+        session = self.session if self.outbox or self.deferred else None
+        message_id = ''
+        try:
+            if session is not None and self.outbox:
+                message_id = self.add_to_outbox(session, payload)
+            elif session is not None:
+                message_id = self.defer(session, payload)
+            elif self.background:
+                get_publisher().publish(self.queue, payload)
+                message_id = self.id
+            else:
+                # the payload is built here, with the types expected by the queue schema
+                message_id = self.queue.write_message(payload, trusted=True)
+        except Exception as exc:
+            logger.error(
+                f'Event {self.event_name} not fired. Exception: {exc}',
+                extra={'payload': payload}
+            )
+        else:
+            if message_id:
+                logger.debug(f'Event {self.event_name} fired with message {message_id}')
+            else:
+                logger.error(
+                    f'Event {self.event_name} not fired. Rejected by the queue',
+                    extra={'payload': payload}
+                )
+
+        return message_id
+
     def __call__(self) -> str:
         """Notify about the event.
 
         :returns: Id from message in the queue
         """
-        logger = self.logger
-        queue = self.queue
         payload = {
             'event_name': self.event_name,
             'actor': self.actor,
@@ -95,27 +208,36 @@ class Event:
             'request_id': self.request_id,
             'data': self.data,
         }
-        message_id = ''
-        try:
-            message_id = queue.write_message(payload)
-        except Exception as exc:
-            logger.error(
-                f'Event {self.event_name} not fired. Exception: {exc}',
-                extra={'payload': payload}
-            )
-        else:
-            logger.debug(f'Event {self.event_name} fired with message {message_id}')
-
-        return message_id
+        return self.dispatch(payload)
 
 
 class BaseEvent(Event):
     """A base event class used by all Briefy related events.
 
     Any event subclassing this one will write to an AWS SQS queue.
+
+    The object is serialized, by 'to_dict', the first time 'data' is read.
+    With 'delta' enabled, only the attributes changed in the transaction are
+    serialized (see 'delta_dict').
     """
 
     obj = None
+    _data = None
+
+    delta = EVENT_DELTA
+    """Send only the identifiers and the attributes changed in the transaction."""
+
+    snapshot_every = EVENT_SNAPSHOT_EVERY
+    """With 'delta', send the full object when its version is a multiple of this."""
+
+    delta_identifiers = ('id', )
+    """Attributes always included in delta payloads."""
+
+    def __init_subclass__(cls, **kwargs):
+        """Track the changes of all sessions for events with 'delta' enabled."""
+        super().__init_subclass__(**kwargs)
+        if cls.delta:
+            track_changes(Session)
 
     def __init__(self, obj: Base, actor: str='', request_id: str=''):
         """Initialize the event.
@@ -128,8 +250,64 @@ class BaseEvent(Event):
             raise ValueError('Attempt to create event without a timestamp. Has it been persisted?')
         guid = getattr(obj, 'id')
         self.obj = obj
-        data = self.to_dict()
-        super().__init__(guid, data=data, actor=actor, request_id=request_id)
+        super().__init__(guid, data=None, actor=actor, request_id=request_id)
+
+    @property
+    def data(self) -> dict:
+        """Return the serialized object, computed on first access."""
+        data = self._data
+        if data is None:
+            data = self.delta_dict() if self.delta else None
+            if data is None:
+                data = self.to_dict()
+            self._data = data
+        return data
+
+    @data.setter
+    def data(self, value: t.Optional[dict]):
+        """Set the serialized object. None serializes it again on next access."""
+        self._data = value
+
+    @property
+    def session(self) -> t.Optional[Session]:
+        """Return the database session of the object."""
+        obj = self.obj
+        return None if isinstance(obj, dict) else object_session(obj)
+
+    def delta_dict(self) -> t.Optional[dict]:
+        """Return a serializable dictionary with the changed attributes of the object.
+
+        The changed attributes are listed under DELTA_KEY. Changes flushed
+        before the event are only known for sessions tracked by
+        :func:`briefy.common.event.delta.track_changes`, done for all sessions
+        when EVENT_DELTA is set or an event class enables 'delta'.
+
+        :returns: Dictionary with the identifiers and the changed attributes, or None
+                  when the full object must be sent: new objects, objects not
+                  attached to a session and versions multiple of 'snapshot_every'.
+        """
+        obj = self.obj
+        if not isinstance(obj, Base):
+            return None
+        changed = changed_attributes(obj)
+        if changed is None:
+            return None
+        # VersionMixin
+        version = getattr(obj, 'version', None)
+        snapshot_every = self.snapshot_every
+        if isinstance(version, int) and snapshot_every and version % snapshot_every == 0:
+            return None
+        klass = obj.__class__
+        excluded = set(obj._exclude_attributes())
+        keys = set()
+        for key in changed:
+            # private columns, i.e. _title, are exposed by a property
+            name = key[1:] if key.startswith('_') else key
+            if name not in excluded and hasattr(klass, name):
+                keys.add(name)
+        data = obj._get_data(sorted(keys.union(self.delta_identifiers)))
+        data[DELTA_KEY] = sorted(keys)
+        return data
 
     def to_dict(self, excludes: Attributes=None, includes: Attributes=None) -> dict:
         """Return a serializable dictionary from the object that generated this event.
@@ -0,0 +1,128 @@
+"""Defer events until the database transaction commits.
+
+Events fired while a transaction is open are collected in an
+:class:`EventBuffer`, stored in the session, and written to their queues
+after commit, using batch requests. A rollback discards them.
+"""
+from collections import OrderedDict
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+
+import logging
+import typing as t
+
+
+logger = logging.getLogger(__name__)
+
+BUFFER_KEY = 'briefy.event_buffer'
+"""Key of the buffer in Session.info."""
+
+
+class EventBuffer:
+    """Collect event payloads and write them to their queues in batches.
+
+    With 'coalesce', payloads of the same event name and guid replace the
+    previous ones: only the latest is written, at the position of the last
+    occurrence. Different event names, i.e. two transitions of the same
+    object, are always kept.
+    """
+
+    def __init__(self, coalesce: bool=False, logger_=None):
+        """Initialize the buffer.
+
+        :param coalesce: Keep only the latest payload for each event name and guid
+        :param logger_: The logger instance to use or None
+        """
+        self.coalesce = coalesce
+        self.logger = logger_ if logger_ else logger
+        self._entries = OrderedDict()
+        self._position = 0
+
+    def __len__(self) -> int:
+        """Number of payloads waiting to be written."""
+        return len(self._entries)
+
+    def add(self, queue, payload: dict):
+        """Add a payload to be written to a queue.
+
+        :param queue: Queue the payload is written to
+        :param payload: Event payload, with the types expected by the queue schema
+        """
+        entries = self._entries
+        if self.coalesce:
+            key = (queue.name, payload['event_name'], str(payload['guid']))
+            entries.pop(key, None)
+        else:
+            key = self._position
+            self._position += 1
+        entries[key] = (queue, payload)
+
+    def clear(self):
+        """Discard all payloads."""
+        self._entries.clear()
+
+    def flush(self) -> t.List[str]:
+        """Write the payloads, one batch request for every 10 payloads of a queue.
+
+        Errors are logged, not raised.
+
+        :returns: List of message ids, empty for payloads that were not written
+        """
+        entries = list(self._entries.values())
+        self.clear()
+        by_queue = OrderedDict()
+        for queue, payload in entries:
+            by_queue.setdefault(id(queue), (queue, []))[1].append(payload)
+        message_ids = []
+        for queue, payloads in by_queue.values():
+            try:
+                # payloads are built by events, with the types expected by the queue schema
+                ids = queue.write_messages(payloads, trusted=True)
+            except Exception as exc:
+                ids = [''] * len(payloads)
+                self.logger.error(
+                    f'{len(payloads)} events not fired. Exception: {exc}',
+                    extra={'event_names': [payload['event_name'] for payload in payloads]}
+                )
+            else:
+                # entries SQS kept failing have an empty id
+                failed = [payload for payload, id_ in zip(payloads, ids) if not id_]
+                if failed:
+                    self.logger.error(
+                        f'{len(failed)} events not fired. Rejected by the queue',
+                        extra={'event_names': [payload['event_name'] for payload in failed]}
+                    )
+            message_ids.extend(ids)
+        return message_ids
+
+
+def _after_commit(session: Session):
+    """Write the events of the transaction."""
+    buffer = session.info.get(BUFFER_KEY)
+    if buffer:
+        buffer.flush()
+
+
+def _after_rollback(session: Session):
+    """Discard the events of the transaction."""
+    buffer = session.info.get(BUFFER_KEY)
+    if buffer:
+        buffer.clear()
+
+
+def get_buffer(session: Session, coalesce: bool=False) -> EventBuffer:
+    """Return the event buffer of a session, creating it on first use.
+
+    The buffer is flushed after each commit of the session and cleared on
+    rollback.
+
+    :param session: A SQLAlchemy session
+    :param coalesce: Coalesce payloads, used when the buffer is created
+    :returns: The buffer of the session
+    """
+    buffer = session.info.get(BUFFER_KEY)
+    if buffer is None:
+        buffer = session.info[BUFFER_KEY] = EventBuffer(coalesce=coalesce)
+        sa_event.listen(session, 'after_commit', _after_commit)
+        sa_event.listen(session, 'after_rollback', _after_rollback)
+    return buffer
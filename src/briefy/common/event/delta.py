@@ -0,0 +1,80 @@
+"""Track the attributes changed on objects, for delta event payloads.
+
+SQLAlchemy resets the attribute history on flush, and events are usually
+fired after the object is flushed: :func:`track_changes` records, after each
+flush, the column attributes changed and the objects inserted, until the
+transaction ends.
+"""
+from sqlalchemy import event as sa_event
+from sqlalchemy import inspect
+
+import typing as t
+
+
+CHANGES_KEY = 'briefy.changed_attributes'
+"""Key of the recorded changes in Session.info."""
+
+NEW = None
+"""Marker of objects inserted in the transaction."""
+
+TRACKED_KEY = '_briefy_track_changes'
+"""Attribute set on the targets of track_changes."""
+
+
+def _after_flush(session, flush_context):
+    """Record inserted objects and changed column attributes."""
+    # keyed by InstanceState: ids of garbage collected objects are reused
+    changes = session.info.setdefault(CHANGES_KEY, {})
+    for obj in session.new:
+        changes[inspect(obj)] = NEW
+    for obj in session.dirty:
+        state = inspect(obj)
+        current = changes.get(state, set())
+        if current is NEW:
+            continue
+        for attr in state.mapper.column_attrs:
+            if state.attrs[attr.key].history.has_changes():
+                current.add(attr.key)
+        changes[state] = current
+
+
+def _clear(session, *args):
+    """Forget the changes of the transaction."""
+    session.info.pop(CHANGES_KEY, None)
+
+
+def track_changes(target):
+    """Record changed attributes on flush, for sessions created by target.
+
+    Calling it again for the same target, or for a Session subclass of a
+    tracked class, does nothing.
+
+    :param target: A Session, a sessionmaker or the Session class
+    """
+    if getattr(target, TRACKED_KEY, False):
+        return
+    sa_event.listen(target, 'after_flush', _after_flush)
+    sa_event.listen(target, 'after_commit', _clear)
+    sa_event.listen(target, 'after_soft_rollback', _clear)
+    setattr(target, TRACKED_KEY, True)
+
+
+def changed_attributes(obj) -> t.Optional[t.Set[str]]:
+    """Return the column attributes of an object changed in the current transaction.
+
+    Both flushed changes, if tracked, and pending ones are included.
+
+    :param obj: A SQLAlchemy object
+    :returns: Set of attribute keys, None if the object is new or not persistent
+    """
+    state = inspect(obj)
+    if state.session is None or not state.persistent:
+        return None
+    changes = state.session.info.get(CHANGES_KEY, {}).get(state, set())
+    if changes is NEW:
+        return None
+    changed = set(changes)
+    for attr in state.mapper.column_attrs:
+        if state.attrs[attr.key].history.has_changes():
+            changed.add(attr.key)
+    return changed
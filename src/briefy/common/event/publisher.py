@@ -0,0 +1,345 @@
+"""Publish events from a background thread.
+
+Events are put in a bounded in-memory buffer and written to their queues by
+a daemon thread, in batches, so requests do not wait for SQS. When the
+buffer is full, or a batch still fails after all retries, events are
+appended to a journal file and written again once the buffer is drained.
+Invalid events, and journaled events whose queue was not used by this
+process, are moved to a dead letter file, next to the journal.
+
+The journal can be shared by several processes: appending to it and
+replaying it are guarded by file locks.
+"""
+from briefy.common.config import EVENT_JOURNAL_PATH
+from briefy.common.queue.message import get_schema
+from briefy.common.utils.metrics import get_metrics_sink
+from briefy.common.utils.transformers import json_dumps
+from collections import OrderedDict
+from contextlib import contextmanager
+from queue import Empty
+from queue import Full
+from queue import Queue
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import typing as t
+
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _file_lock(path: str, blocking: bool=True) -> t.Iterator[bool]:
+    """Hold an exclusive lock, shared between processes, on path.
+
+    :param path: Lock file, created if missing
+    :param blocking: Wait for the lock, instead of giving up if it is held
+    :returns: Whether the lock is held
+    """
+    with open(path, 'a') as fh:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(fh, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+class BackgroundPublisher:
+    """Write event payloads to their queues from a background thread.
+
+    Metrics, sent to the metrics sink:
+
+    - events.publisher.sent, failed and spilled: number of events written,
+      moved to the dead letter file and appended to the journal (including
+      the ones the queue kept failing);
+    - events.publisher.lag: time, in ms, between publishing the oldest event
+      of a batch and writing it to the queue;
+    - events.publisher.buffer: number of events in the buffer.
+    """
+
+    max_size = 10000
+    """Maximum number of events in the buffer."""
+
+    batch_size = 100
+    """Maximum number of events taken from the buffer at once (sent in SQS batches of 10)."""
+
+    linger = 0.05
+    """Seconds the thread waits for new events before checking the journal."""
+
+    retries = 5
+    """Number of times a batch is retried before being appended to the journal."""
+
+    retry_delay = 0.1
+    """Seconds to wait before the first retry, doubled on each new attempt."""
+
+    max_retry_delay = 10
+    """Ceiling for the delay between retries, also the delay before replaying a failed journal."""
+
+    def __init__(
+            self,
+            max_size: t.Optional[int]=None,
+            journal_path: t.Optional[str]=None,
+            metrics=None,
+            logger_=None
+    ):
+        """Initialize the publisher. The thread starts with the first event.
+
+        :param max_size: Maximum number of events in the buffer
+        :param journal_path: Path of the journal file, defaults to EVENT_JOURNAL_PATH
+        :param metrics: Metrics sink, defaults to the configured one
+        :param logger_: The logger instance to use or None
+        """
+        if max_size is not None:
+            self.max_size = max_size
+        self.journal_path = journal_path if journal_path else EVENT_JOURNAL_PATH
+        self.dead_letter_path = self.journal_path + '.dead'
+        self.metrics = metrics if metrics is not None else get_metrics_sink()
+        self.logger = logger_ if logger_ else logger
+        self.lag = 0.0
+        self._buffer = Queue(self.max_size)
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._replay_at = 0
+
+    def _metric(self, kind: str, key: str, value: float):
+        """Send a metric, named events.publisher.<key>."""
+        metrics = self.metrics
+        if metrics.enabled:
+            getattr(metrics, kind)('events.publisher.{0}'.format(key), value)
+
+    def _start(self):
+        """Start the background thread, if not running."""
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                self._stopping.clear()
+                thread = self._thread = threading.Thread(
+                    target=self._run, name='briefy-event-publisher', daemon=True
+                )
+                thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Number of events in the buffer."""
+        return self._buffer.qsize()
+
+    def publish(self, queue, payload: dict) -> bool:
+        """Add an event payload to the buffer, or to the journal if the buffer is full.
+
+        :param queue: Queue the payload is written to
+        :param payload: Event payload, with the types expected by the queue schema
+        :returns: Whether the payload was added to the buffer
+        """
+        self._queues[queue.name] = queue
+        self._start()
+        try:
+            self._buffer.put_nowait((queue.name, payload, time.monotonic()))
+        except Full:
+            self._spill([(queue.name, payload, time.monotonic())])
+            return False
+        return True
+
+    def _run(self):
+        """Send events from the buffer until stopped and drained."""
+        buffer = self._buffer
+        while True:
+            try:
+                item = buffer.get(timeout=self.linger)
+            except Empty:
+                if self._stopping.is_set():
+                    return
+                try:
+                    self._replay()
+                except Exception:
+                    self.logger.exception('Failed to replay the events journal')
+                continue
+            items = [item]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(buffer.get_nowait())
+                except Empty:
+                    break
+            try:
+                self._metric('gauge', 'buffer', buffer.qsize())
+                self._send(items)
+            except Exception:
+                self.logger.exception(f'Failed to publish {len(items)} events')
+
+    def _send(self, items: t.List[tuple]):
+        """Write items to their queues, appending the ones that keep failing to the journal."""
+        by_queue = OrderedDict()
+        for item in items:
+            by_queue.setdefault(item[0], []).append(item)
+        for name, group in by_queue.items():
+            queue = self._queues.get(name)
+            if queue is None:
+                self._spill(group)
+                continue
+            payloads = [payload for _, payload, _ in group]
+            message_ids = self._write(queue, payloads)
+            if message_ids is None:
+                self._spill(group)
+                continue
+            invalid = [item for item, id_ in zip(group, message_ids) if id_ is None]
+            rejected = [item for item, id_ in zip(group, message_ids) if id_ == '']
+            sent = len(group) - len(invalid) - len(rejected)
+            self.lag = time.monotonic() - group[0][2]
+            self._metric('timing', 'lag', self.lag * 1000)
+            self._metric('incr', 'sent', sent)
+            if invalid:
+                self._dead_letter(invalid)
+            if rejected:
+                # entries the queue kept failing
+                self._spill(rejected)
+
+    def _write(self, queue, payloads: t.List[dict]) -> t.Optional[t.List[t.Optional[str]]]:
+        """Write payloads, retrying with backoff.
+
+        :returns: The message id of each payload, empty if the queue kept failing it and
+                  None if it is not valid. None if all attempts failed.
+        """
+        attempt = 0
+        while True:
+            try:
+                # payloads are built by events, with the types expected by the queue schema
+                return queue.write_messages(payloads, trusted=True)
+            except ValueError as exc:
+                # invalid payloads are not retried: find them, writing the others
+                if len(payloads) == 1:
+                    self.logger.error(f'Invalid event not published. Exception: {exc}')
+                    return [None]
+                message_ids = []
+                for payload in payloads:
+                    ids = self._write(queue, [payload])
+                    message_ids.append(ids[0] if ids is not None else '')
+                return message_ids
+            except Exception as exc:
+                if attempt >= self.retries:
+                    self.logger.error(
+                        f'{len(payloads)} events not published after {attempt} retries. '
+                        f'Exception: {exc}'
+                    )
+                    return None
+            time.sleep(min(self.retry_delay * 2 ** attempt, self.max_retry_delay))
+            attempt += 1
+
+    def _append(self, path: str, lines: t.List[str]):
+        """Append lines to the journal or the dead letter file."""
+        with self._journal_lock, _file_lock(self.journal_path + '.lock'):
+            with open(path, 'a') as fh:
+                fh.writelines(lines)
+
+    @staticmethod
+    def _lines(items: t.List[tuple]) -> t.List[str]:
+        """Serialize items as journal lines."""
+        return [
+            json_dumps({'queue': name, 'payload': payload}) + '\n' for name, payload, _ in items
+        ]
+
+    def _spill(self, items: t.List[tuple]):
+        """Append items to the journal."""
+        self._append(self.journal_path, self._lines(items))
+        self._replay_at = time.monotonic() + self.max_retry_delay
+        self._metric('incr', 'spilled', len(items))
+
+    def _dead_letter(self, items: t.List[tuple]):
+        """Append invalid items to the dead letter file."""
+        self._append(self.dead_letter_path, self._lines(items))
+        self._metric('incr', 'failed', len(items))
+
+    def _replay(self):
+        """Write the events of the journal, once the buffer is drained.
+
+        Only one process replays the journal at a time.
+        """
+        if time.monotonic() < self._replay_at:
+            return
+        replay_path = self.journal_path + '.replay'
+        with _file_lock(replay_path + '.lock', blocking=False) as locked:
+            if locked:
+                self._replay_journal(replay_path)
+
+    def _replay_journal(self, replay_path: str):
+        """Write the events of the journal, moved to replay_path to be read."""
+        path = self.journal_path
+        with self._journal_lock, _file_lock(path + '.lock'):
+            if not os.path.exists(replay_path):
+                if not os.path.exists(path):
+                    return
+                os.rename(path, replay_path)
+        with open(replay_path) as fh:
+            lines = fh.readlines()
+        items = []
+        dead = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                queue = self._queues.get(entry['queue'])
+                if queue is None:
+                    self.logger.error(
+                        f'Unknown queue {entry["queue"]} in the journal, event moved to '
+                        f'{self.dead_letter_path}'
+                    )
+                    dead.append(line)
+                    continue
+                payload = get_schema(queue.schema).deserialize(entry['payload'])
+            except Exception as exc:
+                self.logger.error(
+                    f'Invalid event in the journal, moved to {self.dead_letter_path}: {exc}',
+                    extra={'line': line}
+                )
+                dead.append(line)
+                continue
+            items.append((entry['queue'], payload, time.monotonic()))
+        for start in range(0, len(items), self.batch_size):
+            self._send(items[start:start + self.batch_size])
+        if dead:
+            self._append(self.dead_letter_path, dead)
+        # removed once all events were sent or journaled again: a crash sends them twice
+        os.remove(replay_path)
+
+    def stop(self, timeout: t.Optional[float]=None):
+        """Send the buffered events and stop the thread.
+
+        Events still in the buffer after timeout seconds are appended to the journal.
+        """
+        thread = self._thread
+        self._stopping.set()
+        if thread is not None:
+            thread.join(timeout)
+        items = []
+        while True:
+            try:
+                items.append(self._buffer.get_nowait())
+            except Empty:
+                break
+        if items:
+            self._spill(items)
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher() -> BackgroundPublisher:
+    """Return the shared publisher, stopped when the process exits."""
+    global _publisher
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                _publisher = BackgroundPublisher()
+                atexit.register(_publisher.stop, 30)
+    return _publisher
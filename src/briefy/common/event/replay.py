@@ -0,0 +1,329 @@
+"""Replay events, for load testing or to recover from a consumer failure.
+
+Events are read, oldest first, from a dump directory (written by Queue when
+MOCK_SQS is on, as ``dump/<event_name>/<guid>.json``) or from the outbox
+table, and written to a queue or passed directly to a consumer::
+
+    briefy.event_replay --dump dump --queue briefy.common.queue.event:Queue \\
+        --rate 500 --workers 4
+
+    briefy.event_replay --database-url postgresql://... --since 2017-03-01T00:00:00+00:00 \\
+        --consumer briefy.leica.worker:handle_event
+
+Batches are dispatched to a pool of threads: with more than one worker,
+events of different batches can be delivered out of order.
+
+Replayed events keep their id, so queue workers skip the ones they already
+processed (see briefy.common.worker.idempotency): use ``--new-ids`` to
+process them again.
+"""
+from briefy.common.log import logger
+from briefy.common.queue import IQueue
+from briefy.common.queue.event import Schema
+from briefy.common.queue.message import get_schema
+from briefy.common.utils.imports import resolve
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from uuid import uuid4
+
+import argparse
+import colander
+import json
+import os
+import time
+import typing as t
+
+
+_created_at = colander.SchemaNode(colander.DateTime())
+
+
+class ReplayMessage:
+    """A replayed event, with the body attribute of a queue message."""
+
+    def __init__(self, body: dict):
+        """Initialize the message."""
+        self.body = body
+
+
+def _in_range(
+        created_at: datetime,
+        since: t.Optional[datetime]=None,
+        until: t.Optional[datetime]=None
+) -> bool:
+    """Whether created_at is in the [since, until) interval."""
+    return (since is None or created_at >= since) and (until is None or created_at < until)
+
+
+def read_dump(
+        path: str,
+        event_names: t.Sequence[str]=(),
+        since: t.Optional[datetime]=None,
+        until: t.Optional[datetime]=None
+) -> t.Iterator[dict]:
+    """Read the events of a dump directory, in created_at order.
+
+    Files are read twice: only their creation dates and paths are kept in
+    memory to sort them. Files that are not valid events are logged and skipped.
+
+    :param path: Dump directory, with a sub directory per event name.
+    :param event_names: Only read these events.
+    :param since: Only read events created at or after this date.
+    :param until: Only read events created before this date.
+    """
+    entries = []
+    for event_name in sorted(os.listdir(path)):
+        directory = os.path.join(path, event_name)
+        if not os.path.isdir(directory) or (event_names and event_name not in event_names):
+            continue
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json'):
+                continue
+            filepath = os.path.join(directory, filename)
+            try:
+                with open(filepath) as fh:
+                    created_at = _created_at.deserialize(json.load(fh)['created_at'])
+            except (ValueError, KeyError, TypeError, colander.Invalid) as exc:
+                logger.error(f'Skipping invalid dump file {filepath}: {exc!r}')
+                continue
+            if _in_range(created_at, since, until):
+                entries.append((created_at, filepath))
+    entries.sort()
+    for _, filepath in entries:
+        with open(filepath) as fh:
+            yield json.load(fh)
+
+
+def read_outbox(
+        session,
+        event_names: t.Sequence[str]=(),
+        since: t.Optional[datetime]=None,
+        until: t.Optional[datetime]=None,
+        batch_size: int=1000
+) -> t.Iterator[dict]:
+    """Stream the events of the outbox table, published or not, in created_at order.
+
+    :param session: SQLAlchemy session.
+    :param event_names: Only read these events.
+    :param since: Only read events created at or after this date.
+    :param until: Only read events created before this date.
+    :param batch_size: Number of rows fetched at once.
+    """
+    from briefy.common.db.models.outbox import OutboxEvent
+    query = session.query(OutboxEvent.body)
+    if event_names:
+        query = query.filter(OutboxEvent.event_name.in_(event_names))
+    if since is not None:
+        query = query.filter(OutboxEvent.created_at >= since)
+    if until is not None:
+        query = query.filter(OutboxEvent.created_at < until)
+    query = query.order_by(OutboxEvent.created_at, OutboxEvent.id)
+    query = query.execution_options(stream_results=True).yield_per(batch_size)
+    for row in query:
+        yield json.loads(row[0])
+
+
+class RateLimiter:
+    """Pace events to a maximum rate, without bursts above it."""
+
+    def __init__(self, rate: float=0):
+        """Initialize the limiter.
+
+        :param rate: Maximum events per second, 0 disables the limit.
+        """
+        self.rate = rate
+        self.count = 0
+        self.start = None
+
+    def wait(self, count: int=1):
+        """Sleep until count more events can be sent."""
+        if not self.rate:
+            return
+        now = time.monotonic()
+        if self.start is None:
+            self.start = now
+        delay = self.start + self.count / self.rate - now
+        if delay > 0:
+            time.sleep(delay)
+        self.count += count
+
+
+class Replayer:
+    """Write events to a queue, or pass them to a consumer, in parallel batches.
+
+    Events are validated with the schema of the queue, or with the events
+    schema for consumers, which are called, like QueueWorker.process_message,
+    with a message whose body is the event and return whether it was
+    processed. Targets with a 'write_messages' method are queues.
+    """
+
+    batch_size = 10
+    """Events per batch: queues send them in a single request."""
+
+    report_interval = 5.0
+    """Minimum seconds between two progress log entries."""
+
+    def __init__(
+            self,
+            target: t.Union[IQueue, t.Callable],
+            rate: float=0,
+            workers: int=1,
+            batch_size: t.Optional[int]=None,
+            new_ids: bool=False,
+            is_queue: t.Optional[bool]=None
+    ):
+        """Initialize the replayer.
+
+        :param target: Queue, or callable receiving a ReplayMessage.
+        :param rate: Maximum events per second, 0 disables the limit.
+        :param workers: Number of threads processing batches.
+        :param batch_size: Events per batch, defaults to the class attribute.
+        :param new_ids: Give each event a new id, so idempotent workers process it again.
+        :param is_queue: Whether target is a queue, defaults to whether it has 'write_messages'.
+        """
+        self.target = target
+        if is_queue is None:
+            is_queue = hasattr(target, 'write_messages')
+        self.is_queue = is_queue
+        self.schema = get_schema(target.schema if self.is_queue else Schema)
+        self.limiter = RateLimiter(rate)
+        self.workers = workers
+        if batch_size is not None:
+            self.batch_size = batch_size
+        self.new_ids = new_ids
+        self.stats = {'sent': 0, 'failed': 0}
+
+    def _load(self, payload: dict) -> t.Optional[dict]:
+        """Deserialize and validate an event, None if it is not valid."""
+        if self.new_ids:
+            payload = dict(payload, id=str(uuid4()))
+        try:
+            return self.schema.deserialize(payload)
+        except colander.Invalid as exc:
+            logger.error(f'Invalid event {payload.get("event_name")}: {exc}')
+
+    def replay_batch(self, payloads: t.Sequence[dict]) -> int:
+        """Write or consume a batch of events. Runs in a worker thread.
+
+        :returns: Number of events sent or processed.
+        """
+        bodies = [self._load(payload) for payload in payloads]
+        bodies = [body for body in bodies if body is not None]
+        if self.is_queue:
+            # bodies were validated by the schema above
+            message_ids = self.target.write_messages(bodies, trusted=True) if bodies else []
+            return len([message_id for message_id in message_ids if message_id])
+        sent = 0
+        for body in bodies:
+            try:
+                status = self.target(ReplayMessage(body))
+            except Exception:
+                logger.exception(f'Error replaying event {body["event_name"]}')
+                status = False
+            sent += bool(status)
+        return sent
+
+    def _batches(self, payloads: t.Iterable[dict]) -> t.Iterator[t.List[dict]]:
+        """Split events in batches."""
+        batch = []
+        for payload in payloads:
+            batch.append(payload)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _collect(self, done: set, pending: dict):
+        """Account for finished batches."""
+        for future in done:
+            count = pending.pop(future)
+            try:
+                sent = future.result()
+            except Exception:
+                logger.exception('Failed to replay a batch of events')
+                sent = 0
+            self.stats['sent'] += sent
+            self.stats['failed'] += count - sent
+
+    def report(self, elapsed: float):
+        """Log the replay throughput."""
+        stats = self.stats
+        rate = stats['sent'] / elapsed if elapsed else 0.0
+        logger.info(
+            f'Event replay: {stats["sent"]} events sent, {stats["failed"]} failed, '
+            f'{rate:.1f} events/s'
+        )
+
+    def __call__(self, payloads: t.Iterable[dict]) -> dict:
+        """Replay events, at most two batches per thread being in flight.
+
+        :param payloads: Events, as read by read_dump or read_outbox.
+        :returns: Replay statistics.
+        """
+        start = last_report = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {}
+            for batch in self._batches(payloads):
+                if len(pending) >= self.workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    self._collect(done, pending)
+                self.limiter.wait(len(batch))
+                pending[executor.submit(self.replay_batch, batch)] = len(batch)
+                now = time.monotonic()
+                if now - last_report >= self.report_interval:
+                    last_report = now
+                    self.report(now - start)
+            self._collect(wait(pending).done, pending)
+        elapsed = time.monotonic() - start
+        self.report(elapsed)
+        return dict(self.stats, elapsed=elapsed)
+
+
+def main(argv: t.Optional[t.Sequence[str]]=None) -> dict:
+    """Replay events from the command line."""
+    parser = argparse.ArgumentParser(description='Replay events to a queue or a consumer.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--dump', help='Dump directory to read events from')
+    source.add_argument('--database-url', help='Database URL to read the outbox from')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--queue', help='Queue class, as package.module:Queue')
+    target.add_argument(
+        '--consumer', help='Callable receiving messages, as package.module:callable'
+    )
+    parser.add_argument(
+        '--event-name', action='append', default=[], help='Only replay this event (repeatable)'
+    )
+    parser.add_argument('--since', default=None, help='Only events created at or after this date')
+    parser.add_argument('--until', default=None, help='Only events created before this date')
+    parser.add_argument('--rate', type=float, default=0, help='Maximum events per second')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker threads')
+    parser.add_argument('--batch-size', type=int, default=None, help='Events per batch')
+    parser.add_argument(
+        '--new-ids', action='store_true', help='Give events new ids, for idempotent workers'
+    )
+    args = parser.parse_args(argv)
+    try:
+        since = _created_at.deserialize(args.since) if args.since else None
+        until = _created_at.deserialize(args.until) if args.until else None
+    except colander.Invalid as exc:
+        parser.error(f'Invalid date: {exc}')
+
+    replayer = Replayer(
+        resolve(args.queue)() if args.queue else resolve(args.consumer),
+        rate=args.rate,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        new_ids=args.new_ids,
+        is_queue=bool(args.queue),
+    )
+    if args.dump:
+        return replayer(read_dump(args.dump, args.event_name, since, until))
+    session = sessionmaker(bind=create_engine(args.database_url))()
+    try:
+        return replayer(read_outbox(session, args.event_name, since, until))
+    finally:
+        session.close()
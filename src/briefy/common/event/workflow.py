@@ -1,11 +1,16 @@
 """Briefy workflow events."""
 from briefy import common  # noQA
+from briefy.common.event import Attributes
 from briefy.common.event import BaseEvent
 from briefy.common.event import IDataEvent
 from briefy.common.event import logger
 from zope.interface import implementer
 
 
+HISTORY_KEY = 'state_history'
+"""Attribute with the workflow history, included in the event data."""
+
+
 class IWorkflowTransitionEvent(IDataEvent):
     """IDataEvent interface for a workflow transition in a workflow."""
 
@@ -15,10 +20,16 @@ class WorkflowTransitionEvent(BaseEvent):
     """Base class for workflow transition events.
 
     This event will write to the events queue on AWS SQS.
+
+    Its data includes the state history of the object, and can be shared
+    with other events of the same transition, see 'share_data'.
     """
 
     logger = logger
 
+    delta = False
+    """Transition events always carry the full object."""
+
     @property
     def event_name(self) -> str:
         """Automatic generate event name from model class name and transaction name.
@@ -49,31 +60,63 @@ class WorkflowTransitionEvent(BaseEvent):
         kwargs = {'actor': user_id, 'request_id': None}
         super().__init__(obj, **kwargs)
 
+    def to_dict(self, excludes: Attributes=None, includes: Attributes=None) -> dict:
+        """Return a serializable dictionary from the object, with its state history.
+
+        :param excludes: attributes to exclude from dict representation.
+        :param includes: attributes to include from dict representation.
+        :returns: Dictionary with fields and values used by this Class
+        """
+        includes = list(includes) if includes else []
+        includes.append(HISTORY_KEY)
+        return super().to_dict(excludes=excludes, includes=includes)
+
+    def share_data(self, event: BaseEvent):
+        """Reuse the serialized object of this event in another event of the same object.
+
+        Only events using the default serialization share it, without the
+        state history if they would not include it: as in WorkflowMixin.to_dict,
+        including the history only adds it to the serialized object. The
+        event gets its own copy of the top level keys and of the history.
+
+        Call it once the subscribers of both events ran, as they can change
+        the object or clear its cached serialization.
+
+        :param event: Event fired for the same object, not serialized yet
+        """
+        obj = self.obj
+        shareable = (
+            isinstance(event, BaseEvent) and
+            event.obj is obj and
+            event._data is None and
+            not event.delta and
+            type(event).to_dict is BaseEvent.to_dict
+        )
+        if not shareable:
+            return
+        data = self.data
+        defaults = obj.__to_dict_additional_attributes__ + obj.__listing_attributes__
+        if HISTORY_KEY in defaults:
+            data = dict(data)
+            if data.get(HISTORY_KEY) is not None:
+                data[HISTORY_KEY] = [dict(entry) for entry in data[HISTORY_KEY]]
+        else:
+            data = {key: value for key, value in data.items() if key != HISTORY_KEY}
+        event.data = data
+
     def __call__(self) -> str:
         """Notify about the event.
 
         :returns: Id from message in the queue
         """
-        obj = self.obj
-        logger = self.logger
-        queue = self.queue
         payload = {
             'event_name': self.event_name,
             'actor': self.actor,
+            'id': self.id,
             'guid': self.guid,
             'created_at': self.created_at,
             'request_id': self.request_id,
-            'data': obj.to_dict(includes=['state_history']),
+            'data': self.data,
             'transition': self.transition.name,
         }
-        message_id = ''
-        try:
-            message_id = queue.write_message(payload)
-        except Exception as exc:
-            logger.error(
-                f'Event {self.event_name} not fired. Exception: {exc}',
-                extra={'payload': payload})
-        else:
-            logger.debug(f'Event {self.event_name} fired with message {message_id}')
-
-        return message_id
+        return self.dispatch(payload)
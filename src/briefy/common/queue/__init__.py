@@ -1,9 +1,18 @@
 """Briefy Queue."""
 from botocore.exceptions import ClientError
+from briefy.common.config import LOCAL_QUEUE_PATH
 from briefy.common.config import MOCK_SQS
+from briefy.common.config import QUEUE_BACKEND
+from briefy.common.config import QUEUE_BODY_CODEC
+from briefy.common.config import QUEUE_OFFLOAD_THRESHOLD
 from briefy.common.config import SQS_IP
 from briefy.common.config import SQS_PORT
 from briefy.common.config import SQS_REGION
+from briefy.common.queue.blob import get_blob_store
+from briefy.common.queue.blob import offload
+from briefy.common.queue.codec import encode
+from briefy.common.queue.codec import ENCODING_ATTRIBUTE
+from briefy.common.queue.local import LocalSQSQueue
 from briefy.common.queue.message import SQSMessage
 from briefy.common.utils.transformers import json_dumps
 from datetime import datetime
@@ -14,13 +23,24 @@ import boto3
 import botocore
 import logging
 import os
+import time
 
 
 logger = logging.getLogger(__name__)
 
+SQS_BATCH_SIZE = 10
+"""Maximum number of entries in a SQS batch request."""
+
+SQS_MAX_BATCH_BYTES = 256 * 1024
+"""Maximum size, in bytes, of all messages in a SQS batch request."""
+
 
 def mock_sqs():
-    """Use Mocked SQS."""
+    """Use Mocked SQS.
+
+    Points all botocore endpoints to a SQS emulator in SQS_IP:SQS_PORT.
+    Prefer QUEUE_BACKEND=local, that does not need an emulator nor patching.
+    """
     host = SQS_IP
     port = SQS_PORT
     queue_url = 'http://{host}:{port}'.format(host=host, port=port)
@@ -47,6 +67,21 @@ class IQueue(Interface):
     region_name = Attribute("""SQS Region name.""")
     origin = Attribute("""Package name.""")
 
+    def get_messages(num_messages=1, wait_time=None):
+        """Return up to num_messages, waiting up to wait_time seconds for them."""
+
+    def delete_messages(messages):
+        """Delete received messages, returning the ones that could not be deleted."""
+
+    def change_visibility(messages, timeout):
+        """Hide received messages for timeout more seconds, returning the ones not changed."""
+
+    def write_message(body=None, trusted=False):
+        """Write a message to the queue, returning its id."""
+
+    def write_messages(messages=(), trusted=False):
+        """Write messages to the queue, returning their ids."""
+
 
 class Queue:
     """A Queue that manage messages from a SQS Queue."""
@@ -57,13 +92,38 @@ class Queue:
     _queue = None
     _schema = None
     _message_klass = SQSMessage
+    backend = QUEUE_BACKEND
+    """Queue backend: 'sqs' or 'local', see briefy.common.queue.local."""
+
+    local_path = LOCAL_QUEUE_PATH
+    """SQLite database used by the 'local' backend."""
+
+    send_retries = 3
+    """Number of times entries failed by SQS in a batch send are retried."""
+
+    retry_delay = 0.1
+    """Seconds to wait before the first retry, doubled on each new attempt."""
+
+    body_codec = QUEUE_BODY_CODEC
+    """Codec compressing message bodies, see briefy.common.queue.codec. Empty disables it."""
+
+    codec_min_size = 1024
+    """Bodies smaller than this, in bytes, are not compressed."""
+
+    offload_threshold = QUEUE_OFFLOAD_THRESHOLD
+    """Messages larger than this, in bytes, have their body stored in the blob store.
+
+    0 disables it. Consumers must be able to read the same blob store.
+    """
+
+    _blob_store = None
 
     def __init__(self, origin='briefy.common', logger_=None):
         """Initialize a Queue object."""
         self.logger = logger_ if logger_ else logger
         self.origin = origin
         name = self.name
-        if MOCK_SQS:
+        if MOCK_SQS and self.backend == 'sqs':
             sqs = boto3.resource('sqs', region_name=self.region_name)
             sqs.create_queue(QueueName=self.name)
         if not name:
@@ -84,6 +144,9 @@ class Queue:
         queue = self._queue
         if not queue:
             name = self.name
+            if self.backend == 'local':
+                queue = self._queue = LocalSQSQueue(name, self.local_path)
+                return queue
             region_name = self.region_name
             try:
                 sqs = boto3.resource('sqs', region_name=region_name)
@@ -107,33 +170,59 @@ class Queue:
         schema = self._schema
         return schema
 
-    def _create_sqs_message(self, message=None, body=None):
+    @property
+    def blob_store(self):
+        """Return the store of offloaded bodies, see briefy.common.queue.blob."""
+        store = self._blob_store
+        if store is None:
+            store = self._blob_store = get_blob_store()
+        return store
+
+    @blob_store.setter
+    def blob_store(self, value):
+        """Set the store of offloaded bodies."""
+        self._blob_store = value
+
+    def _create_sqs_message(self, message=None, body=None, trusted=False):
         """Create a new SQSMessage."""
         klass = self._message_klass
-        return klass(self.schema, message, body)
+        kwargs = {'trusted': trusted}
+        if self._blob_store is not None:
+            kwargs['blob_store'] = self._blob_store
+        return klass(self.schema, message, body, **kwargs)
 
-    def get_raw_messages(self, num_messages=1):
+    def get_raw_messages(self, num_messages=1, wait_time=None):
         """Return messages from the queue.
 
-        :param num_messages: Number of messages to be returned
+        :param num_messages: Number of messages to be returned (SQS caps it at 10)
         :type num_messages: int
+        :param wait_time: Seconds to wait for messages to arrive (long polling, up to 20)
+        :type wait_time: int
         :returns: List of messages
         :rtype: list
         """
         queue = self.queue
-        messages = queue.receive_messages(MaxNumberOfMessages=num_messages)
+        params = {
+            'MaxNumberOfMessages': min(num_messages, SQS_BATCH_SIZE),
+            'MessageAttributeNames': [ENCODING_ATTRIBUTE],
+        }
+        if wait_time:
+            params['WaitTimeSeconds'] = wait_time
+        messages = queue.receive_messages(**params)
         return messages
 
-    def get_messages(self, num_messages=1):
+    def get_messages(self, num_messages=1, wait_time=None):
         """Return validated messages from the queue.
 
-        :param num_messages: Number of messages to be returned
+        :param num_messages: Number of messages to be returned (SQS caps it at 10)
         :type num_messages: int
+        :param wait_time: Seconds to wait for messages to arrive (long polling, up to 20)
+        :type wait_time: int
         :returns: List of SQSMessages
         :rtype: list
         """
         messages = []
-        raw_messages = self.get_raw_messages(num_messages)
+        raw_messages = self.get_raw_messages(num_messages, wait_time)
         for message in raw_messages:
             try:
                 new_message = self._create_sqs_message(message=message)
@@ -143,48 +232,234 @@ class Queue:
                 messages.append(new_message)
         return messages
 
-    def write_messages(self, messages=()):
+    def delete_messages(self, messages):
+        """Delete messages from the queue, using batch requests of up to 10 messages.
+
+        :param messages: List of SQSMessages received from this queue
+        :type messages: list
+        :returns: List of SQSMessages that could not be deleted
+        :rtype: list
+        """
+        queue = self.queue
+        not_deleted = []
+        for start in range(0, len(messages), SQS_BATCH_SIZE):
+            batch = messages[start:start + SQS_BATCH_SIZE]
+            entries = [
+                {'Id': str(position), 'ReceiptHandle': message.message.receipt_handle}
+                for position, message in enumerate(batch)
+            ]
+            response = queue.delete_messages(Entries=entries)
+            failed = {item['Id']: item for item in response.get('Failed', [])}
+            for position, message in enumerate(batch):
+                item = failed.get(str(position))
+                if item:
+                    self.logger.error(
+                        'Failed to delete message from queue {0}: {1} {2}'.format(
+                            self.name, item.get('Code'), item.get('Message')
+                        )
+                    )
+                    not_deleted.append(message)
+                else:
+                    # same as SQSMessage.delete
+                    message._message = None
+                    message.delete_blob()
+        return not_deleted
+
+    def change_visibility(self, messages, timeout):
+        """Change the visibility timeout of messages, using batch requests of up to 10 messages.
+
+        :param messages: List of SQSMessages received from this queue
+        :type messages: list
+        :param timeout: New visibility timeout, in seconds, counted from now
+        :type timeout: int
+        :returns: List of SQSMessages that could not be changed
+        :rtype: list
+        """
+        queue = self.queue
+        not_changed = []
+        for start in range(0, len(messages), SQS_BATCH_SIZE):
+            batch = messages[start:start + SQS_BATCH_SIZE]
+            entries = [
+                {
+                    'Id': str(position),
+                    'ReceiptHandle': message.message.receipt_handle,
+                    'VisibilityTimeout': int(timeout),
+                }
+                for position, message in enumerate(batch)
+            ]
+            response = queue.change_message_visibility_batch(Entries=entries)
+            failed = {item['Id'] for item in response.get('Failed', [])}
+            not_changed.extend(
+                message for position, message in enumerate(batch) if str(position) in failed
+            )
+        return not_changed
+
+    def write_messages(self, messages=(), trusted=False):
         """Write messages to the queue.
 
+        Messages are sent using SQS batch requests, up to 10 messages per request.
+
         :param messages: List of messages to be added to queue
         :type messages: list
+        :param trusted: Messages were built by a trusted producer, validate them in a single pass
+        :type trusted: bool
+        :returns: List with the id of each message in the queue, in the same order.
+                  Messages SQS failed to receive have an empty id.
+        :rtype: list
         """
         if not isinstance(messages, list):
             raise ValueError
-        for message in messages:
-            self.write_message(message)
+        sqs_messages = []
+        for body in messages:
+            try:
+                sqs_messages.append(self._create_sqs_message(body=body, trusted=trusted))
+            except ValueError as e:
+                logger.exception('{0}'.format(str(e)))
+                raise e
+        return self._send_messages(sqs_messages)
+
+    @staticmethod
+    def _entry_size(entry):
+        """Compute the size, as accounted by SQS, of a send payload.
+
+        :param entry: A dict with parameters to the send_message method.
+        :type entry: dict
+        :rtype: int
+        """
+        size = len(entry['MessageBody'].encode('utf-8'))
+        for name, attribute in entry.get('MessageAttributes', {}).items():
+            size += len(name.encode('utf-8')) + len(attribute['DataType'].encode('utf-8'))
+            size += len(attribute.get('StringValue', '').encode('utf-8'))
+            size += len(attribute.get('BinaryValue', b''))
+        return size
+
+    def _batches(self, entries):
+        """Split send payloads in batches respecting SQS count and size limits.
+
+        :param entries: List of dicts with parameters to the send_message method
+        :type entries: list
+        :returns: Generator of lists of entries
+        """
+        batch = []
+        batch_size = 0
+        for entry in entries:
+            size = self._entry_size(entry)
+            if batch and (len(batch) >= SQS_BATCH_SIZE or batch_size + size > SQS_MAX_BATCH_BYTES):
+                yield batch
+                batch = []
+                batch_size = 0
+            batch.append(entry)
+            batch_size += size
+        if batch:
+            yield batch
+
+    def _send_messages(self, messages):
+        """Send SQSMessages to the queue using batch requests.
+
+        :param messages: List of SQSMessages
+        :type messages: list
+        :returns: List of message ids, in the same order of the messages
+        :rtype: list
+        """
+        entries = []
+        for position, message in enumerate(messages):
+            if MOCK_SQS and self.backend == 'sqs':
+                self._dump_message(message)
+            entry = self._prepare_sqs_payload(message)
+            entry['Id'] = str(position)
+            entries.append(entry)
+        message_ids = [''] * len(entries)
+        for batch in self._batches(entries):
+            self._send_batch(batch, message_ids)
+        return message_ids
+
+    def _send_batch(self, entries, message_ids):
+        """Send one batch of entries, retrying only the entries that failed.
+
+        Entries failed because of the sender (i.e. invalid payload) are not retried.
+
+        :param entries: List of dicts with parameters to the send_message method
+        :type entries: list
+        :param message_ids: List where the id of each sent message is stored
+        :type message_ids: list
+        """
+        queue = self.queue
+        attempt = 0
+        while entries:
+            response = queue.send_messages(Entries=entries)
+            for item in response.get('Successful', []):
+                message_ids[int(item['Id'])] = item['MessageId'].strip()
+            failed = response.get('Failed', [])
+            retry = []
+            for item in failed:
+                if item.get('SenderFault') or attempt >= self.send_retries:
+                    self.logger.error(
+                        'Failed to send message to queue {0}: {1} {2}'.format(
+                            self.name, item.get('Code'), item.get('Message')
+                        ),
+                        extra={'entry_id': item['Id']}
+                    )
+                else:
+                    retry.append(item['Id'])
+            if not retry:
+                break
+            by_id = {entry['Id']: entry for entry in entries}
+            entries = [by_id[entry_id] for entry_id in retry]
+            time.sleep(self.retry_delay * 2 ** attempt)
+            attempt += 1
 
     def _prepare_sqs_payload(self, message):
         """Prepare a SQS send payload.
 
+        Bodies are compressed with 'body_codec', and the ones of messages,
+        attributes included, still larger than 'offload_threshold' are stored
+        in the blob store.
+
         :param message: A message wrapper representing the message to be added to the queue
         :type message: `briefy.common.queue.message.Message`
         :returns: A dict with all parameters to the send_message method.
         :rtype: dict
         """
+        body = json_body = json_dumps(message.body)
+        attributes = {
+            'Origin': {'StringValue': self.origin, 'DataType': 'String'},
+            'Author': {'StringValue': self.__class__.__name__, 'DataType': 'String'},
+            'CreationDate': {'StringValue': str(datetime.now()), 'DataType': 'String'}
+        }
+        codec = self.body_codec
+        if codec and len(json_body) >= self.codec_min_size:
+            body = encode(codec, json_body)
+            attributes[ENCODING_ATTRIBUTE] = {'StringValue': codec, 'DataType': 'String'}
+        threshold = self.offload_threshold
+        if threshold:
+            # SQS limits the size of the body and the attributes
+            entry = {'MessageBody': '', 'MessageAttributes': attributes}
+            limit = threshold - self._entry_size(entry)
+            # a character takes at most 4 bytes: skip encoding small bodies
+            if len(body) > limit // 4 and len(body.encode('utf-8')) > limit:
+                body = offload(self.blob_store, self.name, json_body)
+                attributes.pop(ENCODING_ATTRIBUTE, None)
         payload = {
-            'MessageBody': json_dumps(message.body),
-            'MessageAttributes': {
-                'Origin': {'StringValue': self.origin, 'DataType': 'String'},
-                'Author': {'StringValue': self.__class__.__name__, 'DataType': 'String'},
-                'CreationDate': {'StringValue': str(datetime.now()), 'DataType': 'String'}
-            }
+            'MessageBody': body,
+            'MessageAttributes': attributes,
         }
         return payload
 
-    def write_message(self, body=None):
+    def write_message(self, body=None, trusted=False):
         """Write a message to the queue.
 
         :param body: A dictionary representing the message to be added to the queue
         :type body: dict
+        :param trusted: The body was built by a trusted producer, validate it in a single pass
+        :type trusted: bool
         """
         queue = self.queue
         try:
-            message = self._create_sqs_message(body=body)
+            message = self._create_sqs_message(body=body, trusted=trusted)
         except ValueError as e:
             logger.exception('{0}'.format(str(e)))
             raise e
-        if MOCK_SQS:
+        if MOCK_SQS and self.backend == 'sqs':
             self._dump_message(message)
         payload = self._prepare_sqs_payload(message)
         response = queue.send_message(**payload)
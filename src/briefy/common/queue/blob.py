@@ -0,0 +1,162 @@
+"""Blob stores for message payloads too large for SQS (claim-check).
+
+Queue stores, compressed, the bodies above its 'offload_threshold' in a
+blob store and sends a message referencing them instead, see CLAIM_CHECK_KEY;
+SQSMessage loads the body back when the message is received.
+"""
+from briefy.common.config import QUEUE_BLOB_BUCKET
+from briefy.common.config import QUEUE_BLOB_PATH
+from briefy.common.config import QUEUE_BLOB_STORE
+from briefy.common.config import SQS_REGION
+from uuid import uuid4
+from zope.interface import implementer
+from zope.interface import Interface
+
+import boto3
+import gzip
+import json
+import os
+import tempfile
+import threading
+
+
+CLAIM_CHECK_KEY = '_claim_check'
+"""Only key in the body of messages whose payload is in the blob store."""
+
+
+class IBlobStore(Interface):
+    """Interface for a blob store."""
+
+    def put(key, data):
+        """Store data, bytes, under key."""
+
+    def get(key):
+        """Return the data stored under key. Raise KeyError if not found."""
+
+    def delete(key):
+        """Remove the data stored under key, if any."""
+
+
+@implementer(IBlobStore)
+class LocalBlobStore:
+    """Blob store using a local directory, a stand-in for S3."""
+
+    def __init__(self, path: str):
+        """Initialize the store.
+
+        :param path: Directory where blobs are stored, created if needed
+        """
+        self.path = path
+
+    def _path(self, key: str) -> str:
+        """Return the path of the file of a key."""
+        return os.path.join(self.path, *key.split('/'))
+
+    def put(self, key: str, data: bytes):
+        """Store data under key, atomically."""
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.rename(tmp_path, path)
+
+    def get(self, key: str) -> bytes:
+        """Return the data stored under key."""
+        try:
+            with open(self._path(key), 'rb') as fh:
+                return fh.read()
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def delete(self, key: str):
+        """Remove the data stored under key."""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+@implementer(IBlobStore)
+class S3BlobStore:
+    """Blob store using a S3 bucket."""
+
+    def __init__(self, bucket: str, prefix: str='', region_name: str=SQS_REGION):
+        """Initialize the store.
+
+        :param bucket: Name of the S3 bucket
+        :param prefix: Prefix of the keys in the bucket
+        :param region_name: AWS region of the bucket
+        """
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client('s3', region_name=region_name)
+
+    def put(self, key: str, data: bytes):
+        """Store data under key."""
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data)
+
+    def get(self, key: str) -> bytes:
+        """Return the data stored under key."""
+        client = self.client
+        try:
+            response = client.get_object(Bucket=self.bucket, Key=self.prefix + key)
+        except client.exceptions.NoSuchKey:
+            raise KeyError(key)
+        return response['Body'].read()
+
+    def delete(self, key: str):
+        """Remove the data stored under key."""
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> IBlobStore:
+    """Return the configured blob store (QUEUE_BLOB_STORE), shared by all queues."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if QUEUE_BLOB_STORE == 's3':
+                    _store = S3BlobStore(QUEUE_BLOB_BUCKET)
+                elif QUEUE_BLOB_STORE == 'local':
+                    _store = LocalBlobStore(QUEUE_BLOB_PATH)
+                else:
+                    raise ValueError(f'Unknown blob store: {QUEUE_BLOB_STORE}')
+    return _store
+
+
+def offload(store: IBlobStore, prefix: str, body: str) -> str:
+    """Store a compressed message body, returning the body referencing it.
+
+    :param store: Blob store
+    :param prefix: Prefix of the key, i.e. the queue name
+    :param body: Message body, serialized as JSON
+    :returns: Message body to be sent instead
+    """
+    key = '{0}/{1}.json.gz'.format(prefix, uuid4())
+    store.put(key, gzip.compress(body.encode('utf-8')))
+    return json.dumps({CLAIM_CHECK_KEY: key})
+
+
+def claim_check_key(body) -> str:
+    """Return the key of an offloaded body, or an empty string."""
+    if isinstance(body, dict) and len(body) == 1:
+        key = body.get(CLAIM_CHECK_KEY)
+        if isinstance(key, str):
+            return key
+    return ''
+
+
+def rehydrate(store: IBlobStore, key: str):
+    """Load an offloaded body.
+
+    :param store: Blob store
+    :param key: Key of the body, see claim_check_key
+    :returns: Message body, deserialized from JSON
+    """
+    return json.loads(gzip.decompress(store.get(key)).decode('utf-8'))
@@ -0,0 +1,48 @@
+"""Codecs compressing message bodies.
+
+SQS bodies are text: compressed bodies are base64 encoded, and the codec
+used is sent in the ENCODING_ATTRIBUTE message attribute.
+"""
+import base64
+import gzip
+import zlib
+
+
+ENCODING_ATTRIBUTE = 'ContentEncoding'
+"""Message attribute naming the codec of the body."""
+
+CODECS = {
+    'gzip': (gzip.compress, gzip.decompress),
+    'zlib': (zlib.compress, zlib.decompress),
+}
+"""Compress and decompress functions of each codec."""
+
+
+def _functions(codec: str):
+    """Return the functions of a codec."""
+    try:
+        return CODECS[codec]
+    except KeyError:
+        raise ValueError(f'Unknown message codec: {codec}')
+
+
+def encode(codec: str, body: str) -> str:
+    """Compress a message body.
+
+    :param codec: Name of the codec, a key of CODECS
+    :param body: Message body
+    :returns: Compressed body, base64 encoded
+    """
+    compress, _ = _functions(codec)
+    return base64.b64encode(compress(body.encode('utf-8'))).decode('ascii')
+
+
+def decode(codec: str, data: str) -> str:
+    """Decompress a message body.
+
+    :param codec: Name of the codec, a key of CODECS
+    :param data: Compressed body, base64 encoded
+    :returns: Message body
+    """
+    _, decompress = _functions(codec)
+    return decompress(base64.b64decode(data)).decode('utf-8')
@@ -21,6 +21,12 @@ class Schema(colander.MappingSchema):
     data = colander.SchemaNode(Dictionary())
     event_name = colander.SchemaNode(colander.String(), validator=validators.EventName)
     guid = colander.SchemaNode(colander.String(), validator=colander.uuid)
+    id = colander.SchemaNode(
+        colander.String(),
+        missing=colander.drop,
+        default=colander.drop,
+        validator=colander.uuid
+    )
     request_id = colander.SchemaNode(
         colander.String(),
         missing='',
@@ -0,0 +1,294 @@
+"""Local, SQLite backed, stand-in for SQS queues.
+
+Used by :class:`briefy.common.queue.Queue` when its backend is 'local'
+(``QUEUE_BACKEND=local``): it implements the subset of the boto3 SQS Queue
+resource used by Queue, so workers and producers run unchanged, without AWS,
+and several processes can share the same database file.
+
+Messages are rows in a single table, received in insertion order. Receiving
+a message hides it for the visibility timeout, as SQS does, and deleting it
+requires the receipt handle of the last receive.
+"""
+from contextlib import contextmanager
+from uuid import uuid4
+
+import json
+import sqlite3
+import threading
+import time
+import typing as t
+
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        queue TEXT NOT NULL,
+        message_id TEXT NOT NULL,
+        body TEXT NOT NULL,
+        message_attributes TEXT NOT NULL,
+        group_id TEXT,
+        sent_at REAL NOT NULL,
+        visible_at REAL NOT NULL,
+        receive_count INTEGER NOT NULL DEFAULT 0,
+        receipt_handle TEXT
+    )""",
+    'CREATE INDEX IF NOT EXISTS messages_visible ON messages (queue, visible_at, id)',
+    'CREATE INDEX IF NOT EXISTS messages_receipt ON messages (receipt_handle)',
+)
+
+
+class LocalMessage:
+    """A received message, with the attributes of a boto3 SQS Message."""
+
+    def __init__(self, queue: 'LocalSQSQueue', row: sqlite3.Row):
+        """Initialize the message from a database row."""
+        self._queue = queue
+        self.message_id = row['message_id']
+        self.receipt_handle = row['receipt_handle']
+        self.body = row['body']
+        self.message_attributes = json.loads(row['message_attributes']) or None
+        self.attributes = {
+            'ApproximateReceiveCount': str(row['receive_count']),
+            'SentTimestamp': str(int(row['sent_at'] * 1000)),
+        }
+        if row['group_id']:
+            self.attributes['MessageGroupId'] = row['group_id']
+
+    def delete(self) -> dict:
+        """Delete this message from the queue."""
+        response = self._queue.delete_messages(
+            Entries=[{'Id': '0', 'ReceiptHandle': self.receipt_handle}]
+        )
+        if response['Failed']:
+            raise ValueError(response['Failed'][0]['Message'])
+        return {}
+
+    def change_visibility(self, VisibilityTimeout: int) -> dict:
+        """Change the visibility timeout of this message."""
+        self._queue.change_message_visibility_batch(Entries=[{
+            'Id': '0', 'ReceiptHandle': self.receipt_handle, 'VisibilityTimeout': VisibilityTimeout
+        }])
+        return {}
+
+
+class LocalSQSQueue:
+    """SQLite backed queue, with the API of a boto3 SQS Queue resource."""
+
+    poll_interval = 0.05
+    """Seconds between two checks for new messages while long polling."""
+
+    def __init__(self, name: str, path: str, visibility_timeout: int=30):
+        """Initialize the queue, creating the database if needed.
+
+        :param name: Queue name, several queues can share a database.
+        :param path: Path of the SQLite database file, or ':memory:'.
+        :param visibility_timeout: Default visibility timeout, in seconds.
+        """
+        self.name = name
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self._local = threading.local()
+        self._memory = self._memory_lock = None
+        if path == ':memory:':
+            # a single connection, shared by all threads, keeps the data
+            self._memory = self._connect()
+            self._memory_lock = threading.RLock()
+        with self._transaction() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    @property
+    def url(self) -> str:
+        """Return an URL identifying this queue."""
+        return 'sqlite://{0}#{1}'.format(self.path, self.name)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new connection to the database."""
+        conn = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        if self.path != ':memory:':
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        """Return the connection of the current thread."""
+        if self._memory is not None:
+            return self._memory
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> t.Iterator[sqlite3.Connection]:
+        """Run statements in an immediate (write) transaction."""
+        lock = self._memory_lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            conn = self._connection
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def send_message(self, **entry) -> dict:
+        """Add a message to the queue.
+
+        :returns: Dictionary with the MessageId
+        """
+        response = self.send_messages(Entries=[dict(entry, Id='0')])
+        return {'MessageId': response['Successful'][0]['MessageId']}
+
+    def send_messages(self, Entries: t.Sequence[dict]) -> dict:
+        """Add a batch of messages to the queue, in a single transaction.
+
+        :param Entries: Dictionaries with Id, MessageBody and, optionally,
+            MessageAttributes, DelaySeconds and MessageGroupId.
+        :returns: Dictionary with Successful and Failed entries, as SQS.
+        """
+        now = time.time()
+        rows = []
+        successful = []
+        for entry in Entries:
+            message_id = str(uuid4())
+            rows.append((
+                self.name,
+                message_id,
+                entry['MessageBody'],
+                json.dumps(entry.get('MessageAttributes', {})),
+                entry.get('MessageGroupId'),
+                now,
+                now + entry.get('DelaySeconds', 0),
+            ))
+            successful.append({'Id': entry['Id'], 'MessageId': message_id})
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT INTO messages (queue, message_id, body, message_attributes, group_id, '
+                'sent_at, visible_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+        return {'Successful': successful, 'Failed': []}
+
+    def _receive(self, limit: int, visibility_timeout: int) -> t.List[LocalMessage]:
+        """Receive visible messages, hiding them for visibility_timeout seconds."""
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                'SELECT id FROM messages WHERE queue = ? AND visible_at <= ? ORDER BY id LIMIT ?',
+                (self.name, now, limit)
+            ).fetchall()
+            ids = [row['id'] for row in rows]
+            conn.executemany(
+                'UPDATE messages SET visible_at = ?, receive_count = receive_count + 1, '
+                'receipt_handle = ? WHERE id = ?',
+                [(now + visibility_timeout, str(uuid4()), id_) for id_ in ids]
+            )
+            if not ids:
+                return []
+            rows = conn.execute(
+                'SELECT * FROM messages WHERE id IN ({0}) ORDER BY id'.format(
+                    ', '.join('?' * len(ids))
+                ),
+                ids
+            ).fetchall()
+        return [LocalMessage(self, row) for row in rows]
+
+    def receive_messages(
+            self,
+            MaxNumberOfMessages: int=1,
+            WaitTimeSeconds: int=0,
+            VisibilityTimeout: t.Optional[int]=None,
+            **kwargs
+    ) -> t.List[LocalMessage]:
+        """Receive up to MaxNumberOfMessages, waiting up to WaitTimeSeconds for them.
+
+        :returns: List of messages
+        """
+        if VisibilityTimeout is None:
+            VisibilityTimeout = self.visibility_timeout
+        deadline = time.monotonic() + (WaitTimeSeconds or 0)
+        while True:
+            messages = self._receive(MaxNumberOfMessages, VisibilityTimeout)
+            if messages or time.monotonic() >= deadline:
+                return messages
+            time.sleep(self.poll_interval)
+
+    def delete_messages(self, Entries: t.Sequence[dict]) -> dict:
+        """Delete a batch of messages, identified by their receipt handles.
+
+        :returns: Dictionary with Successful and Failed entries, as SQS.
+        """
+        successful = []
+        failed = []
+        with self._transaction() as conn:
+            for entry in Entries:
+                cursor = conn.execute(
+                    'DELETE FROM messages WHERE queue = ? AND receipt_handle = ?',
+                    (self.name, entry['ReceiptHandle'])
+                )
+                if cursor.rowcount:
+                    successful.append({'Id': entry['Id']})
+                else:
+                    failed.append({
+                        'Id': entry['Id'],
+                        'SenderFault': True,
+                        'Code': 'ReceiptHandleIsInvalid',
+                        'Message': 'The receipt handle is not valid',
+                    })
+        return {'Successful': successful, 'Failed': failed}
+
+    def change_message_visibility_batch(self, Entries: t.Sequence[dict]) -> dict:
+        """Change the visibility timeout of a batch of messages.
+
+        :returns: Dictionary with Successful and Failed entries, as SQS.
+        """
+        now = time.time()
+        successful = []
+        failed = []
+        with self._transaction() as conn:
+            for entry in Entries:
+                cursor = conn.execute(
+                    'UPDATE messages SET visible_at = ? WHERE queue = ? AND receipt_handle = ?',
+                    (now + entry['VisibilityTimeout'], self.name, entry['ReceiptHandle'])
+                )
+                if cursor.rowcount:
+                    successful.append({'Id': entry['Id']})
+                else:
+                    failed.append({
+                        'Id': entry['Id'],
+                        'SenderFault': True,
+                        'Code': 'MessageNotInflight',
+                        'Message': 'The message is not in flight',
+                    })
+        return {'Successful': successful, 'Failed': failed}
+
+    @property
+    def attributes(self) -> dict:
+        """Return the approximate number of visible and in flight messages."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT SUM(visible_at <= ?), SUM(visible_at > ?) FROM messages WHERE queue = ?',
+                (now, now, self.name)
+            ).fetchone()
+        return {
+            'ApproximateNumberOfMessages': str(row[0] or 0),
+            'ApproximateNumberOfMessagesNotVisible': str(row[1] or 0),
+        }
+
+    def purge(self) -> dict:
+        """Delete all messages in the queue."""
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM messages WHERE queue = ?', (self.name,))
+        return {}
@@ -1,9 +1,32 @@
 """Briefy SQSMessage."""
 
+from botocore.exceptions import BotoCoreError
+from botocore.exceptions import ClientError
+from briefy.common.queue.blob import claim_check_key
+from briefy.common.queue.blob import get_blob_store
+from briefy.common.queue.blob import rehydrate
+from briefy.common.queue.codec import decode
+from briefy.common.queue.codec import ENCODING_ATTRIBUTE
 from briefy.common.utils.schema import validate_and_serialize
+from functools import lru_cache
 
 import colander
 import json
+import zlib
+
+
+@lru_cache(maxsize=None)
+def get_schema(schema_class):
+    """Return a shared instance of a schema class, ignoring unknown keys.
+
+    Building a colander schema instantiates (and clones) all its nodes, while
+    serialization and deserialization do not change it: instances are safely
+    shared by all messages, across threads.
+
+    :param schema_class: colander schema class
+    :returns: colander schema instance
+    """
+    return schema_class(unknown='ignore')
 
 
 class SQSMessage:
@@ -12,10 +35,24 @@ class SQSMessage:
     _message = None
     _schema = None
     _body = None
+    _trusted = False
+    _blob_store = None
 
-    def __init__(self, schema, message=None, body=None):
-        """Initialize a Queue Message."""
+    claim_check = ''
+    """Key, in the blob store, of the body of a received message, if it was offloaded."""
+
+    def __init__(self, schema, message=None, body=None, trusted=False, blob_store=None):
+        """Initialize a Queue Message.
+
+        :param schema: colander schema class of the message body
+        :param message: boto3 SQS message, for received messages
+        :param body: Message body, for messages to be sent
+        :param trusted: The body was built by a trusted producer, validate it in a single pass
+        :param blob_store: Store of offloaded bodies, defaults to the configured one
+        """
         self._schema = schema
+        self._trusted = trusted
+        self._blob_store = blob_store
         if (message and body):
             raise ValueError('You should provide only one of message or body')
         elif (not message) and (not body):
@@ -28,7 +65,15 @@ class SQSMessage:
     @property
     def schema(self):
         """Return the validation schema for this message."""
-        return self._schema(unknown='ignore')
+        return get_schema(self._schema)
+
+    @property
+    def blob_store(self):
+        """Return the store of offloaded bodies."""
+        store = self._blob_store
+        if store is None:
+            store = self._blob_store = get_blob_store()
+        return store
 
     @property
     def message(self):
@@ -42,11 +87,25 @@ class SQSMessage:
     def message(self, value):
         """Process a message from amazon."""
         try:
-            body = json.loads(value.body)
+            raw_body = value.body
         except AttributeError:
             raise ValueError('Not a valid message')
-        except json.decoder.JSONDecodeError:
+        attributes = getattr(value, 'message_attributes', None) or {}
+        codec = attributes.get(ENCODING_ATTRIBUTE, {}).get('StringValue')
+        try:
+            if codec:
+                raw_body = decode(codec, raw_body)
+            body = json.loads(raw_body)
+        except (ValueError, OSError, EOFError, zlib.error):
             raise ValueError('Not a valid message body')
+        key = claim_check_key(body)
+        if key:
+            try:
+                body = rehydrate(self.blob_store, key)
+            except (KeyError, OSError, ValueError, EOFError, BotoCoreError, ClientError):
+                # missing, truncated or unreadable blob
+                raise ValueError('Offloaded message body not available: {0}'.format(key))
+            self.claim_check = key
         schema = self.schema
         if schema:
             try:
@@ -70,13 +129,31 @@ class SQSMessage:
         schema = self.schema
         if schema:
             try:
-                value = validate_and_serialize(schema, value)
+                value = validate_and_serialize(schema, value, trusted=self._trusted)
             except colander.Invalid as e:
                 raise ValueError('Not a valid message body: {0}'.format(str(e)))
         self._body = value
 
+    def __getstate__(self):
+        """Return the state to pickle, without the boto3 message (not picklable).
+
+        Used to send messages to a process pool.
+        """
+        state = self.__dict__.copy()
+        state.pop('_message', None)
+        state.pop('_blob_store', None)
+        return state
+
     def delete(self):
         """Delete this message from the Amazon SQS queue."""
         message = self.message
         message.delete()
         self._message = None
+        self.delete_blob()
+
+    def delete_blob(self):
+        """Remove the offloaded body of a deleted message from the blob store."""
+        key = self.claim_check
+        if key:
+            self.blob_store.delete(key)
+            self.claim_check = ''
@@ -1,7 +1,11 @@
 """Helpers to deal with cache."""
 from collections import namedtuple
+from collections import OrderedDict
+from contextlib import contextmanager
 from functools import wraps
+from threading import RLock
 
+import asyncio
 import logging
 import time
 import typing as t
@@ -12,6 +16,8 @@ logger = logging.getLogger(__name__)
 
 TimeStampedResult = namedtuple('TimeStampedResult', 'timestamp result')
 
+CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
 
 def _make_cache_key(*args, **kw):
     """Internal function to make a cache key based on parameters passed to a cache function.
@@ -24,7 +30,112 @@ def _make_cache_key(*args, **kw):
     return key
 
 
-def timeout_cache(timeout: float, renew: bool=False) -> t.Callable:
+class _TimeoutCacheStore:
+    """Thread safe storage of timestamped results used by timeout_cache.
+
+    Entries are kept in least recently used order, so the oldest ones are evicted
+    first once maxsize is reached. Expired entries are removed on access and by a
+    sweep over all entries, run at most once every sweep_interval seconds.
+    """
+
+    def __init__(
+            self,
+            timeout: float,
+            renew: bool=False,
+            maxsize: t.Optional[int]=None,
+            sweep_interval: t.Optional[float]=None
+    ):
+        """Initialize the store.
+
+        :param timeout: Timeout in second to expire the cached result
+        :param renew: whether a hit resets the timeout count for that key
+        :param maxsize: Maximum number of entries, None for unbounded
+        :param sweep_interval: Seconds between sweeps of expired entries,
+                               defaults to timeout
+        """
+        self.timeout = timeout
+        self.renew = renew
+        self.maxsize = maxsize
+        self.sweep_interval = timeout if sweep_interval is None else sweep_interval
+        self.lock = RLock()
+        self._data = OrderedDict()
+        self._key_locks = {}
+        self._last_sweep = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def _sweep(self, now: float):
+        """Remove all expired entries."""
+        self._last_sweep = now
+        timeout = self.timeout
+        expired = [key for key, entry in self._data.items() if now - entry.timestamp >= timeout]
+        for key in expired:
+            del self._data[key]
+
+    def get(self, key: t.Hashable) -> t.Tuple[bool, t.Any]:
+        """Return a tuple (found, result) for a key, counting a hit when found."""
+        now = time.monotonic()
+        with self.lock:
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep(now)
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            if now - entry.timestamp >= self.timeout:
+                del self._data[key]
+                return False, None
+            self.hits += 1
+            if self.renew:
+                self._data[key] = TimeStampedResult(now, entry.result)
+            self._data.move_to_end(key)
+            return True, entry.result
+
+    def set(self, key: t.Hashable, result: t.Any):
+        """Store a freshly computed result, counting a miss."""
+        with self.lock:
+            self.misses += 1
+            self._data[key] = TimeStampedResult(time.monotonic(), result)
+            self._data.move_to_end(key)
+            maxsize = self.maxsize
+            if maxsize is not None:
+                while len(self._data) > maxsize:
+                    self._data.popitem(last=False)
+
+    @contextmanager
+    def key_lock(self, key: t.Hashable):
+        """Hold a lock for a key, so a single thread computes its result."""
+        with self.lock:
+            entry = self._key_locks.get(key)
+            if entry is None:
+                entry = self._key_locks[key] = [RLock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def info(self) -> CacheInfo:
+        """Report cache statistics."""
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+    def clear(self):
+        """Clear the cache and cache statistics."""
+        with self.lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+
+def timeout_cache(
+        timeout: float,
+        renew: bool=False,
+        maxsize: t.Optional[int]=None,
+        sweep_interval: t.Optional[float]=None
+) -> t.Callable:
     """Decorate a function so that it is naively cached when called with the same parameters again.
 
     Similar to functools.lru_cache, but cache contents expire
@@ -33,21 +144,34 @@ def timeout_cache(timeout: float, renew: bool=False) -> t.Callable:
     Cache is kept in an in memory, in process (thread shared) dictionary
     *warning* This is a simple implementation, and should not be relied
     for timeouts under 1/100 second (even because it may add overhead
-    on that magnitude of time)  It also does not take care of
-    freeing references to expired contents - (except on new calls
-    with the same parameters, of course)
+    on that magnitude of time). Expired contents are freed on a sweep
+    run, at most every sweep_interval seconds, by the next call to the
+    decorated function.
+
+    Concurrent calls with the same parameters are computed once: other
+    threads wait for the result of the first one.
+
+    The decorated function has cache_info() and cache_clear() methods,
+    like the ones added by functools.lru_cache.
+
+    Coroutine functions are decorated with :func:`async_timeout_cache`.
 
     :param timeout: Timeout in second to expire the cached result
     :param renew: whether a new call within the timout limit resets the
                   timeout count for that parameter set
+    :param maxsize: Maximum number of cached results, the least recently
+                    used ones are discarded first. None means unbounded.
+    :param sweep_interval: Seconds between sweeps of expired results,
+                           defaults to timeout
     :rtype: decorated callable
     """
     def decorator(func: t.Callable):
-        cache = {}
+        if asyncio.iscoroutinefunction(func):
+            return async_timeout_cache(timeout, renew, maxsize, sweep_interval)(func)
+        store = _TimeoutCacheStore(timeout, renew, maxsize, sweep_interval)
 
         @wraps(func)
         def wrapper(*args, **kw):
-            local_renew = renew
             try:
                 key = _make_cache_key(*args, **kw)
             except TypeError:
@@ -55,13 +179,75 @@ def timeout_cache(timeout: float, renew: bool=False) -> t.Callable:
                 logger.warning('Failed to cache call to \'{0}\': unhashable parameters!'.format(
                     func.__name__))
                 return func(*args, **kw)
-            if key in cache and time.monotonic() - cache[key].timestamp < timeout:
-                result = cache[key].result
-            else:
-                result = func(*args, **kw)
-                local_renew = True
-            if local_renew:
-                cache[key] = TimeStampedResult(time.monotonic(), result)
+            found, result = store.get(key)
+            if found:
+                return result
+            with store.key_lock(key):
+                # Another thread may have computed it while we waited for the lock
+                found, result = store.get(key)
+                if not found:
+                    result = func(*args, **kw)
+                    store.set(key, result)
             return result
+
+        wrapper.cache_info = store.info
+        wrapper.cache_clear = store.clear
+        return wrapper
+    return decorator
+
+
+def async_timeout_cache(
+        timeout: float,
+        renew: bool=False,
+        maxsize: t.Optional[int]=None,
+        sweep_interval: t.Optional[float]=None
+) -> t.Callable:
+    """Decorate a coroutine function so its awaited result is cached, like timeout_cache.
+
+    Concurrent awaits with the same parameters share a single task running the
+    coroutine: its result is cached and returned to all of them. Cancelling one of
+    the awaiting callers does not cancel the shared task.
+
+    Parameters have the same meaning as in :func:`timeout_cache`.
+
+    :rtype: decorated coroutine function
+    """
+    def decorator(func: t.Callable):
+        store = _TimeoutCacheStore(timeout, renew, maxsize, sweep_interval)
+        in_flight = {}
+
+        async def compute(flight_key: tuple, args: tuple, kw: dict):
+            """Await the decorated coroutine and store its result."""
+            try:
+                result = await func(*args, **kw)
+                store.set(flight_key[1], result)
+                return result
+            finally:
+                in_flight.pop(flight_key, None)
+
+        @wraps(func)
+        async def wrapper(*args, **kw):
+            try:
+                key = _make_cache_key(*args, **kw)
+            except TypeError:
+                # Uncacheable parameters
+                logger.warning('Failed to cache call to \'{0}\': unhashable parameters!'.format(
+                    func.__name__))
+                return await func(*args, **kw)
+            found, result = store.get(key)
+            if found:
+                return result
+            # tasks are bound to an event loop, so in flight calls are per loop
+            loop = asyncio.get_event_loop()
+            flight_key = (loop, key)
+            task = in_flight.get(flight_key)
+            if task is None:
+                task = in_flight[flight_key] = asyncio.ensure_future(
+                    compute(flight_key, args, kw), loop=loop
+                )
+            return await asyncio.shield(task)
+
+        wrapper.cache_info = store.info
+        wrapper.cache_clear = store.clear
         return wrapper
     return decorator
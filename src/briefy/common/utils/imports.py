@@ -0,0 +1,12 @@
+"""Resolve objects from their dotted names, as given on the command line."""
+import importlib
+
+
+def resolve(dotted: str):
+    """Resolve a 'package.module:attribute' string.
+
+    :param dotted: Module path and attribute name, separated by a colon
+    :returns: The attribute of the module
+    """
+    module_name, _, attr = dotted.partition(':')
+    return getattr(importlib.import_module(module_name), attr)
@@ -0,0 +1,290 @@
+"""Pluggable sinks to collect runtime metrics."""
+from bisect import bisect_left
+from briefy.common import config
+from threading import Lock
+from zope.interface import Attribute
+from zope.interface import implementer
+from zope.interface import Interface
+
+import logging
+import socket
+import typing as t
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_BUCKETS = (
+    1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000,
+)
+"""Upper bounds for histogram buckets (milliseconds for timings, bytes for sizes)."""
+
+
+class IMetricsSink(Interface):
+    """Sink receiving runtime metrics."""
+
+    enabled = Attribute('Boolean indicating if this sink records anything.')
+
+    def incr(name, value=1):
+        """Increment a counter."""
+
+    def gauge(name, value):
+        """Set the current value of a gauge."""
+
+    def timing(name, value):
+        """Record a duration, in milliseconds."""
+
+    def histogram(name, value):
+        """Record a value in a distribution."""
+
+
+class Histogram:
+    """Fixed buckets histogram keeping count, sum, min and max of recorded values."""
+
+    def __init__(self, buckets: t.Sequence[float]=DEFAULT_BUCKETS):
+        """Initialize the histogram.
+
+        :param buckets: Sorted sequence of bucket upper bounds.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float):
+        """Record a value in this histogram."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percent: float) -> t.Optional[float]:
+        """Return the upper bound of the bucket holding the given percentile.
+
+        :param percent: Percentile, from 0 to 100.
+        :returns: Bucket upper bound (or the max value for the overflow bucket).
+        """
+        if not self.count:
+            return None
+        rank = self.count * percent / 100
+        seen = 0
+        for position, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if position < len(self.buckets):
+                    return min(self.buckets[position], self.max)
+                break
+        return self.max
+
+    def summary(self) -> dict:
+        """Return a summary of the recorded values."""
+        count = self.count
+        return {
+            'count': count,
+            'sum': self.total,
+            'min': self.min,
+            'max': self.max,
+            'avg': self.total / count if count else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+
+@implementer(IMetricsSink)
+class NullSink:
+    """Sink discarding all metrics."""
+
+    enabled = False
+
+    def incr(self, name: str, value: float=1):
+        """Increment a counter."""
+
+    def gauge(self, name: str, value: float):
+        """Set the current value of a gauge."""
+
+    def timing(self, name: str, value: float):
+        """Record a duration, in milliseconds."""
+
+    def histogram(self, name: str, value: float):
+        """Record a value in a distribution."""
+
+
+@implementer(IMetricsSink)
+class MemorySink:
+    """Sink keeping counters, gauges and histograms in process memory."""
+
+    enabled = True
+
+    def __init__(self, buckets: t.Sequence[float]=DEFAULT_BUCKETS):
+        """Initialize the sink.
+
+        :param buckets: Bucket upper bounds used by new histograms.
+        """
+        self._buckets = buckets
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """Remove all recorded metrics."""
+        with self._lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+
+    def incr(self, name: str, value: float=1):
+        """Increment a counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: float):
+        """Set the current value of a gauge."""
+        with self._lock:
+            self.gauges[name] = value
+
+    def timing(self, name: str, value: float):
+        """Record a duration, in milliseconds."""
+        self.histogram(name, value)
+
+    def histogram(self, name: str, value: float):
+        """Record a value in a distribution."""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self._buckets)
+            histogram.add(value)
+
+    def snapshot(self) -> dict:
+        """Return a copy of all recorded metrics."""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': {
+                    name: histogram.summary() for name, histogram in self.histograms.items()
+                },
+            }
+
+
+@implementer(IMetricsSink)
+class LoggingSink:
+    """Sink writing every metric as a log record."""
+
+    enabled = True
+
+    def __init__(self, logger_=None, level: int=logging.DEBUG):
+        """Initialize the sink.
+
+        :param logger_: The logger instance to use or None
+        :param level: Log level used for the metric records.
+        """
+        self.logger = logger_ if logger_ else logger
+        self.level = level
+
+    def _log(self, kind: str, name: str, value: float):
+        """Write a metric to the log."""
+        self.logger.log(
+            self.level,
+            f'metric {kind} {name}={value}',
+            extra={'metric': {'kind': kind, 'name': name, 'value': value}}
+        )
+
+    def incr(self, name: str, value: float=1):
+        """Increment a counter."""
+        self._log('counter', name, value)
+
+    def gauge(self, name: str, value: float):
+        """Set the current value of a gauge."""
+        self._log('gauge', name, value)
+
+    def timing(self, name: str, value: float):
+        """Record a duration, in milliseconds."""
+        self._log('timing', name, value)
+
+    def histogram(self, name: str, value: float):
+        """Record a value in a distribution."""
+        self._log('histogram', name, value)
+
+
+@implementer(IMetricsSink)
+class StatsdSink:
+    """Sink sending metrics to a statsd compatible server over UDP.
+
+    Sending is fire and forget: network errors are logged and the metric is dropped.
+    """
+
+    enabled = True
+
+    def __init__(self, host: str='localhost', port: int=8125, prefix: str=''):
+        """Initialize the sink.
+
+        :param host: statsd server host.
+        :param port: statsd server port.
+        :param prefix: Prefix added to all metric names.
+        """
+        self.address = (host, int(port))
+        self.prefix = f'{prefix}.' if prefix else ''
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _send(self, name: str, value: float, kind: str):
+        """Send a metric line to the statsd server."""
+        line = f'{self.prefix}{name}:{value}|{kind}'
+        try:
+            self._socket.sendto(line.encode('utf-8'), self.address)
+        except OSError as exc:
+            logger.debug(f'Failed to send metric {name} to statsd: {exc}')
+
+    def incr(self, name: str, value: float=1):
+        """Increment a counter."""
+        self._send(name, value, 'c')
+
+    def gauge(self, name: str, value: float):
+        """Set the current value of a gauge."""
+        self._send(name, value, 'g')
+
+    def timing(self, name: str, value: float):
+        """Record a duration, in milliseconds."""
+        self._send(name, value, 'ms')
+
+    def histogram(self, name: str, value: float):
+        """Record a value in a distribution."""
+        self._send(name, value, 'h')
+
+
+def _statsd_sink() -> StatsdSink:
+    """Create a StatsdSink using the statsd configuration."""
+    return StatsdSink(config.STATSD_HOST, config.STATSD_PORT, config.STATSD_PREFIX)
+
+
+SINKS = {
+    '': NullSink,
+    'null': NullSink,
+    'memory': MemorySink,
+    'logging': LoggingSink,
+    'statsd': _statsd_sink,
+}
+
+_sinks = {}
+_sinks_lock = Lock()
+
+
+def get_metrics_sink(kind: t.Optional[str]=None) -> IMetricsSink:
+    """Return the shared metrics sink of a given kind.
+
+    :param kind: One of the keys of SINKS. Defaults to config.METRICS_SINK.
+    :returns: A sink instance, shared by all callers asking for the same kind.
+    """
+    kind = config.METRICS_SINK if kind is None else kind
+    sink = _sinks.get(kind)
+    if sink is None:
+        factory = SINKS.get(kind)
+        if factory is None:
+            raise ValueError(f'Unknown metrics sink: {kind}')
+        with _sinks_lock:
+            sink = _sinks.get(kind)
+            if sink is None:
+                sink = _sinks[kind] = factory()
+    return sink
@@ -1,28 +1,173 @@
 """Colander schema types and validators."""
+from colander import Boolean
+from colander import Date
+from colander import DateTime
+from colander import Float
+from colander import Integer
 from colander import Invalid
+from colander import Mapping
 from colander import null
+from colander import required
 from colander import SchemaNode
 from colander import SchemaType
+from colander import String
 
 import collections
+import datetime
 import json
 import typing as t
+import weakref
 
 
-def validate_and_serialize(schema: SchemaType, data: dict) -> dict:
+def validate_and_serialize(schema: SchemaType, data: dict, trusted: bool=False) -> dict:
     """Validate Python data using a colander schema.
 
+    By default data is serialized and the result deserialized, as colander only
+    runs its validation on deserialize. Trusted producers, building data with
+    the expected Python types, can skip the deserialization: data is then
+    checked by the schema :class:`ValidationPlan`, in the same pass.
+
     :param schema: Schema
     :param data: entity data
+    :param trusted: Validate with the precompiled plan instead of deserializing
     :returns: Colander serialized data
     :raises: `colander.Invalid`
     """
-    # Colander only runs its validation on de-serialize
     value = schema.serialize(data)
-    schema.deserialize(value)
+    if trusted:
+        get_validation_plan(schema).validate(data, value)
+    else:
+        # Colander only runs its validation on de-serialize
+        schema.deserialize(value)
     return value
 
 
+EXPECTED_TYPES = (
+    (DateTime, datetime.datetime),
+    (Date, datetime.date),
+    (Boolean, bool),
+    (Integer, int),
+    (Float, float),
+)
+"""Python types of the appstruct of colander types checked directly by ValidationPlan."""
+
+
+class ValidationPlan:
+    """Validation steps precompiled from a colander mapping schema.
+
+    Instead of deserializing the serialized data, required values and node
+    validators are checked against the original data, when its values have
+    the type the node would deserialize to, or against the serialized value
+    of String nodes. Anything else (nodes with preparers, sequences, custom
+    types, values of another type) falls back to deserializing that node.
+    Errors are reported as colander does, in a single Invalid for the mapping.
+    """
+
+    def __init__(self, node: SchemaNode):
+        """Compile the validation steps of a mapping node.
+
+        :param node: colander node of Mapping type
+        """
+        self.node = node
+        self.steps = [
+            (position, child, self._compile(child))
+            for position, child in enumerate(node.children)
+        ]
+
+    @staticmethod
+    def _compile(node: SchemaNode) -> t.Tuple[str, t.Any]:
+        """Return how a child node is validated, as a tuple (kind, argument)."""
+        typ = node.typ
+        if node.preparer is not None:
+            return 'deserialize', None
+        if isinstance(typ, Mapping):
+            if node.validator is None:
+                return 'mapping', ValidationPlan(node)
+            return 'deserialize', None
+        if isinstance(typ, String):
+            return 'string', None
+        for colander_type, python_type in EXPECTED_TYPES:
+            if isinstance(typ, colander_type):
+                return 'typed', python_type
+        return 'deserialize', None
+
+    @staticmethod
+    def _check(node: SchemaNode, value: t.Any, empty: tuple=(null, None)):
+        """Check a required value and run the node validator."""
+        if value in empty:
+            if node.missing is required:
+                raise Invalid(node, node.missing_msg)
+        elif node.validator is not None:
+            node.validator(node, value)
+
+    def validate(self, appstruct: dict, cstruct: dict):
+        """Validate data against the schema.
+
+        :param appstruct: Data passed to serialize
+        :param cstruct: Data returned by serialize
+        :raises: `colander.Invalid`
+        """
+        error = None
+        for position, child, (kind, argument) in self.steps:
+            name = child.name
+            value = cstruct.get(name, null)
+            try:
+                if kind == 'string':
+                    self._check(child, value, (null, None, ''))
+                elif kind == 'typed':
+                    original = appstruct.get(name, null)
+                    if original in (null, None) or (
+                        isinstance(original, argument) and
+                        not (argument is int and isinstance(original, bool))
+                    ):
+                        self._check(child, original)
+                    else:
+                        child.deserialize(value)
+                elif kind == 'mapping' and isinstance(value, dict):
+                    argument.validate(appstruct.get(name) or {}, value)
+                else:
+                    child.deserialize(value)
+            except Invalid as exc:
+                if error is None:
+                    error = Invalid(self.node)
+                error.add(exc, position)
+        if error is not None:
+            raise error
+
+
+_plans = weakref.WeakKeyDictionary()
+
+
+def get_validation_plan(schema: SchemaNode) -> ValidationPlan:
+    """Return the validation plan of a schema instance, compiling it on first use.
+
+    Schemas of other types than Mapping get a plan deserializing the whole data.
+
+    :param schema: colander schema instance
+    :returns: The cached ValidationPlan
+    """
+    plan = _plans.get(schema)
+    if plan is None:
+        if isinstance(schema.typ, Mapping) and schema.validator is None:
+            plan = ValidationPlan(schema)
+        else:
+            plan = _DeserializePlan(schema)
+        _plans[schema] = plan
+    return plan
+
+
+class _DeserializePlan:
+    """Plan validating data by deserializing it, for schemas ValidationPlan does not support."""
+
+    def __init__(self, node: SchemaNode):
+        """Initialize the plan."""
+        self.node = node
+
+    def validate(self, appstruct: t.Any, cstruct: t.Any):
+        """Validate data against the schema."""
+        self.node.deserialize(cstruct)
+
+
 class Dictionary(SchemaType):
     """A Dictionary schema type for colander."""
 
@@ -1,6 +1,13 @@
 """Briefy workers."""
+from briefy.common.worker.aio import AsyncQueueWorker  # noqa
+from briefy.common.worker.aio import AsyncWorker  # noqa
 from briefy.common.worker.base import Worker  # noqa
+from briefy.common.worker.dispatch import DispatcherWorker  # noqa
+from briefy.common.worker.dispatch import EventRouter  # noqa
 from briefy.common.worker.queue import QueueWorker  # noqa
 
 
-__all__ = ('Worker', 'QueueWorker')
+__all__ = (
+    'Worker', 'QueueWorker', 'AsyncWorker', 'AsyncQueueWorker',
+    'DispatcherWorker', 'EventRouter',
+)
@@ -0,0 +1,288 @@
+"""Briefy asyncio based workers."""
+from abc import abstractmethod
+from briefy.common.worker.base import Worker
+from functools import partial
+
+import asyncio
+import signal
+import time
+
+
+STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class AsyncWorker(Worker):
+    """Base class for workers running in an asyncio event loop.
+
+    Upon deriving from this, define a 'name' and the 'process' coroutine.
+    Calling the worker runs a new event loop, in the calling thread, until
+    'stop' is called or, when running in the main thread, until a SIGTERM
+    or SIGINT is received.
+
+    On stop, the running 'process' call is cancelled and the 'shutdown'
+    coroutine is awaited before the loop is closed.
+    """
+
+    shutdown_timeout = 30
+    """Seconds 'shutdown' waits for pending work before cancelling it."""
+
+    _loop = None
+    _stopped = None
+
+    @abstractmethod
+    async def process(self):  # pragma: no cover
+        """Run tasks on this worker."""
+        raise NotImplementedError('Method not implemented')
+
+    async def shutdown(self):
+        """Release resources after the worker loop exits."""
+
+    def stop(self):
+        """Stop the worker. Safe to be called from any thread or from a signal handler."""
+        self.running = False
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._set_stopped)
+
+    def _set_stopped(self):
+        """Wake up the worker loop."""
+        stopped = self._stopped
+        if stopped is not None:
+            stopped.set()
+
+    async def run_in_executor(self, func, *args, **kwargs):
+        """Run a blocking function in the default executor of the loop."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+    async def _wait_stopped(self, awaitable):
+        """Await a coroutine, cancelling it if the worker is stopped first.
+
+        :returns: The coroutine result, or None if it was cancelled
+        """
+        task = asyncio.ensure_future(awaitable)
+        waiter = asyncio.ensure_future(self._stopped.wait())
+        await asyncio.wait([task, waiter], return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.wait([task])
+        elif not task.cancelled():
+            return task.result()
+
+    async def run(self):
+        """Call 'process' until the worker is stopped, then call 'shutdown'."""
+        name = self.name
+        self._stopped = asyncio.Event()
+        if not self.running:
+            self._stopped.set()
+        self._idle_runs = 0
+        self._reset_window()
+        while self.running:
+            result = None
+            error = False
+            start = time.monotonic()
+            try:
+                result = await self._wait_stopped(self.process())
+            except Exception:
+                error = True
+                self.logger.exception('{0}: Error executing process'.format(name))
+            end = time.monotonic()
+            self.record_run(result, error, end - start)
+            self.maybe_report()
+            interval = self.next_interval(result)
+            if self.running:
+                await self._wait_stopped(asyncio.sleep(interval))
+                self.idle(time.monotonic() - end)
+        await self.shutdown()
+        if self.summary_interval:
+            self.report()
+
+    def _add_signal_handlers(self, loop):
+        """Stop the worker on SIGTERM and SIGINT. Only possible in the main thread."""
+        installed = []
+        for signum in STOP_SIGNALS:
+            try:
+                loop.add_signal_handler(signum, self.stop)
+            except (RuntimeError, ValueError):
+                break
+            installed.append(signum)
+        return installed
+
+    def __call__(self):
+        """Execute the worker in a new event loop."""
+        self.logger.info('%s running', self.name)
+        loop = self._loop = asyncio.new_event_loop()
+        self.running = True
+        installed = self._add_signal_handlers(loop)
+        try:
+            loop.run_until_complete(self.run())
+        finally:
+            for signum in installed:
+                loop.remove_signal_handler(signum)
+            self._loop = None
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+        self.logger.info('Exiting worker loop for {0}'.format(self.__class__))
+
+
+class AsyncQueueWorker(AsyncWorker):
+    """Base class for asyncio workers using a Queue.
+
+    Blocking boto3 calls run in the loop executor, while messages are processed
+    by the 'process_message' coroutine, up to 'concurrency' at the same time.
+    Successfully processed messages are deleted in batches.
+
+    On stop, polling is interrupted and messages being processed have
+    'shutdown_timeout' seconds to finish before being cancelled. Messages
+    not processed become visible again once their visibility timeout expires.
+    """
+
+    input_queue = None
+    run_interval = .5
+
+    batch_size = 10
+    """Maximum number of messages received on each poll (SQS caps it at 10)."""
+
+    wait_time = 20
+    """Seconds to wait for messages when the queue is empty (long polling, up to 20)."""
+
+    concurrency = 10
+    """Maximum number of messages being processed at the same time."""
+
+    def __init__(
+            self,
+            input_queue,
+            logger_=None,
+            run_interval=None,
+            batch_size=None,
+            wait_time=None,
+            concurrency=None,
+            max_run_interval=None,
+            metrics=None
+    ):
+        """Initialize the worker.
+
+        :param input_queue: Queue to receive messages from
+        :param logger_: The logger instance to use or None
+        :param run_interval: Minimum time ellapsed between sucessive calls to 'process',
+            defaults to the class attribute
+        :param batch_size: Messages received per poll, defaults to the class attribute
+        :param wait_time: Long polling wait time, defaults to the class attribute
+        :param concurrency: Messages processed at the same time, defaults to the class attribute
+        :param max_run_interval: Ceiling for the idle interval, defaults to the class attribute
+        :param metrics: Metrics sink, defaults to the configured one
+        """
+        super().__init__(logger_, run_interval, max_run_interval, metrics)
+        self.input_queue = input_queue
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if wait_time is not None:
+            self.wait_time = wait_time
+        if concurrency is not None:
+            self.concurrency = concurrency
+        if not self.input_queue:
+            raise ValueError('Queue Worker must have a queue')
+        if self.concurrency < 1:
+            raise ValueError('Queue Worker concurrency must be at least 1')
+        self._tasks = set()
+        self._processed = []
+
+    async def get_messages(self, num_messages):
+        """Get messages from self.input_queue.
+
+        Long polling is only used when no message is being processed, so
+        processed messages are acknowledged without waiting for the poll.
+
+        :param num_messages: Maximum number of messages to receive
+        :returns: A list of SQSMessage objects
+        :rtype: list
+        """
+        wait_time = 0 if self._tasks else self.wait_time
+        start = time.monotonic()
+        messages = await self.run_in_executor(
+            self.input_queue.get_messages, num_messages=num_messages, wait_time=wait_time
+        )
+        elapsed = time.monotonic() - start
+        self.timing('receive', elapsed)
+        if messages:
+            self.incr('messages.received', len(messages))
+        elif not self._tasks:
+            self.idle(elapsed)
+        self.logger.debug('Got {0} messages'.format(len(messages)))
+        return messages
+
+    async def delete_messages(self):
+        """Acknowledge processed messages, deleting them from self.input_queue."""
+        messages, self._processed = self._processed, []
+        if messages:
+            # deletion is not interrupted by stop
+            not_deleted = await asyncio.shield(
+                self.run_in_executor(self.input_queue.delete_messages, messages)
+            )
+            if not_deleted:
+                self.logger.info('{0} messages were not deleted'.format(len(not_deleted)))
+
+    async def process_message(self, message):
+        """Process a message retrieved from the input_queue.
+
+        :param message: A message from the queue
+        :returns: Status from the process
+        :rtype: bool
+        """
+        status = True
+        return status
+
+    async def _handle_message(self, message):
+        """Process a message and schedule its deletion on success."""
+        start = time.monotonic()
+        try:
+            status = await self.process_message(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.logger.exception('{0}: Error processing message'.format(self.name))
+            status = False
+        self.timing('message', time.monotonic() - start)
+        if status:
+            self.incr('messages.processed')
+            self._processed.append(message)
+        else:
+            self.incr('messages.failed')
+            self.logger.info('Message was not deleted')
+
+    def _start(self, message):
+        """Start processing a message in a new task."""
+        task = asyncio.ensure_future(self._handle_message(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def process(self):
+        """Poll the queue for as many messages as there are free processing slots.
+
+        :returns: Number of messages received
+        :rtype: int
+        """
+        await self.delete_messages()
+        if len(self._tasks) >= self.concurrency:
+            await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+            await self.delete_messages()
+        free = self.concurrency - len(self._tasks)
+        messages = await self.get_messages(min(self.batch_size, free))
+        for message in messages:
+            self._start(message)
+        return len(messages)
+
+    async def shutdown(self):
+        """Wait for messages being processed, then acknowledge them."""
+        tasks = set(self._tasks)
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+                self.logger.info(
+                    '{0}: {1} messages cancelled on shutdown'.format(self.name, len(pending))
+                )
+        await self.delete_messages()
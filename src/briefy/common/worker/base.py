@@ -1,8 +1,10 @@
 """Briefy base worker."""
 from abc import ABCMeta
 from abc import abstractmethod
+from briefy.common.utils.metrics import get_metrics_sink
 
 import logging
+import random
 import time
 
 
@@ -17,16 +19,47 @@ class Worker(metaclass=ABCMeta):
     to self.process.
 
     The default timing function is time.sleep (thus making of this a
-    single-threaded synchronous blocker worker) - you ay override
-    that class or check for Worker mixins for threaded, multiprocessing
-    or async versions.
+    single-threaded synchronous blocker worker) - you may override
+    it, use QueueWorker.concurrency to process messages in a pool of threads
+    or processes, or derive from AsyncWorker for an asyncio version.
+
+    Scheduling is adaptive when 'process' reports the amount of work it
+    found: the next call happens immediately while work keeps coming,
+    and, when idle, the interval starts at 'run_interval' and grows by
+    'backoff_factor' up to 'max_run_interval', with a random 'jitter' so
+    replicas do not poll in lockstep. When 'process' returns anything but
+    an int (e.g. None) the worker always waits 'run_interval'.
+
+    Counters and timings are sent to a metrics sink (see
+    briefy.common.utils.metrics), named 'worker.<name>.<metric>', and a
+    summary is logged every 'summary_interval' seconds.
 
     """
 
     name = ''
     run_interval = None
 
-    def __init__(self, logger_=None, run_interval=None):
+    max_run_interval = None
+    """Ceiling for the idle interval. None keeps it at run_interval."""
+
+    backoff_factor = 2
+    """Multiplier applied to the interval after each idle call to 'process'."""
+
+    jitter = 0.1
+    """Fraction of the idle interval added or subtracted at random."""
+
+    summary_interval = 60
+    """Seconds between two summary log entries. 0 disables the summary."""
+
+    _idle_runs = 0
+
+    def __init__(
+            self,
+            logger_=None,
+            run_interval=None,
+            max_run_interval=None,
+            metrics=None
+    ):
         """Initialize the worker.
 
         :param logger_: The logger instance to use or None
@@ -34,39 +67,220 @@ class Worker(metaclass=ABCMeta):
         :param run_interval: Minimum time ellapsed between sucessive calls to 'process'.
             Defaults to value specified on the class body
         :type run_interval: float or None
+        :param max_run_interval: Ceiling for the idle interval.
+            Defaults to value specified on the class body
+        :type max_run_interval: float or None
+        :param metrics: Metrics sink, defaults to the configured one
+        :type metrics: briefy.common.utils.metrics.IMetricsSink or None
         :returns: None
         :rtype: NoneType
         """
         self.logger = logger_ if logger_ else logger
         if run_interval is not None:
             self.run_interval = run_interval
+        if max_run_interval is not None:
+            self.max_run_interval = max_run_interval
+        self.metrics = metrics if metrics is not None else get_metrics_sink()
+        self.stats = {'runs': 0, 'items': 0, 'errors': 0}
+        self._reset_window()
         name = self.name
         if not name:
             raise ValueError('Worker must have a name')
 
     @abstractmethod
     def process(self):  # pragma: no cover
-        """Run tasks on this worker."""
+        """Run tasks on this worker.
+
+        :returns: Amount of work found (e.g. number of messages), or None
+        """
         raise NotImplementedError('Method not implemented')
 
+    @staticmethod
+    def _work_found(result):
+        """Return the amount of work reported by 'process', None if it did not report it.
+
+        Only ints count: other values returned by 'process' are ignored.
+        """
+        if isinstance(result, int) and not isinstance(result, bool):
+            return result
+        return None
+
+    def stop(self):
+        """Stop the worker after the current call to 'process'."""
+        self.running = False
+
+    def _metric_name(self, key):
+        """Return the full name of a worker metric."""
+        return 'worker.{0}.{1}'.format(self.name, key)
+
+    def _reset_window(self, now=None):
+        """Start a new summary window."""
+        self._window = {}
+        self._window_start = time.monotonic() if now is None else now
+
+    def incr(self, key, value=1):
+        """Increment a worker counter.
+
+        :param key: Counter name, e.g. 'messages.processed'
+        :param value: Increment
+        """
+        window = self._window
+        window[key] = window.get(key, 0) + value
+        metrics = self.metrics
+        if metrics.enabled:
+            metrics.incr(self._metric_name(key), value)
+
+    def timing(self, key, seconds):
+        """Record a worker duration.
+
+        :param key: Timing name, e.g. 'message'
+        :param seconds: Duration, in seconds
+        """
+        window = self._window
+        window[key + '.time'] = window.get(key + '.time', 0) + seconds
+        window[key + '.count'] = window.get(key + '.count', 0) + 1
+        metrics = self.metrics
+        if metrics.enabled:
+            metrics.timing(self._metric_name(key), seconds * 1000)
+
+    def idle(self, seconds):
+        """Account time spent waiting for work.
+
+        :param seconds: Duration, in seconds
+        """
+        window = self._window
+        window['idle'] = window.get('idle', 0) + seconds
+
+    def record_run(self, result, error=False, elapsed=None):
+        """Update the worker stats after a call to 'process'.
+
+        :param result: Value returned by 'process'
+        :param error: Whether 'process' raised an exception
+        :param elapsed: Duration of the call, in seconds
+        """
+        result = self._work_found(result)
+        stats = self.stats
+        stats['runs'] += 1
+        self.incr('runs')
+        if error:
+            stats['errors'] += 1
+            self.incr('errors')
+        elif result:
+            stats['items'] += result
+        if elapsed is not None:
+            self.timing('loop', elapsed)
+
+    def summary(self, now=None):
+        """Return the metrics of the current summary window.
+
+        :returns: Dictionary with counters, rates, average timings and idle ratio
+        """
+        now = time.monotonic() if now is None else now
+        window = self._window
+        elapsed = max(now - self._window_start, 1e-9)
+        data = {
+            key: value for key, value in window.items()
+            if not key.endswith(('.time', '.count'))
+        }
+        for key in window:
+            if key.endswith('.count'):
+                name = key[:-len('.count')]
+                data[name + '.avg_ms'] = window[name + '.time'] / window[key] * 1000
+        data['elapsed'] = elapsed
+        data['idle_ratio'] = min(window.get('idle', 0) / elapsed, 1.0)
+        data['processed_rate'] = window.get('messages.processed', 0) / elapsed
+        return data
+
+    def report(self, now=None):
+        """Log the summary of the current window and start a new one."""
+        now = time.monotonic() if now is None else now
+        data = self.summary(now)
+        metrics = self.metrics
+        if metrics.enabled:
+            metrics.gauge(self._metric_name('idle_ratio'), data['idle_ratio'])
+        self.logger.info(
+            '{0}: {1} runs, {2} received, {3} processed, {4} failed, {5:.1f} messages/s, '
+            '{6:.1f} ms per message, {7:.0%} idle'.format(
+                self.name,
+                data.get('runs', 0),
+                data.get('messages.received', 0),
+                data.get('messages.processed', 0),
+                data.get('messages.failed', 0),
+                data['processed_rate'],
+                data.get('message.avg_ms', 0),
+                data['idle_ratio'],
+            ),
+            extra={'worker_summary': data}
+        )
+        self._reset_window(now)
+
+    def maybe_report(self):
+        """Log the summary when summary_interval elapsed."""
+        interval = self.summary_interval
+        if interval:
+            now = time.monotonic()
+            if now - self._window_start >= interval:
+                self.report(now)
+
+    def next_interval(self, result):
+        """Return the time to wait before the next call to 'process'.
+
+        :param result: Value returned by the last call to 'process'
+        :returns: Seconds to wait
+        :rtype: float
+        """
+        run_interval = self.run_interval or 0
+        result = self._work_found(result)
+        if result is None:
+            return run_interval
+        if result:
+            self._idle_runs = 0
+            return 0
+        ceiling = self.max_run_interval
+        if ceiling is None or ceiling < run_interval:
+            ceiling = run_interval
+        interval = run_interval
+        if interval < ceiling:
+            # stop counting once the ceiling is reached to avoid overflows
+            interval = min(run_interval * self.backoff_factor ** self._idle_runs, ceiling)
+            if interval < ceiling:
+                self._idle_runs += 1
+        jitter = self.jitter
+        if jitter:
+            interval *= random.uniform(1 - jitter, 1 + jitter)
+        return interval
+
     def __call__(self):
         """Execute the worker.
 
         Calls "self.process" method in an infinite loop,
-        sparsing the each call by self.run_interval seconds
+        sparsing each call by the interval returned by self.next_interval
 
         The code running in the process method, or code in another
-        thread may set "self.running" to False to stop the worker
+        thread may set "self.running" to False (or call "self.stop")
+        to stop the worker
         """
         name = self.name
         self.logger.info('%s running', name)
         self.running = True
+        self._idle_runs = 0
+        self._reset_window()
         while self.running:
+            result = None
+            error = False
+            start = time.monotonic()
             try:
-                self.process()
+                result = self.process()
             except Exception:
+                error = True
                 self.logger.exception('{0}: Error executing process'.format(name))
-            self.sleep(self.run_interval)
+            end = time.monotonic()
+            self.record_run(result, error, end - start)
+            self.maybe_report()
+            self.sleep(self.next_interval(result))
+            self.idle(time.monotonic() - end)
+        if self.summary_interval:
+            self.report()
         self.logger.info('Exiting worker loop for {0}'.format(self.__class__))
 
     sleep = time.sleep
@@ -0,0 +1,231 @@
+"""Dispatch event messages to handlers registered by event name pattern.
+
+Patterns are event names, segments separated by dots, where '*' matches a
+single segment and a final '**' matches any number of segments, including
+none::
+
+    router = EventRouter()
+
+    @router.handler('order.workflow.*', concurrency=2)
+    def order_transition(message):
+        ...
+        return True
+
+    DispatcherWorker(EventQueue, router=router)()
+"""
+from briefy.common.worker.queue import QueueWorker
+
+import threading
+import time
+import typing as t
+
+
+WILDCARD = '*'
+"""Pattern segment matching any single segment."""
+
+DEEP_WILDCARD = '**'
+"""Final pattern segment matching any number of segments."""
+
+
+class Handler:
+    """A callable processing the messages of events matching a pattern."""
+
+    def __init__(self, pattern: str, func: t.Callable, name: str='', concurrency: int=0):
+        """Initialize the handler.
+
+        :param pattern: Event name pattern
+        :param func: Callable receiving a message and returning its status
+        :param name: Name used in metrics, defaults to the callable name
+        :param concurrency: Maximum number of messages handled at once. 0 is unlimited
+        """
+        self.pattern = pattern
+        self.func = func
+        self.name = name or getattr(func, '__name__', pattern)
+        self.concurrency = concurrency
+        self._semaphore = threading.BoundedSemaphore(concurrency) if concurrency else None
+
+    def __getstate__(self):
+        """Return the state to pickle, without the semaphore."""
+        state = self.__dict__.copy()
+        state['_semaphore'] = None
+        return state
+
+    def __setstate__(self, state):
+        """Restore the handler, limiting concurrency within the new process."""
+        self.__dict__.update(state)
+        if self.concurrency:
+            self._semaphore = threading.BoundedSemaphore(self.concurrency)
+
+    def __call__(self, message) -> bool:
+        """Handle a message, waiting for a free slot if concurrency is limited."""
+        semaphore = self._semaphore
+        if semaphore is None:
+            return self.func(message)
+        with semaphore:
+            return self.func(message)
+
+    def __repr__(self) -> str:
+        """Representation of a Handler."""
+        return "<{0}(name='{1}' pattern='{2}')>".format(
+            self.__class__.__name__, self.name, self.pattern
+        )
+
+
+class _Node:
+    """Node of the pattern trie."""
+
+    __slots__ = ('children', 'handlers', 'deep_handlers')
+
+    def __init__(self):
+        """Initialize an empty node."""
+        self.children = {}
+        self.handlers = []
+        self.deep_handlers = []
+
+
+class EventRouter:
+    """Match event names to handlers, using a trie of pattern segments.
+
+    Matching handlers are returned in registration order. Results are cached
+    by event name, the cache is cleared when a handler is registered.
+    """
+
+    def __init__(self):
+        """Initialize an empty router."""
+        self.handlers = []
+        self._root = _Node()
+        self._cache = {}
+
+    def register(
+            self,
+            pattern: str,
+            func: t.Callable,
+            name: str='',
+            concurrency: int=0
+    ) -> Handler:
+        """Register a handler for an event name pattern.
+
+        :param pattern: Event name pattern, i.e. 'order.workflow.*'
+        :param func: Callable receiving a message and returning its status
+        :param name: Name used in metrics, defaults to the callable name
+        :param concurrency: Maximum number of messages handled at once. 0 is unlimited
+        :returns: The registered handler
+        """
+        segments = pattern.split('.')
+        if DEEP_WILDCARD in segments[:-1] or not all(segments):
+            raise ValueError('Invalid event name pattern: {0}'.format(pattern))
+        handler = Handler(pattern, func, name=name, concurrency=concurrency)
+        node = self._root
+        deep = segments[-1] == DEEP_WILDCARD
+        if deep:
+            segments = segments[:-1]
+        for segment in segments:
+            node = node.children.setdefault(segment, _Node())
+        if deep:
+            node.deep_handlers.append(handler)
+        else:
+            node.handlers.append(handler)
+        self.handlers.append(handler)
+        self._cache.clear()
+        return handler
+
+    def handler(self, pattern: str, name: str='', concurrency: int=0) -> t.Callable:
+        """Decorator registering a function as handler of a pattern."""
+        def decorator(func):
+            self.register(pattern, func, name=name, concurrency=concurrency)
+            return func
+        return decorator
+
+    def _collect(self, node: _Node, segments: t.List[str], found: set):
+        """Add the handlers of node matching the remaining segments to found."""
+        found.update(map(id, node.deep_handlers))
+        if not segments:
+            found.update(map(id, node.handlers))
+            return
+        head, rest = segments[0], segments[1:]
+        children = node.children
+        child = children.get(head)
+        if child is not None:
+            self._collect(child, rest, found)
+        child = children.get(WILDCARD)
+        if child is not None:
+            self._collect(child, rest, found)
+
+    def match(self, event_name: str) -> t.List[Handler]:
+        """Return the handlers registered for an event name.
+
+        :param event_name: Name of the event
+        :returns: List of handlers, in registration order
+        """
+        handlers = self._cache.get(event_name)
+        if handlers is None:
+            found = set()
+            self._collect(self._root, event_name.split('.'), found)
+            handlers = [handler for handler in self.handlers if id(handler) in found]
+            self._cache[event_name] = handlers
+        return handlers
+
+
+class DispatcherWorker(QueueWorker):
+    """Queue worker calling the handlers registered for the event name of each message.
+
+    A message is processed when all its handlers return a true status; a
+    handler raising an exception fails the message, which is received again
+    after its visibility timeout. Messages without handlers are deleted,
+    unless 'ack_unmatched' is disabled.
+
+    The time spent in each handler is recorded as 'handler.<name>' and
+    failures are counted as 'handler.<name>.failed'. Handler concurrency
+    limits are shared by the threads of the worker pool; with a process pool
+    they apply to each process.
+    """
+
+    name = 'dispatcher'
+
+    router = None
+    """EventRouter with the handlers of this worker."""
+
+    ack_unmatched = True
+    """Delete messages of events without handlers."""
+
+    def __init__(self, input_queue, router: t.Optional[EventRouter]=None, **kwargs):
+        """Initialize the worker.
+
+        :param input_queue: Queue to receive messages from
+        :param router: Router with the handlers, defaults to the class attribute
+        :param kwargs: Other QueueWorker parameters (logger_, concurrency...)
+        """
+        if router is not None:
+            self.router = router
+        if self.router is None:
+            raise ValueError('Dispatcher worker must have a router')
+        super().__init__(input_queue, **kwargs)
+
+    def _call_handler(self, handler: Handler, message) -> bool:
+        """Call a handler, recording its time and failures."""
+        start = time.monotonic()
+        try:
+            status = handler(message)
+        except Exception:
+            status = False
+            self.logger.exception('Handler {0} failed'.format(handler.name))
+        self.timing('handler.{0}'.format(handler.name), time.monotonic() - start)
+        if not status:
+            self.incr('handler.{0}.failed'.format(handler.name))
+        return bool(status)
+
+    def process_message(self, message) -> bool:
+        """Call the handlers of the message event.
+
+        :param message: A message from the queue
+        :returns: Whether all handlers succeeded
+        """
+        event_name = message.body.get('event_name', '')
+        handlers = self.router.match(event_name)
+        if not handlers:
+            self.logger.debug('No handler for event {0}'.format(event_name))
+            return self.ack_unmatched
+        status = True
+        for handler in handlers:
+            status = self._call_handler(handler, message) and status
+        return status
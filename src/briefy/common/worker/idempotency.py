@@ -0,0 +1,152 @@
+"""Idempotency stores, remembering the events already processed by a worker.
+
+SQS delivers messages at least once: a message whose deletion failed, or that
+became visible again while being processed, is received again. QueueWorker
+checks the ids of received events against its 'idempotency_store' and skips,
+deleting them, the ones already processed.
+
+IdempotencyStore keeps the most recent ids in a bounded LRU, in memory, and
+can be backed by a RedisIdempotencyStore shared by all the workers, whose keys
+expire after a TTL.
+"""
+from briefy.common.config import CACHE_HOST
+from briefy.common.config import CACHE_REDIS_PORT
+from briefy.common.config import WORKER_IDEMPOTENCY_REDIS
+from briefy.common.config import WORKER_IDEMPOTENCY_SIZE
+from briefy.common.config import WORKER_IDEMPOTENCY_TTL
+from briefy.common.log import logger
+from collections import OrderedDict
+from zope.interface import implementer
+from zope.interface import Interface
+
+import redis
+import threading
+import typing as t
+
+
+class IIdempotencyStore(Interface):
+    """Interface for a store of processed keys."""
+
+    def seen(keys):
+        """Return the set of keys, from keys, already processed."""
+
+    def add(keys):
+        """Record keys as processed."""
+
+
+@implementer(IIdempotencyStore)
+class RedisIdempotencyStore:
+    """Processed keys shared between workers, as Redis keys expiring after ttl seconds."""
+
+    def __init__(
+            self,
+            client: t.Optional[redis.StrictRedis]=None,
+            ttl: int=WORKER_IDEMPOTENCY_TTL,
+            prefix: str='briefy:processed:'
+    ):
+        """Initialize the store.
+
+        :param client: Redis client, defaults to one connected to CACHE_HOST.
+        :param ttl: Seconds a processed key is remembered.
+        :param prefix: Prefix of the Redis keys.
+        """
+        if client is None:
+            client = redis.StrictRedis(host=CACHE_HOST, port=int(CACHE_REDIS_PORT))
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def seen(self, keys: t.Iterable[str]) -> t.Set[str]:
+        """Return the set of keys already processed, in a single round trip."""
+        keys = list(keys)
+        if not keys:
+            return set()
+        pipeline = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.exists(self.prefix + key)
+        return {key for key, exists in zip(keys, pipeline.execute()) if exists}
+
+    def add(self, keys: t.Iterable[str]):
+        """Record keys as processed, in a single round trip."""
+        keys = list(keys)
+        if not keys:
+            return
+        pipeline = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.set(self.prefix + key, 1, ex=self.ttl)
+        pipeline.execute()
+
+
+@implementer(IIdempotencyStore)
+class IdempotencyStore:
+    """Bounded LRU of processed keys, optionally backed by a shared store.
+
+    Keys missing locally are looked up in the shared store, and the ones
+    found there are cached locally. Errors of the shared store are not
+    raised: messages are then processed again, as without the store.
+    """
+
+    def __init__(
+            self,
+            max_size: int=WORKER_IDEMPOTENCY_SIZE,
+            shared: t.Optional[IIdempotencyStore]=None,
+            logger_=None
+    ):
+        """Initialize the store.
+
+        :param max_size: Number of keys kept in memory.
+        :param shared: Store shared with other workers, e.g. a RedisIdempotencyStore.
+        :param logger_: The logger instance to use or None
+        """
+        self.max_size = max_size
+        self.shared = shared
+        self.logger = logger_ if logger_ else logger
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of keys kept in memory."""
+        return len(self._keys)
+
+    def _remember(self, keys: t.Iterable[str]):
+        """Add keys to the LRU, evicting the least recently used ones."""
+        with self._lock:
+            for key in keys:
+                self._keys[key] = True
+                self._keys.move_to_end(key)
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+
+    def seen(self, keys: t.Iterable[str]) -> t.Set[str]:
+        """Return the set of keys already processed."""
+        keys = list(keys)
+        with self._lock:
+            found = {key for key in keys if key in self._keys}
+            for key in found:
+                self._keys.move_to_end(key)
+        missing = [key for key in keys if key not in found]
+        if missing and self.shared is not None:
+            try:
+                shared = self.shared.seen(missing)
+            except Exception:
+                self.logger.exception('Failed to check processed keys in the shared store')
+            else:
+                self._remember(shared)
+                found |= shared
+        return found
+
+    def add(self, keys: t.Iterable[str]):
+        """Record keys as processed."""
+        keys = list(keys)
+        self._remember(keys)
+        if keys and self.shared is not None:
+            try:
+                self.shared.add(keys)
+            except Exception:
+                self.logger.exception('Failed to record processed keys in the shared store')
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Return a new store configured by the WORKER_IDEMPOTENCY_* settings."""
+    shared = RedisIdempotencyStore() if WORKER_IDEMPOTENCY_REDIS else None
+    return IdempotencyStore(shared=shared)
@@ -0,0 +1,216 @@
+"""Relay events from the outbox table to the events queue."""
+from briefy.common.db import datetime_utcnow
+from briefy.common.db.models.outbox import OutboxEvent
+from briefy.common.queue.message import get_schema
+from briefy.common.worker.base import Worker
+from datetime import timedelta
+from sqlalchemy.orm import Session
+
+import colander
+import json
+import time
+import typing as t
+
+
+class OutboxRelayWorker(Worker):
+    """Publish the events stored in the outbox table (see briefy.common.event.Event.outbox).
+
+    Each call to 'process' locks a batch of pending events, oldest first (by
+    created_at, then insertion order), writes them to the queue using batch
+    requests and marks the ones the queue accepted as published, in a single
+    transaction. Delivery is at-least-once: an event is published again if
+    the transaction fails after it was written to the queue.
+
+    Rows are locked with 'SELECT ... FOR UPDATE SKIP LOCKED', so several
+    relays can run in parallel; ordering is then only kept within a batch.
+    When the queue rejects a whole batch (i.e. a request too large), its events
+    are written again one at a time, so one bad event does not block the
+    others. Events failing 'max_attempts' times are left in the table,
+    unpublished, for inspection.
+
+    Published events are kept for 'retention' seconds, for replays (see
+    briefy.common.event.replay), then deleted, in batches, at most once every
+    'purge_interval' seconds.
+    """
+
+    name = 'outbox.relay'
+    run_interval = 1
+
+    max_run_interval = 10
+    """Ceiling for the idle interval."""
+
+    batch_size = 100
+    """Maximum number of events published on each call to process."""
+
+    max_attempts = 5
+    """Number of attempts to publish an event before giving up on it."""
+
+    retention = 7 * 24 * 3600
+    """Seconds published events are kept. 0 keeps them forever."""
+
+    purge_interval = 3600
+    """Minimum seconds between two purges of published events."""
+
+    purge_batch_size = 1000
+    """Maximum number of events deleted by each statement of a purge."""
+
+    _next_purge = 0
+
+    def __init__(
+            self,
+            session_factory: t.Callable[[], Session],
+            queue,
+            logger_=None,
+            run_interval=None,
+            batch_size=None,
+            max_run_interval=None,
+            metrics=None,
+            retention=None
+    ):
+        """Initialize the worker.
+
+        :param session_factory: Callable returning a database session, i.e. a sessionmaker
+        :param queue: Queue to publish the events to, usually the events queue
+        :param logger_: The logger instance to use or None
+        :param run_interval: Minimum time ellapsed between sucessive calls to 'process'
+        :param batch_size: Maximum number of events published on each call to process
+        :param max_run_interval: Ceiling for the idle interval
+        :param metrics: Metrics sink, defaults to the configured one
+        :param retention: Seconds published events are kept, defaults to the class attribute
+        """
+        if queue is None:
+            raise ValueError('Outbox relay worker needs a queue')
+        self.session_factory = session_factory
+        self.queue = queue
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if retention is not None:
+            self.retention = retention
+        super().__init__(
+            logger_=logger_,
+            run_interval=run_interval,
+            max_run_interval=max_run_interval,
+            metrics=metrics
+        )
+
+    def pending(self, session: Session) -> t.List[OutboxEvent]:
+        """Lock and return the next batch of events to be published."""
+        query = session.query(OutboxEvent).filter(
+            OutboxEvent.published_at.is_(None),
+            OutboxEvent.attempts < self.max_attempts,
+        ).order_by(
+            OutboxEvent.created_at, OutboxEvent.id
+        ).limit(self.batch_size)
+        return query.with_for_update(skip_locked=True).all()
+
+    def _load(self, schema, event: OutboxEvent) -> t.Optional[dict]:
+        """Deserialize and validate the body of an event, None if it is not valid."""
+        try:
+            return schema.deserialize(json.loads(event.body))
+        except (ValueError, colander.Invalid) as exc:
+            self.logger.error(
+                f'Invalid event {event.event_name} in the outbox: {exc}',
+                extra={'outbox_id': event.id}
+            )
+
+    def _write(self, queue, bodies: t.List[dict]) -> t.List[str]:
+        """Write bodies to the queue, one at a time if the batch fails.
+
+        :returns: List with the message id of each body, empty if it was not written
+        """
+        try:
+            # bodies were validated by the queue schema
+            return queue.write_messages(bodies, trusted=True)
+        except Exception as exc:
+            self.logger.error(f'Failed to write {len(bodies)} events from the outbox: {exc}')
+            if len(bodies) == 1:
+                return ['']
+        return [self._write(queue, [body])[0] for body in bodies]
+
+    def publish(self, events: t.List[OutboxEvent]) -> int:
+        """Write events to the queue, marking the ones sent as published.
+
+        :param events: Events, in publishing order
+        :returns: Number of events published
+        """
+        queue = self.queue
+        schema = get_schema(queue.schema)
+        bodies = [self._load(schema, event) for event in events]
+        valid = [body for body in bodies if body is not None]
+        sent = iter(self._write(queue, valid) if valid else ())
+        now = datetime_utcnow()
+        published = 0
+        for event, body in zip(events, bodies):
+            event.attempts += 1
+            message_id = next(sent) if body is not None else ''
+            if message_id:
+                event.published_at = now
+                event.message_id = message_id
+                published += 1
+            else:
+                self.logger.error(
+                    f'Event {event.event_name} not published from the outbox',
+                    extra={'outbox_id': event.id, 'attempts': event.attempts}
+                )
+        return published
+
+    def purge(self, session: Session) -> int:
+        """Delete the events published more than 'retention' seconds ago.
+
+        :returns: Number of events deleted
+        """
+        cutoff = datetime_utcnow() - timedelta(seconds=self.retention)
+        purged = 0
+        while True:
+            ids = [row[0] for row in session.query(OutboxEvent.id).filter(
+                OutboxEvent.published_at < cutoff
+            ).limit(self.purge_batch_size)]
+            if ids:
+                session.query(OutboxEvent).filter(
+                    OutboxEvent.id.in_(ids)
+                ).delete(synchronize_session=False)
+                session.commit()
+                purged += len(ids)
+            if len(ids) < self.purge_batch_size:
+                return purged
+
+    def maybe_purge(self):
+        """Purge published events when purge_interval elapsed. Errors are logged."""
+        now = time.monotonic()
+        if not self.retention or now < self._next_purge:
+            return
+        self._next_purge = now + self.purge_interval
+        session = self.session_factory()
+        try:
+            purged = self.purge(session)
+        except Exception:
+            session.rollback()
+            self.logger.exception('Failed to purge published events from the outbox')
+            return
+        finally:
+            session.close()
+        if purged:
+            self.incr('outbox.purged', purged)
+            self.logger.info(f'Purged {purged} published events from the outbox')
+
+    def process(self) -> int:
+        """Publish a batch of pending events.
+
+        :returns: Number of events published
+        """
+        session = self.session_factory()
+        try:
+            events = self.pending(session)
+            published = self.publish(events) if events else 0
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        if published:
+            self.incr('messages.processed', published)
+        if len(events) > published:
+            self.incr('messages.failed', len(events) - published)
+        self.maybe_purge()
+        return published
@@ -1,32 +1,284 @@
 """Briefy base worker."""
+from briefy.common.utils.metrics import get_metrics_sink
+from briefy.common.worker.base import logger
 from briefy.common.worker.base import Worker
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+import time
+
+
+POOLS = {
+    'thread': ThreadPoolExecutor,
+    'process': ProcessPoolExecutor,
+}
 
 
 class QueueWorker(Worker):
-    """Base class for workers using a Queue."""
+    """Base class for workers using a Queue.
+
+    By default messages are processed sequentially, in the polling thread.
+    Setting 'concurrency' dispatches them to a pool of threads (or processes,
+    see 'pool') instead. In both modes, while messages are being processed
+    their visibility timeout is extended, and successfully processed messages
+    are deleted in batches once the received batch is done (or, sequentially,
+    before extending the visibility of the remaining ones).
+
+    With 'preserve_order', messages sharing the same group key (see
+    'message_group_key') are processed one after the other, in the order they
+    were received; a failure skips the remaining messages of the group, so
+    they are delivered again, in order.
+
+    With an 'idempotency_store', messages whose key (see 'idempotency_key')
+    was already processed by a worker with the same name are deleted without
+    calling 'process_message', as are repeated keys within a received batch.
+
+    Process pools pickle the worker and the messages: the input queue, the
+    logger and the idempotency store are not available in the child processes.
+
+    Queues are expected to provide the batch methods of IQueue (get_messages
+    with num_messages and wait_time, delete_messages and change_visibility).
+    For queues without 'delete_messages', get_messages is called without
+    arguments and messages are deleted one by one, as before.
+
+    Besides the Worker metrics, messages received, processed and failed are
+    counted, as are skipped duplicates ('messages.duplicate'), and the time to
+    receive messages ('receive') and to process each message ('message') is
+    recorded. Empty polls count as idle time.
+    """
 
     name = ''
     input_queue = None
     run_interval = None
 
-    def __init__(self, input_queue, logger_=None, run_interval=.5):
-        """Initialize the worker."""
-        super().__init__(logger_, run_interval)
+    batch_size = 10
+    """Maximum number of messages received on each call to process (SQS caps it at 10)."""
+
+    wait_time = 20
+    """Seconds to wait for messages when the queue is empty (long polling, up to 20).
+
+    A worker stops once its current call to 'process' returns, so an idle worker
+    can take up to wait_time seconds to stop. 0 disables long polling.
+    """
+
+    concurrency = 0
+    """Number of messages processed in parallel. 0 processes them sequentially."""
+
+    pool = 'thread'
+    """Pool used to process messages in parallel: 'thread' or 'process'."""
+
+    preserve_order = False
+    """Process messages with the same group key sequentially, in the received order."""
+
+    visibility_timeout = 30
+    """Seconds messages stay hidden from other consumers after being extended."""
+
+    idempotency_store = None
+    """Store of processed keys, see briefy.common.worker.idempotency. None disables it."""
+
+    _executor = None
+
+    def __init__(
+            self,
+            input_queue,
+            logger_=None,
+            run_interval=.5,
+            batch_size=None,
+            wait_time=None,
+            concurrency=None,
+            pool=None,
+            max_run_interval=None,
+            metrics=None,
+            idempotency_store=None
+    ):
+        """Initialize the worker.
+
+        :param input_queue: Queue to receive messages from
+        :param logger_: The logger instance to use or None
+        :param run_interval: Minimum time ellapsed between sucessive calls to 'process'
+        :param batch_size: Messages received per call, defaults to the class attribute
+        :param wait_time: Long polling wait time, defaults to the class attribute
+        :param concurrency: Messages processed in parallel, defaults to the class attribute
+        :param pool: Pool type ('thread' or 'process'), defaults to the class attribute
+        :param max_run_interval: Ceiling for the idle interval, defaults to the class attribute
+        :param metrics: Metrics sink, defaults to the configured one
+        :param idempotency_store: Store of processed keys, defaults to the class attribute
+        """
+        super().__init__(logger_, run_interval, max_run_interval, metrics)
         self.input_queue = input_queue
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if wait_time is not None:
+            self.wait_time = wait_time
+        if concurrency is not None:
+            self.concurrency = concurrency
+        if pool is not None:
+            self.pool = pool
+        if idempotency_store is not None:
+            self.idempotency_store = idempotency_store
+        if self.pool not in POOLS:
+            raise ValueError('Unknown pool type: {0}'.format(self.pool))
         queue = self.input_queue
         if not queue:
             raise ValueError('Queue Worker must have a queue')
 
+    def __getstate__(self):
+        """Return the state to pickle, used to send the worker to a process pool."""
+        state = self.__dict__.copy()
+        for name in ('input_queue', 'logger', 'metrics', '_executor', 'idempotency_store'):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        """Restore the worker state in a process pool."""
+        self.__dict__.update(state)
+        self.logger = logger
+        self.metrics = get_metrics_sink()
+
+    @property
+    def _batch_api(self):
+        """Whether the input queue has the batch methods of IQueue."""
+        return hasattr(self.input_queue, 'delete_messages')
+
+    @property
+    def executor(self):
+        """Return the pool used to process messages in parallel."""
+        executor = self._executor
+        if executor is None:
+            executor = self._executor = POOLS[self.pool](max_workers=self.concurrency)
+        return executor
+
     def get_messages(self):
         """Get messages from self.input_queue.
 
         :returns: A list of boto3.resources.factory.sqs.Message objects
         :rtype: list
         """
-        messages = self.input_queue.get_messages()
+        queue = self.input_queue
+        start = time.monotonic()
+        if self._batch_api:
+            messages = queue.get_messages(num_messages=self.batch_size, wait_time=self.wait_time)
+        else:
+            messages = queue.get_messages()
+        elapsed = time.monotonic() - start
+        self.timing('receive', elapsed)
+        if messages:
+            self.incr('messages.received', len(messages))
+        else:
+            self.idle(elapsed)
         self.logger.debug('Got {0} messages'.format(len(messages)))
         return messages
 
+    def delete_messages(self, messages):
+        """Acknowledge processed messages, deleting them from self.input_queue.
+
+        :param messages: List of processed messages
+        :type messages: list
+        """
+        if not messages:
+            return
+        if self._batch_api:
+            not_deleted = self.input_queue.delete_messages(messages)
+        else:
+            not_deleted = []
+            for message in messages:
+                try:
+                    message.delete()
+                except Exception:
+                    self.logger.exception('Failed to delete message')
+                    not_deleted.append(message)
+        if not_deleted:
+            self.logger.info('{0} messages were not deleted'.format(len(not_deleted)))
+
+    def extend_visibility(self, messages):
+        """Keep messages still being processed hidden from other consumers.
+
+        :param messages: List of messages being processed
+        :type messages: list
+        """
+        if not hasattr(self.input_queue, 'change_visibility'):
+            return
+        try:
+            self.input_queue.change_visibility(messages, self.visibility_timeout)
+        except Exception:
+            self.logger.exception('Failed to extend the visibility timeout of messages')
+
+    def message_group_key(self, message):
+        """Return the key of the group a message belongs to, used by preserve_order.
+
+        Defaults to the SQS MessageGroupId attribute (FIFO queues) or to the
+        'guid' in the message body.
+
+        :param message: A message from the queue
+        :returns: The group key, or None for messages without group
+        """
+        try:
+            raw_message = message.message
+        except (AttributeError, ValueError):
+            raw_message = None
+        attributes = getattr(raw_message, 'attributes', None) or {}
+        group = attributes.get('MessageGroupId')
+        if not group:
+            body = message.body
+            group = body.get('guid') if isinstance(body, dict) else None
+        return group
+
+    def idempotency_key(self, message):
+        """Return the key identifying a message in the idempotency store.
+
+        Defaults to the event 'id' in the message body, prefixed by the worker
+        name: the same event can be consumed by several workers.
+
+        :param message: A message from the queue
+        :returns: The key, or None for messages that are always processed
+        """
+        body = message.body
+        event_id = body.get('id') if isinstance(body, dict) else None
+        return '{0}:{1}'.format(self.name, event_id) if event_id else None
+
+    def _skip_duplicates(self, messages):
+        """Split messages between the ones to process and the ones already processed.
+
+        :param messages: List of messages
+        :returns: Tuple with the lists of messages to process and of duplicates
+        :rtype: tuple
+        """
+        store = self.idempotency_store
+        if store is None or not messages:
+            return messages, []
+        keys = [self.idempotency_key(message) for message in messages]
+        seen = store.seen({key for key in keys if key is not None})
+        pending = []
+        duplicates = []
+        for message, key in zip(messages, keys):
+            if key is not None and key in seen:
+                duplicates.append(message)
+            else:
+                pending.append(message)
+                if key is not None:
+                    seen.add(key)
+        if duplicates:
+            self.incr('messages.duplicate', len(duplicates))
+            self.logger.info('Skipped {0} messages already processed'.format(len(duplicates)))
+        return pending, duplicates
+
+    def _mark_processed(self, messages):
+        """Record processed messages in the idempotency store.
+
+        :param messages: List of processed messages
+        """
+        store = self.idempotency_store
+        if store is None:
+            return
+        keys = [self.idempotency_key(message) for message in messages]
+        keys = [key for key in keys if key is not None]
+        if keys:
+            try:
+                store.add(keys)
+            except Exception:
+                self.logger.exception('Failed to record processed messages')
+
     def process_message(self, message):
         """Process a message retrieved from the input_queue.
 
@@ -38,12 +290,154 @@ class QueueWorker(Worker):
         status = True
         return status
 
+    def _group_messages(self, messages):
+        """Split messages in groups to be processed in order.
+
+        :param messages: List of messages
+        :returns: List of lists of messages
+        """
+        if not self.preserve_order:
+            return [[message] for message in messages]
+        groups = {}
+        result = []
+        for message in messages:
+            key = self.message_group_key(message)
+            if key is None:
+                result.append([message])
+            elif key in groups:
+                groups[key].append(message)
+            else:
+                groups[key] = [message]
+                result.append(groups[key])
+        return result
+
+    def _record_message(self, status, elapsed):
+        """Record the outcome of processing a message.
+
+        :param status: Whether the message was processed
+        :param elapsed: Processing time in seconds, or None if it was skipped
+        """
+        if elapsed is not None:
+            self.timing('message', elapsed)
+        if status:
+            self.incr('messages.processed')
+        else:
+            self.incr('messages.failed')
+            self.logger.info('Message was not deleted')
+
+    def _process_group(self, messages):
+        """Process a group of messages, in order.
+
+        This runs in the pool, so exceptions are logged and count as failures.
+        With preserve_order, a failure skips the remaining messages of the group.
+
+        :param messages: List of messages
+        :returns: List with the status and processing time of each message
+        :rtype: list
+        """
+        results = []
+        for message in messages:
+            start = time.monotonic()
+            try:
+                status = bool(self.process_message(message))
+            except Exception:
+                self.logger.exception('{0}: Error processing message'.format(self.name))
+                status = False
+            results.append((status, time.monotonic() - start))
+            if not status and self.preserve_order:
+                break
+        results.extend([(False, None)] * (len(messages) - len(results)))
+        return results
+
+    def _process_concurrently(self, messages):
+        """Dispatch messages to the pool and wait for them to be processed.
+
+        :param messages: List of messages
+        :returns: List of successfully processed messages
+        :rtype: list
+        """
+        executor = self.executor
+        futures = {
+            executor.submit(self._process_group, group): group
+            for group in self._group_messages(messages)
+        }
+        processed = []
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=self.visibility_timeout / 2)
+            for future in done:
+                group = futures[future]
+                try:
+                    results = future.result()
+                except Exception:
+                    self.logger.exception('{0}: Error processing messages'.format(self.name))
+                    results = [(False, None)] * len(group)
+                for message, (status, elapsed) in zip(group, results):
+                    self._record_message(status, elapsed)
+                    if status:
+                        processed.append(message)
+            if pending:
+                self.extend_visibility([message for f in pending for message in futures[f]])
+        return processed
+
+    def _process_sequentially(self, messages, processed):
+        """Process messages one after the other, in the polling thread.
+
+        Every visibility_timeout / 2 seconds, the messages processed so far are
+        deleted and the visibility timeout of the remaining ones is extended,
+        so they are not delivered again while the batch is being processed.
+
+        :param messages: List of messages
+        :param processed: List where processed messages not deleted yet are added
+        """
+        checkpoint = time.monotonic()
+        for position, message in enumerate(messages):
+            start = time.monotonic()
+            if start - checkpoint >= self.visibility_timeout / 2:
+                self._mark_processed(processed)
+                self.delete_messages(processed)
+                del processed[:]
+                self.extend_visibility(messages[position:])
+                checkpoint = start
+            try:
+                status = self.process_message(message)
+            except Exception:
+                self._record_message(False, time.monotonic() - start)
+                raise
+            # TODO: Improve error handling here
+            self._record_message(status, time.monotonic() - start)
+            if status:
+                processed.append(message)
+
     def process(self):
-        """Run tasks on this worker."""
+        """Run tasks on this worker.
+
+        Successfully processed messages, and the ones skipped as duplicates,
+        are deleted in a single batch request.
+
+        :returns: Number of messages received
+        :rtype: int
+        """
         messages = self.get_messages()
-        for message in messages:
-            if self.process_message(message):
-                message.delete()
+        processed = []
+        duplicates = []
+        try:
+            pending, duplicates = self._skip_duplicates(messages)
+            if self.concurrency:
+                processed = self._process_concurrently(pending)
             else:
-                # TODO: Improve error handling here
-                self.logger.info('Message was not deleted')
+                self._process_sequentially(pending, processed)
+        finally:
+            self._mark_processed(processed)
+            self.delete_messages(processed + duplicates)
+        return len(messages)
+
+    def __call__(self):
+        """Execute the worker, shutting down the pool when it stops."""
+        try:
+            super().__call__()
+        finally:
+            executor = self._executor
+            if executor is not None:
+                self._executor = None
+                executor.shutdown()
@@ -0,0 +1,284 @@
+"""Run a worker in several processes, restarting the ones that crash.
+
+Each child process calls a factory returning a configured worker instance and
+runs it until it is stopped::
+
+    briefy.worker_supervisor briefy.leica.worker:create_worker --processes 4
+
+SIGTERM and SIGINT received by the supervisor are propagated, as SIGTERM, to
+all children, which stop after their current call to 'process'.
+"""
+from briefy.common.log import logger
+from briefy.common.utils.imports import resolve
+from queue import Empty
+
+import argparse
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import typing as t
+
+
+STATS_KEYS = ('runs', 'items', 'errors')
+
+
+def _report_stats(worker, index: int, stats_queue, interval: float, done: threading.Event):
+    """Send the worker stats to the supervisor every interval seconds."""
+    while not done.wait(interval):
+        stats_queue.put((index, os.getpid(), dict(worker.stats)))
+
+
+def run_child(factory: t.Callable, index: int, stats_queue, stats_interval: float):
+    """Create and run a worker in a child process.
+
+    :param factory: Callable returning a worker instance.
+    :param index: Position of this child in the supervisor.
+    :param stats_queue: Queue used to report the worker stats.
+    :param stats_interval: Seconds between two stats reports.
+    """
+    # the supervisor propagates interruptions as SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker = factory()
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    done = threading.Event()
+    reporter = threading.Thread(
+        target=_report_stats, args=(worker, index, stats_queue, stats_interval, done), daemon=True
+    )
+    reporter.start()
+    try:
+        worker()
+    finally:
+        done.set()
+        stats_queue.put((index, os.getpid(), dict(worker.stats)))
+
+
+class Child:
+    """A worker process managed by the supervisor."""
+
+    def __init__(self, index: int):
+        """Initialize the child slot.
+
+        :param index: Position of this child in the supervisor.
+        """
+        self.index = index
+        self.process = None
+        self.started_at = None
+        self.restart_at = None
+        self.failures = 0
+
+    @property
+    def alive(self) -> bool:
+        """Whether the child process is running."""
+        return self.process is not None and self.process.is_alive()
+
+
+class Supervisor:
+    """Fork and supervise worker processes.
+
+    Children exiting with an error are restarted after a delay, starting at
+    'restart_backoff' seconds and doubling on each consecutive failure up to
+    'max_restart_backoff'. A child running for longer than 'max_restart_backoff'
+    resets its delay. Children exiting cleanly are not restarted: the
+    supervisor returns once no child is left.
+    """
+
+    restart_backoff = 1
+    max_restart_backoff = 60
+    stats_interval = 60
+    shutdown_timeout = 30
+    check_interval = 0.5
+
+    def __init__(
+            self,
+            factory: t.Callable,
+            processes: t.Optional[int]=None,
+            name: str='',
+            logger_=None,
+            **kwargs
+    ):
+        """Initialize the supervisor.
+
+        :param factory: Picklable callable returning a worker instance, called in each child.
+        :param processes: Number of child processes, defaults to the number of CPUs.
+        :param name: Name used in log messages, defaults to the factory name.
+        :param logger_: The logger instance to use or None
+        :param kwargs: Overrides for the class attributes (restart_backoff, stats_interval...)
+        """
+        self.factory = factory
+        self.processes = processes or os.cpu_count() or 1
+        self.name = name or getattr(factory, '__name__', str(factory))
+        self.logger = logger_ if logger_ else logger
+        for key, value in kwargs.items():
+            if not hasattr(self.__class__, key):
+                raise TypeError('Unknown supervisor option: {0}'.format(key))
+            setattr(self, key, value)
+        self.context = multiprocessing.get_context()
+        self.stats_queue = self.context.Queue()
+        self.children = [Child(index) for index in range(self.processes)]
+        self.restarts = 0
+        self.running = False
+        self._snapshots = {}
+        self._last_report = None
+        self._last_items = 0
+
+    def stop(self, *args):
+        """Stop the supervisor and its children. Can be used as a signal handler."""
+        self.running = False
+
+    def start_child(self, child: Child):
+        """Start the process of a child slot."""
+        process = self.context.Process(
+            target=run_child,
+            args=(self.factory, child.index, self.stats_queue, self.stats_interval),
+            name='{0}-{1}'.format(self.name, child.index),
+        )
+        process.start()
+        child.process = process
+        child.started_at = time.monotonic()
+        child.restart_at = None
+        self.logger.info('{0}: started worker {1} (pid {2})'.format(
+            self.name, child.index, process.pid
+        ))
+
+    def collect_stats(self, timeout: float=0):
+        """Read the stats reported by the children.
+
+        Reports are cumulative, so only the last one of each process is kept.
+
+        :param timeout: Seconds to wait for the first report.
+        """
+        while True:
+            try:
+                _, pid, stats = self.stats_queue.get(timeout=timeout)
+            except Empty:
+                return
+            timeout = 0
+            self._snapshots[pid] = stats
+
+    def totals(self) -> dict:
+        """Return the stats aggregated over all children, past and present."""
+        totals = dict.fromkeys(STATS_KEYS, 0)
+        for stats in self._snapshots.values():
+            for key in STATS_KEYS:
+                totals[key] += stats.get(key, 0)
+        totals['restarts'] = self.restarts
+        totals['alive'] = len([child for child in self.children if child.alive])
+        return totals
+
+    def report(self):
+        """Log the aggregated throughput of the children."""
+        now = time.monotonic()
+        totals = self.totals()
+        elapsed = now - self._last_report if self._last_report else 0
+        rate = (totals['items'] - self._last_items) / elapsed if elapsed else 0.0
+        self._last_report = now
+        self._last_items = totals['items']
+        self.logger.info(
+            '{0}: {alive} workers alive, {runs} runs, {items} items ({rate:.1f}/s), '
+            '{errors} errors, {restarts} restarts'.format(self.name, rate=rate, **totals)
+        )
+
+    def _reap(self, child: Child):
+        """Handle a child process that exited."""
+        exitcode = child.process.exitcode
+        child.process = None
+        if exitcode == 0:
+            self.logger.info('{0}: worker {1} exited'.format(self.name, child.index))
+            return
+        if time.monotonic() - child.started_at > self.max_restart_backoff:
+            child.failures = 0
+        delay = min(self.restart_backoff * 2 ** child.failures, self.max_restart_backoff)
+        child.failures += 1
+        child.restart_at = time.monotonic() + delay
+        self.logger.error('{0}: worker {1} exited with code {2}, restarting in {3}s'.format(
+            self.name, child.index, exitcode, delay
+        ))
+
+    def _check_children(self):
+        """Reap exited children and restart the crashed ones when due."""
+        now = time.monotonic()
+        for child in self.children:
+            if child.process is not None and not child.process.is_alive():
+                self._reap(child)
+            if child.process is None and child.restart_at is not None and now >= child.restart_at:
+                self.restarts += 1
+                self.start_child(child)
+
+    def _pending(self) -> bool:
+        """Whether a child is running or waiting to be restarted."""
+        return any(child.process is not None or child.restart_at is not None
+                   for child in self.children)
+
+    def shutdown(self):
+        """Send SIGTERM to the children and wait for them, killing the ones that hang."""
+        alive = [child for child in self.children if child.alive]
+        for child in alive:
+            child.process.terminate()
+        deadline = time.monotonic() + self.shutdown_timeout
+        for child in alive:
+            child.process.join(max(deadline - time.monotonic(), 0))
+            if child.process.is_alive():
+                self.logger.error('{0}: killing worker {1}'.format(self.name, child.index))
+                os.kill(child.process.pid, signal.SIGKILL)
+                child.process.join()
+        for child in self.children:
+            if child.process is not None:
+                self._reap(child)
+            child.restart_at = None
+
+    def _add_signal_handlers(self) -> dict:
+        """Stop on SIGTERM and SIGINT. Only possible in the main thread."""
+        previous = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                previous[signum] = signal.signal(signum, self.stop)
+        return previous
+
+    def __call__(self) -> dict:
+        """Run the children until stopped or until all of them exit cleanly.
+
+        :returns: Aggregated stats
+        """
+        self.logger.info('{0}: starting {1} workers'.format(self.name, self.processes))
+        self.running = True
+        previous = self._add_signal_handlers()
+        self._last_report = time.monotonic()
+        try:
+            for child in self.children:
+                self.start_child(child)
+            next_report = time.monotonic() + self.stats_interval
+            while self.running and self._pending():
+                self.collect_stats(timeout=self.check_interval)
+                self._check_children()
+                if time.monotonic() >= next_report:
+                    next_report = time.monotonic() + self.stats_interval
+                    self.report()
+        finally:
+            self.shutdown()
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.collect_stats()
+        self.report()
+        return self.totals()
+
+
+def main(argv: t.Optional[t.Sequence[str]]=None):
+    """Run the supervisor from the command line."""
+    parser = argparse.ArgumentParser(description='Run a worker in several processes.')
+    parser.add_argument(
+        'factory', help='Callable returning a worker instance, as package.module:callable'
+    )
+    parser.add_argument(
+        '--processes', type=int, default=None, help='Number of processes, defaults to CPUs'
+    )
+    parser.add_argument(
+        '--stats-interval', type=float, default=Supervisor.stats_interval,
+        help='Seconds between throughput reports'
+    )
+    args = parser.parse_args(argv)
+    supervisor = Supervisor(
+        resolve(args.factory), processes=args.processes, stats_interval=args.stats_interval
+    )
+    supervisor()
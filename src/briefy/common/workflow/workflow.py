@@ -404,16 +404,21 @@ class BriefyWorkflow(Workflow):
         # Fire event
         wf_transition_event = WorkflowTransitionEvent(self.document, request, transition, user)
 
+        event = None
         update_event = self.update_event
         if update_event and request:
             event = update_event(obj, request)
             # this will clear any cache before notify transition
             request.registry.notify(event)
-            # also execute the event to dispatch to sqs if needed
-            event()
 
         # Notify using zope.event
         notify(wf_transition_event)
 
+        if event is not None:
+            # serialize the object only once for both events, after all subscribers ran
+            wf_transition_event.share_data(event)
+            # also execute the event to dispatch to sqs if needed
+            event()
+
         wf_transition_event()
         super()._notify(transition)
@@ -0,0 +1,70 @@
+"""Test MetricsProxy cache backend proxy."""
+from briefy.common.cache import key_namespace
+from briefy.common.cache import MetricsProxy
+from briefy.common.utils.metrics import MemorySink
+from dogpile.cache import make_region
+
+
+KEY = 'DummyCache.to_dict-6b6f0b2a-25ed-401c-8c65-3d4009e398ea'
+
+
+def make_cache_region(sink, **kwargs):
+    """Create a memory region wrapped by a MetricsProxy."""
+    return make_region().configure(
+        'dogpile.cache.memory',
+        wrap=[MetricsProxy(sink, **kwargs)]
+    )
+
+
+def test_key_namespace():
+    assert key_namespace(KEY) == 'DummyCache.to_dict'
+    assert key_namespace('foo') == 'foo'
+
+
+def test_metrics_proxy_records_hit_and_miss():
+    sink = MemorySink()
+    region = make_cache_region(sink)
+
+    region.get(KEY)
+    region.set(KEY, {'title': 'Dummy Cache Item'})
+    region.get(KEY)
+    region.get(KEY)
+
+    snapshot = sink.snapshot()
+    assert snapshot['counters'] == {
+        'cache.DummyCache.to_dict.miss': 1,
+        'cache.DummyCache.to_dict.hit': 2,
+    }
+    histograms = snapshot['histograms']
+    assert histograms['cache.DummyCache.to_dict.get']['count'] == 3
+    assert histograms['cache.DummyCache.to_dict.set']['count'] == 1
+    assert histograms['cache.DummyCache.to_dict.size']['min'] > 0
+
+
+def test_metrics_proxy_multi():
+    sink = MemorySink()
+    region = make_cache_region(sink)
+    other = 'DummyCache.to_listing_dict-6b6f0b2a-25ed-401c-8c65-3d4009e398ea'
+
+    region.set_multi({KEY: 1})
+    region.get_multi([KEY, other])
+
+    snapshot = sink.snapshot()
+    assert snapshot['counters'] == {
+        'cache.DummyCache.to_dict.hit': 1,
+        'cache.DummyCache.to_listing_dict.miss': 1,
+    }
+    assert snapshot['histograms']['cache.set_multi']['count'] == 1
+    assert snapshot['histograms']['cache.get_multi']['count'] == 1
+
+
+def test_metrics_proxy_samples_sizes():
+    sink = MemorySink()
+    region = make_cache_region(sink, size_sample_rate=4)
+
+    for value in range(10):
+        region.set(KEY, value)
+
+    histograms = sink.snapshot()['histograms']
+    assert histograms['cache.DummyCache.to_dict.set']['count'] == 10
+    assert histograms['cache.DummyCache.to_dict.size']['count'] == 3
@@ -0,0 +1,112 @@
+"""Test serialization_cache decorator."""
+from briefy.common.cache import serialization_cache
+from threading import Thread
+
+import pytest
+import time
+
+
+class Serializable:
+    """A model like object."""
+
+    delay = 0
+
+    def __init__(self, id):
+        self.id = id
+        self.calls = 0
+
+    @serialization_cache()
+    def to_dict(self, excludes: list=None, includes: list=None) -> dict:
+        self.calls += 1
+        time.sleep(self.delay)
+        return {'id': self.id, 'excludes': excludes, 'includes': includes}
+
+    @serialization_cache(expiration_time=0.05, stale_time=10)
+    def to_listing_dict(self) -> dict:
+        self.calls += 1
+        return {'id': self.id, 'calls': self.calls}
+
+
+@pytest.fixture
+def region(cache_manager):
+    """Create a fresh memory region."""
+    cache_manager._create_region()
+    return cache_manager.region()
+
+
+@pytest.mark.parametrize('enable_refresh', [False])
+@pytest.mark.parametrize('backend', ['dogpile.cache.memory'])
+class TestSerializationCache:
+    """Test serialization_cache decorator."""
+
+    def test_key_generator_includes_attributes(self, cache_manager):
+        obj = Serializable('6b6f0b2a-25ed-401c-8c65-3d4009e398ea')
+        generator = cache_manager.key_generator('', Serializable.to_dict.original)
+        key = 'Serializable.to_dict-6b6f0b2a-25ed-401c-8c65-3d4009e398ea'
+        assert generator(obj) == key
+        assert generator(obj, None, ['b', 'a']) == key + ':includes=a,b'
+        assert generator(obj, includes='a', excludes=['c']) == key + ':excludes=c:includes=a'
+
+    def test_value_is_cached(self, region):
+        obj = Serializable('6b6f0b2a-25ed-401c-8c65-3d4009e398ea')
+        first = obj.to_dict()
+        assert obj.to_dict() == first
+        assert obj.calls == 1
+
+        result = obj.to_dict(includes=['state_history'])
+        assert result['includes'] == ['state_history']
+        assert obj.to_dict(includes=['state_history']) == result
+        assert obj.calls == 2
+
+        Serializable.to_dict.invalidate(obj)
+        obj.to_dict()
+        assert obj.calls == 3
+
+    def test_concurrent_misses_compute_once(self, region):
+        obj = Serializable('c5b4b3a1-0f3e-4b0d-a6f8-1f7e5b2d1c3a')
+        obj.delay = 0.1
+        threads = [Thread(target=obj.to_dict) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert obj.calls == 1
+
+    def test_stale_value_is_returned_while_revalidating(self, region):
+        obj = Serializable('1e0a2f4c-9d1b-4a7e-8f3c-2b6d5e4a3c1b')
+        assert obj.to_listing_dict()['calls'] == 1
+        time.sleep(0.06)
+
+        assert obj.to_listing_dict()['calls'] == 1
+        for _ in range(100):
+            if obj.calls == 2:
+                break
+            time.sleep(0.01)
+        time.sleep(0.01)
+        assert obj.to_listing_dict()['calls'] == 2
+
+    def test_stale_value_is_read_once(self, region, monkeypatch):
+        obj = Serializable('5d1c0b2a-7e4f-4c3b-9a8d-6f5e4d3c2b1a')
+        obj.to_listing_dict()
+        time.sleep(0.06)
+        backend = region.backend
+        get = backend.get
+        keys = []
+        monkeypatch.setattr(backend, 'get', lambda key: keys.append(key) or get(key))
+        assert obj.to_listing_dict()['calls'] == 1
+        assert len(keys) == 1
+
+    def test_invalidated_stale_value_is_not_returned(self, region):
+        obj = Serializable('0c3e5a7b-1d2f-4e6a-8b9c-7d5f3e1a2b4c')
+        obj.to_listing_dict()
+        time.sleep(0.06)
+        region.invalidate()
+        assert obj.to_listing_dict()['calls'] == 2
+
+
+@pytest.mark.parametrize('enable_refresh', [False])
+@pytest.mark.parametrize('backend', ['dogpile.cache.redis'])
+def test_stale_time_is_limited_by_redis(cache_manager):
+    obj = Serializable('8a6c4e2f-0b1d-4f3a-9c5e-7b9d1f3a5c7e')
+    with pytest.raises(ValueError):
+        obj.to_listing_dict()
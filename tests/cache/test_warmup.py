@@ -0,0 +1,85 @@
+"""Test cache warm up."""
+from briefy.common.cache import serialization_cache
+from briefy.common.cache.warmup import Progress
+from briefy.common.cache.warmup import serialize_objects
+from briefy.common.cache.warmup import warm_up
+from conftest import DBSession
+from test_cache_manager import dummy_cache_data
+from test_cache_manager import dummy_cache_obj  # noQA
+from test_cache_manager import DummyCache
+
+import pytest
+
+
+class Serializable:
+    """A model like object."""
+
+    def __init__(self, id):
+        self.id = id
+        self.calls = 0
+
+    @serialization_cache()
+    def to_dict(self) -> dict:
+        self.calls += 1
+        return {'id': self.id}
+
+    def to_listing_dict(self) -> dict:
+        return {'id': self.id, 'listing': True}
+
+
+@pytest.mark.parametrize('enable_refresh', [False])
+@pytest.mark.parametrize('backend', ['dogpile.cache.memory'])
+def test_serialize_objects(cache_manager):
+    objs = [Serializable('1'), Serializable('2')]
+    mapping = serialize_objects(cache_manager, objs)
+
+    assert mapping == {
+        'Serializable.to_dict-1': {'id': '1'},
+        'Serializable.to_dict-2': {'id': '2'},
+        'Serializable.to_listing_dict-1': {'id': '1', 'listing': True},
+        'Serializable.to_listing_dict-2': {'id': '2', 'listing': True},
+    }
+
+    cache_manager._create_region()
+    cache_manager.region().set_multi(mapping)
+    assert objs[0].to_dict() == {'id': '1'}
+    # value comes from the cache, the original method was called only by the warm up
+    assert objs[0].calls == 1
+
+
+def test_progress():
+    progress = Progress('Order', total=10, report_interval=60)
+    progress.update(4, 12)
+    assert progress.done == 4
+    assert progress.keys == 12
+    assert progress.rate > 0
+    assert progress.eta > 0
+
+    progress.update(6, 18)
+    summary = progress.summary()
+    assert summary['done'] == summary['total'] == 10
+    assert summary['keys'] == 30
+    assert progress.eta == 0
+
+
+@pytest.mark.usefixtures('db_transaction')
+class TestWarmUp:
+    """Test warm_up with database objects."""
+
+    @pytest.mark.parametrize('enable_refresh', [False])
+    @pytest.mark.parametrize('backend', ['dogpile.cache.memory'])
+    def test_warm_up(self, cache_manager, dummy_cache_obj):  # noQA
+        cache_manager._create_region()
+        result = warm_up(
+            [DummyCache],
+            DBSession.session_factory,
+            manager=cache_manager,
+            states=['created'],
+            workers=1,
+        )
+        assert result['DummyCache']['done'] == 1
+        assert result['DummyCache']['keys'] == 3
+
+        region = cache_manager.region()
+        key = 'DummyCache.to_dict-{0}'.format(dummy_cache_data['id'])
+        assert region.get(key)['title'] == dummy_cache_data['title']
@@ -0,0 +1,148 @@
+"""Tests for `briefy.common.event.buffer`."""
+from briefy.common.db import Base
+from briefy.common.db.mixins import Identifiable
+from briefy.common.db.mixins import Timestamp
+from briefy.common.event import BaseEvent
+from briefy.common.event.buffer import EventBuffer
+from briefy.common.event.buffer import get_buffer
+from briefy.common.queue.event import Queue
+from briefy.common.users import SystemUser
+from conftest import MockLogger
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import pytest
+import sqlalchemy as sa
+
+
+class BufferModel(Identifiable, Timestamp, Base):
+    """A model firing events."""
+
+    __tablename__ = 'buffer_models'
+    name = sa.Column(sa.String(255))
+
+
+class LocalQueue(Queue):
+    """Events queue using an in memory local backend, counting send requests."""
+
+    backend = 'local'
+    local_path = ':memory:'
+    requests = 0
+
+    def _send_batch(self, entries, message_ids):
+        """Count batch requests."""
+        self.requests += 1
+        super()._send_batch(entries, message_ids)
+
+    def read_all(self):
+        """Return the bodies of all messages in the queue."""
+        bodies = []
+        while True:
+            messages = self.get_messages(num_messages=10)
+            if not messages:
+                return bodies
+            bodies.extend(m.body for m in messages)
+            self.delete_messages(messages)
+
+
+@pytest.fixture
+def queue():
+    """Return an events queue."""
+    return LocalQueue()
+
+
+@pytest.fixture
+def session():
+    """Return a session bound to a SQLite database."""
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine, tables=[BufferModel.__table__])
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def event_class(queue, coalesce=False):
+    """Return a deferred event class writing to queue."""
+    class BufferModelUpdated(BaseEvent):
+        event_name = 'buffermodel.updated'
+        deferred = True
+
+        @property
+        def queue(self):
+            return queue
+
+    BufferModelUpdated.coalesce = coalesce
+    return BufferModelUpdated
+
+
+def create(session, name):
+    """Create a BufferModel."""
+    obj = BufferModel(name=name)
+    session.add(obj)
+    session.flush()
+    return obj
+
+
+def test_events_are_written_after_commit(session, queue):
+    event = event_class(queue)
+    objs = [create(session, str(i)) for i in range(25)]
+    for obj in objs:
+        assert event(obj, actor=str(SystemUser.id))()
+    assert queue.read_all() == []
+
+    session.commit()
+    assert [body['data']['name'] for body in queue.read_all()] == [str(i) for i in range(25)]
+    assert queue.requests == 3
+    assert len(get_buffer(session)) == 0
+
+
+def test_events_are_discarded_on_rollback(session, queue):
+    event = event_class(queue)
+    event(create(session, 'a'), actor=str(SystemUser.id))()
+    session.rollback()
+    session.commit()
+    assert queue.read_all() == []
+
+
+def test_coalesce_updates(session, queue):
+    event = event_class(queue, coalesce=True)
+    first = create(session, 'first')
+    second = create(session, 'second')
+    event(first, actor=str(SystemUser.id))()
+    event(second, actor=str(SystemUser.id))()
+    first.name = 'first, updated'
+    session.flush()
+    event(first, actor=str(SystemUser.id))()
+    session.commit()
+    names = [body['data']['name'] for body in queue.read_all()]
+    assert names == ['second', 'first, updated']
+
+
+def test_flush_logs_errors():
+    class BrokenQueue(Queue):
+        def write_messages(self, messages=(), trusted=False):
+            raise RuntimeError('queue unavailable')
+
+    logger = MockLogger()
+    buffer = EventBuffer(logger_=logger)
+    buffer.add(BrokenQueue(), {'event_name': 'foo.bar', 'guid': '1'})
+    assert buffer.flush() == ['']
+    assert len(buffer) == 0
+
+
+def test_flush_logs_rejected_events():
+    class RejectingQueue(Queue):
+        def write_messages(self, messages=(), trusted=False):
+            return ['message-0', '']
+
+    class Logger(MockLogger):
+        def error(self, *args, **kw):
+            self.exception_messages.append(args[0])
+
+    logger = Logger()
+    buffer = EventBuffer(logger_=logger)
+    queue = RejectingQueue()
+    buffer.add(queue, {'event_name': 'foo.bar', 'guid': '1'})
+    buffer.add(queue, {'event_name': 'foo.baz', 'guid': '2'})
+    assert buffer.flush() == ['message-0', '']
+    assert logger.exception_messages == ['1 events not fired. Rejected by the queue']
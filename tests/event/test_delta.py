@@ -0,0 +1,127 @@
+"""Tests for delta event payloads."""
+from briefy.common.db import Base
+from briefy.common.db.mixins import Identifiable
+from briefy.common.db.mixins import Timestamp
+from briefy.common.event import BaseEvent
+from briefy.common.event import DELTA_KEY
+from briefy.common.event.delta import changed_attributes
+from briefy.common.event.delta import CHANGES_KEY
+from briefy.common.event.delta import track_changes
+from sqlalchemy import create_engine
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import sessionmaker
+
+import pytest
+import sqlalchemy as sa
+
+
+class DeltaModel(Identifiable, Timestamp, Base):
+    """A model with a private column exposed by a property."""
+
+    __tablename__ = 'delta_models'
+    __exclude_attributes__ = ['secret']
+
+    name = sa.Column(sa.String(255))
+    description = sa.Column(sa.Text)
+    secret = sa.Column(sa.String(255))
+    _title = sa.Column('title', sa.String(255))
+
+    @property
+    def title(self):
+        """Title of the object."""
+        return self._title
+
+
+class DeltaModelUpdated(BaseEvent):
+    """A DeltaModel was updated."""
+
+    event_name = 'deltamodel.updated'
+    delta = True
+
+
+@pytest.fixture
+def session():
+    """Return a tracked session bound to a SQLite database, with a committed object."""
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine, tables=[DeltaModel.__table__])
+    factory = sessionmaker(bind=engine)
+    track_changes(factory)
+    session = factory()
+    session.add(DeltaModel(name='foo', description='x' * 1000, _title='Foo'))
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_new_objects_are_sent_in_full(session):
+    obj = DeltaModel(name='bar', description='y')
+    session.add(obj)
+    session.flush()
+    assert changed_attributes(obj) is None
+    data = DeltaModelUpdated(obj).data
+    assert DELTA_KEY not in data
+    assert data['description'] == 'y'
+
+
+def test_only_changed_attributes_are_sent(session):
+    obj = session.query(DeltaModel).one()
+    obj.name = 'changed'
+    session.flush()
+    obj._title = 'Changed'
+    obj.secret = 'not sent'
+
+    data = DeltaModelUpdated(obj).data
+    assert data[DELTA_KEY] == ['name', 'title']
+    assert data['id'] == obj.id
+    assert data['name'] == 'changed'
+    assert data['title'] == 'Changed'
+    assert 'description' not in data
+    assert 'secret' not in data
+
+
+def test_changes_are_cleared_on_commit(session):
+    obj = session.query(DeltaModel).one()
+    obj.name = 'changed'
+    session.commit()
+    assert changed_attributes(obj) == set()
+    assert DeltaModelUpdated(obj).data == {'id': obj.id, DELTA_KEY: []}
+
+
+def test_snapshot_every_n_versions(session):
+    obj = session.query(DeltaModel).one()
+    obj.name = 'changed'
+    session.flush()
+    event = DeltaModelUpdated(obj)
+    obj.version = 20
+    event.snapshot_every = 10
+    assert DELTA_KEY not in event.data
+    assert event.data['description'] == 'x' * 1000
+
+    event = DeltaModelUpdated(obj)
+    obj.version = 21
+    assert event.data[DELTA_KEY] == ['name']
+
+
+def test_changes_are_tracked_once(session):
+    track_changes(session)
+    obj = session.query(DeltaModel).one()
+    obj.name = 'changed'
+    session.flush()
+    assert session.info[CHANGES_KEY] == {inspect(obj): {'name'}}
+    assert changed_attributes(obj) == {'name'}
+
+
+def test_delta_events_track_all_sessions():
+    # DeltaModelUpdated enables delta, with EVENT_DELTA off
+    assert DeltaModelUpdated.delta
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine, tables=[DeltaModel.__table__])
+    session = Session(bind=engine)
+    session.add(DeltaModel(name='foo', description='x', _title='Foo'))
+    session.commit()
+    obj = session.query(DeltaModel).one()
+    obj.name = 'changed'
+    session.flush()
+    assert DeltaModelUpdated(obj).data[DELTA_KEY] == ['name']
+    session.close()
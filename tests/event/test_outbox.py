@@ -0,0 +1,188 @@
+"""Tests for the events outbox and `briefy.common.worker.outbox.OutboxRelayWorker`."""
+from briefy.common.db import Base
+from briefy.common.db import datetime_utcnow
+from briefy.common.db.mixins import Identifiable
+from briefy.common.db.mixins import Timestamp
+from briefy.common.db.models.outbox import OutboxEvent
+from briefy.common.event import BaseEvent
+from briefy.common.event import TaskEvent
+from briefy.common.queue.event import Queue
+from briefy.common.users import SystemUser
+from briefy.common.worker.outbox import OutboxRelayWorker
+from conftest import MockLogger
+from datetime import timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import pytest
+import sqlalchemy as sa
+
+
+class OutboxModel(Identifiable, Timestamp, Base):
+    """A model firing events."""
+
+    __tablename__ = 'outbox_models'
+    name = sa.Column(sa.String(255))
+
+
+class OutboxModelCreated(BaseEvent):
+    """An OutboxModel was created."""
+
+    event_name = 'outboxmodel.created'
+    outbox = True
+
+
+@pytest.fixture
+def session_factory():
+    """Return a session factory bound to a SQLite database with the outbox table."""
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(
+        engine, tables=[OutboxEvent.__table__, OutboxModel.__table__]
+    )
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def queue():
+    """Return an events queue using an in memory local backend."""
+    queue = Queue()
+    queue.backend = 'local'
+    queue.local_path = ':memory:'
+    return queue
+
+
+def create_objects(session_factory, names, commit=True):
+    """Create objects firing an event each, in a single transaction."""
+    session = session_factory()
+    for name in names:
+        obj = OutboxModel(name=name)
+        session.add(obj)
+        session.flush()
+        OutboxModelCreated(obj, actor=str(SystemUser.id))()
+    if commit:
+        session.commit()
+    else:
+        session.rollback()
+    session.close()
+
+
+def test_events_are_added_to_the_outbox(session_factory, queue):
+    create_objects(session_factory, ['a', 'b'])
+    create_objects(session_factory, ['rolled back'], commit=False)
+
+    session = session_factory()
+    events = session.query(OutboxEvent).order_by(OutboxEvent.id).all()
+    assert [e.event_name for e in events] == ['outboxmodel.created'] * 2
+    assert all(e.published_at is None for e in events)
+    assert queue.queue.attributes['ApproximateNumberOfMessages'] == '0'
+
+
+def test_events_without_object_have_no_outbox_session():
+    event = TaskEvent('leica.pool_assign', data={'id': 'foo'})
+    event.outbox = True
+    assert event.session is None
+
+
+def test_relay_publishes_in_order(session_factory, queue):
+    create_objects(session_factory, [str(i) for i in range(25)])
+    worker = OutboxRelayWorker(session_factory, queue, batch_size=10, logger_=MockLogger())
+
+    assert [worker.process() for _ in range(4)] == [10, 10, 5, 0]
+    messages = []
+    while True:
+        batch = queue.get_messages(num_messages=10)
+        if not batch:
+            break
+        messages.extend(batch)
+        queue.delete_messages(batch)
+    assert [m.body['data']['name'] for m in messages] == [str(i) for i in range(25)]
+    session = session_factory()
+    events = session.query(OutboxEvent).all()
+    assert all(e.published_at and e.message_id and e.attempts == 1 for e in events)
+
+
+def test_relay_skips_invalid_events(session_factory, queue):
+    create_objects(session_factory, ['a', 'b'])
+    session = session_factory()
+    invalid = session.query(OutboxEvent).order_by(OutboxEvent.id).first()
+    invalid.body = invalid.body.replace('outboxmodel.created', 'invalid')
+    session.commit()
+
+    logger = MockLogger()
+    worker = OutboxRelayWorker(session_factory, queue, logger_=logger)
+    worker.max_attempts = 2
+    assert worker.process() == 1
+    assert worker.process() == 0
+    assert worker.process() == 0
+    assert [m.body['data']['name'] for m in queue.get_messages(num_messages=10)] == ['b']
+
+    session = session_factory()
+    invalid = session.query(OutboxEvent).get(invalid.id)
+    assert invalid.published_at is None
+    assert invalid.attempts == 2
+
+
+def test_relay_counts_queue_errors_as_attempts(session_factory, queue):
+    create_objects(session_factory, ['a'])
+
+    class BrokenQueue(Queue):
+        def write_messages(self, messages=(), trusted=False):
+            raise RuntimeError('queue unavailable')
+
+    worker = OutboxRelayWorker(session_factory, BrokenQueue(), logger_=MockLogger())
+    worker.max_attempts = 2
+    assert worker.process() == 0
+    session = session_factory()
+    assert session.query(OutboxEvent).one().attempts == 1
+    session.close()
+
+    assert worker.process() == 0
+    session = session_factory()
+    event = session.query(OutboxEvent).one()
+    assert event.published_at is None
+    assert event.attempts == 2
+    assert worker.pending(session) == []
+
+
+def test_relay_writes_failed_batches_one_at_a_time(session_factory, queue):
+    create_objects(session_factory, ['a', 'too large', 'b'])
+
+    class LimitedQueue(Queue):
+        backend = 'local'
+        local_path = ':memory:'
+
+        def write_messages(self, messages=(), trusted=False):
+            if any(m['data']['name'] == 'too large' for m in messages):
+                raise RuntimeError('BatchRequestTooLong')
+            return super().write_messages(messages, trusted=trusted)
+
+    queue = LimitedQueue()
+    worker = OutboxRelayWorker(session_factory, queue, logger_=MockLogger())
+    assert worker.process() == 2
+    assert [m.body['data']['name'] for m in queue.get_messages(num_messages=10)] == ['a', 'b']
+    session = session_factory()
+    failed = session.query(OutboxEvent).filter(OutboxEvent.published_at.is_(None)).one()
+    assert failed.attempts == 1
+
+
+def test_relay_purges_published_events(session_factory, queue):
+    create_objects(session_factory, ['old', 'recent', 'pending'])
+    session = session_factory()
+    old, recent, pending = session.query(OutboxEvent).order_by(OutboxEvent.id).all()
+    old.published_at = datetime_utcnow() - timedelta(days=8)
+    recent.published_at = datetime_utcnow() - timedelta(days=6)
+    kept = [recent.guid, pending.guid]
+    session.commit()
+    session.close()
+
+    worker = OutboxRelayWorker(session_factory, queue, logger_=MockLogger())
+    worker.purge_batch_size = 1
+    assert worker.process() == 1
+    session = session_factory()
+    assert [e.guid for e in session.query(OutboxEvent).order_by(OutboxEvent.id)] == kept
+    session.close()
+
+    # purges run at most once every purge_interval
+    worker.retention = 1
+    worker.process()
+    assert session_factory().query(OutboxEvent).count() == 2
@@ -0,0 +1,209 @@
+"""Tests for `briefy.common.event.publisher.BackgroundPublisher`."""
+from briefy.common.event.publisher import _file_lock
+from briefy.common.event.publisher import BackgroundPublisher
+from briefy.common.queue.event import Queue
+from briefy.common.utils.metrics import MemorySink
+from datetime import datetime
+from threading import Event
+
+import pytest
+import pytz
+import time
+
+
+def get_payload(position=0):
+    """Payload for the event queue."""
+    return {
+        'event_name': 'customer.event.created',
+        'created_at': datetime(2016, 6, 21, 18, 34, 22, tzinfo=pytz.utc),
+        'guid': 'eebd5265-7201-4316-b996-722b977dbf32',
+        'actor': '8cfe3809-30e5-4589-a8b2-32afd75483dd',
+        'request_id': 'e8980ee1-37c3-43fc-8da0-973017f198ab',
+        'data': {'position': position}
+    }
+
+
+class LocalQueue(Queue):
+    """Events queue using an in memory local backend, failing while 'down' is set."""
+
+    backend = 'local'
+    local_path = ':memory:'
+
+    def __init__(self, *args, **kw):
+        """Initialize the queue."""
+        super().__init__(*args, **kw)
+        self.down = Event()
+        self.calls = 0
+
+    def write_messages(self, messages=(), trusted=False):
+        """Write messages, unless the queue is down."""
+        self.calls += 1
+        if self.down.is_set():
+            raise RuntimeError('queue unavailable')
+        return super().write_messages(messages, trusted=trusted)
+
+    def positions(self):
+        """Return the positions of all messages in the queue."""
+        positions = []
+        while True:
+            messages = self.get_messages(num_messages=10)
+            if not messages:
+                return positions
+            positions.extend(m.body['data']['position'] for m in messages)
+            self.delete_messages(messages)
+
+
+@pytest.fixture
+def queue():
+    """Return an events queue."""
+    return LocalQueue()
+
+
+@pytest.fixture
+def publisher(tmpdir):
+    """Return a publisher with a temporary journal and fast retries."""
+    publisher = BackgroundPublisher(
+        journal_path=str(tmpdir.join('events.journal')), metrics=MemorySink()
+    )
+    publisher.retry_delay = 0.01
+    publisher.max_retry_delay = 0.05
+    publisher.retries = 2
+    yield publisher
+    publisher.stop(5)
+
+
+def wait_for(condition, timeout=5):
+    """Wait until condition() is true."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_events_are_sent_in_batches(publisher, queue):
+    for i in range(250):
+        assert publisher.publish(queue, get_payload(i))
+    publisher.stop(5)
+
+    assert queue.positions() == list(range(250))
+    assert queue.calls <= 25
+    snapshot = publisher.metrics.snapshot()
+    assert snapshot['counters']['events.publisher.sent'] == 250
+    assert snapshot['histograms']['events.publisher.lag']['count'] == queue.calls
+
+
+def test_full_buffer_spills_to_the_journal(tmpdir, queue):
+    publisher = BackgroundPublisher(
+        max_size=1, journal_path=str(tmpdir.join('events.journal')), metrics=MemorySink()
+    )
+    publisher.max_retry_delay = 0.05
+    publisher.retries = 0
+    queue.down.set()
+    results = [publisher.publish(queue, get_payload(i)) for i in range(20)]
+    assert not all(results)
+    assert tmpdir.join('events.journal').check()
+
+    queue.down.clear()
+    wait_for(lambda: publisher.metrics.counters.get('events.publisher.sent') == 20)
+    publisher.stop(5)
+    assert sorted(queue.positions()) == list(range(20))
+    assert not tmpdir.join('events.journal').check()
+
+
+def test_failing_batches_are_retried_then_journaled(publisher, queue, tmpdir):
+    queue.down.set()
+    publisher.publish(queue, get_payload(1))
+    wait_for(lambda: publisher.metrics.counters.get('events.publisher.spilled') == 1)
+    assert queue.calls == publisher.retries + 1
+
+    queue.down.clear()
+    wait_for(lambda: publisher.metrics.counters.get('events.publisher.sent') == 1)
+    assert queue.positions() == [1]
+
+
+def test_invalid_events_are_not_retried(publisher, queue, tmpdir):
+    payload = get_payload(1)
+    payload['event_name'] = 'invalid'
+    publisher.publish(queue, get_payload(0))
+    publisher.publish(queue, payload)
+    publisher.publish(queue, get_payload(2))
+    publisher.stop(5)
+    assert queue.positions() == [0, 2]
+    assert publisher.metrics.counters['events.publisher.failed'] == 1
+    dead = tmpdir.join('events.journal.dead').readlines()
+    assert len(dead) == 1
+    assert '"invalid"' in dead[0]
+
+
+def test_rejected_events_are_journaled(publisher, tmpdir):
+    class RejectingQueue(LocalQueue):
+        def write_messages(self, messages=(), trusted=False):
+            message_ids = super().write_messages(messages, trusted=trusted)
+            return [
+                '' if message['data']['position'] == 1 else message_id
+                for message, message_id in zip(messages, message_ids)
+            ]
+
+    queue = RejectingQueue()
+    publisher.max_retry_delay = 10
+    for i in range(3):
+        publisher.publish(queue, get_payload(i))
+    wait_for(lambda: publisher.metrics.counters.get('events.publisher.spilled') == 1)
+    assert publisher.metrics.counters['events.publisher.sent'] == 2
+    lines = tmpdir.join('events.journal').readlines()
+    assert len(lines) == 1
+    assert '"position": 1' in lines[0]
+
+
+def test_publisher_thread_survives_errors(publisher, queue, monkeypatch):
+    send = publisher._send
+    calls = []
+
+    def failing_send(items):
+        calls.append(len(items))
+        if len(calls) == 1:
+            raise OSError('disk full')
+        send(items)
+
+    monkeypatch.setattr(publisher, '_send', failing_send)
+    publisher.publish(queue, get_payload(0))
+    wait_for(lambda: calls)
+    publisher.publish(queue, get_payload(1))
+    publisher.stop(5)
+    assert queue.positions() == [1]
+
+
+def test_journal_is_removed_once_replayed(publisher, queue, tmpdir, monkeypatch):
+    journal = tmpdir.join('events.journal')
+    publisher._queues[queue.name] = queue
+    publisher._spill([(queue.name, get_payload(1), 0), ('unknown', get_payload(2), 0)])
+    publisher._replay_at = 0
+
+    def crash(items):
+        raise RuntimeError('crash')
+
+    monkeypatch.setattr(publisher, '_send', crash)
+    with pytest.raises(RuntimeError):
+        publisher._replay()
+    assert tmpdir.join('events.journal.replay').check()
+
+    monkeypatch.undo()
+    publisher._replay()
+    assert queue.positions() == [1]
+    assert not journal.check()
+    assert not tmpdir.join('events.journal.replay').check()
+    # events of unknown queues are not replayed again
+    assert len(tmpdir.join('events.journal.dead').readlines()) == 1
+
+
+def test_journal_is_replayed_by_one_process(publisher, queue, tmpdir):
+    publisher._queues[queue.name] = queue
+    publisher._spill([(queue.name, get_payload(1), 0)])
+    publisher._replay_at = 0
+    with _file_lock(str(tmpdir.join('events.journal.replay.lock'))):
+        publisher._replay()
+    assert tmpdir.join('events.journal').check()
+    assert queue.positions() == []
+
+    publisher._replay()
+    assert queue.positions() == [1]
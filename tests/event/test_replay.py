@@ -0,0 +1,162 @@
+"""Tests for `briefy.common.event.replay`."""
+from briefy.common.db import Base
+from briefy.common.db.models.outbox import OutboxEvent
+from briefy.common.event import replay
+from briefy.common.queue import Queue as BaseQueue
+from briefy.common.queue.event import Queue
+from briefy.common.queue.event import Schema
+from briefy.common.utils.transformers import json_dumps
+from datetime import datetime
+from datetime import timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from threading import Lock
+from uuid import uuid4
+
+import os
+import pytest
+import pytz
+import time
+
+
+START = datetime(2017, 3, 1, 12, 0, tzinfo=pytz.utc)
+
+
+def get_payload(position, event_name='order.created'):
+    """Payload of an event created position minutes after START."""
+    return {
+        'id': str(uuid4()),
+        'event_name': event_name,
+        'created_at': START + timedelta(minutes=position),
+        'guid': str(uuid4()),
+        'data': {'position': position},
+    }
+
+
+def positions(messages):
+    """Return the positions of messages."""
+    return [message.body['data']['position'] for message in messages]
+
+
+@pytest.fixture
+def queue():
+    """Return an events queue using an in memory local backend."""
+    queue = Queue()
+    queue.backend = 'local'
+    queue.local_path = ':memory:'
+    return queue
+
+
+@pytest.fixture
+def dump(tmpdir, monkeypatch, queue):
+    """Dump events, as Queue does when MOCK_SQS is on, and return the directory."""
+    monkeypatch.chdir(tmpdir)
+    for position, event_name in ((3, 'order.created'), (1, 'job.created'), (2, 'order.updated'),
+                                 (0, 'order.created')):
+        message = queue._create_sqs_message(body=get_payload(position, event_name))
+        queue._dump_message(message)
+    return str(tmpdir.join('dump'))
+
+
+def test_read_dump_in_created_at_order(dump):
+    assert [p['data']['position'] for p in replay.read_dump(dump)] == [0, 1, 2, 3]
+    events = replay.read_dump(
+        dump, event_names=['order.created', 'order.updated'], since=START + timedelta(minutes=1)
+    )
+    assert [p['data']['position'] for p in events] == [2, 3]
+
+
+def test_read_dump_skips_invalid_files(dump):
+    with open(os.path.join(dump, 'order.created', 'truncated.json'), 'w') as fh:
+        fh.write('{"created_at": "2017-03-')
+    assert [p['data']['position'] for p in replay.read_dump(dump)] == [0, 1, 2, 3]
+
+
+def test_read_outbox_in_created_at_order():
+    session = sessionmaker(bind=create_engine('sqlite://'))()
+    Base.metadata.create_all(session.bind, tables=[OutboxEvent.__table__])
+    for position in (2, 0, 1):
+        payload = get_payload(position)
+        session.add(OutboxEvent(
+            event_id=payload['id'],
+            event_name=payload['event_name'],
+            guid=payload['guid'],
+            created_at=payload['created_at'],
+            body=json_dumps(payload),
+            published_at=START if position else None,
+        ))
+    session.commit()
+    events = replay.read_outbox(session, batch_size=2)
+    assert [p['data']['position'] for p in events] == [0, 1, 2]
+    events = replay.read_outbox(session, until=START + timedelta(minutes=2))
+    assert [p['data']['position'] for p in events] == [0, 1]
+
+
+def test_replay_to_queue(dump, queue):
+    result = replay.Replayer(queue, workers=1, batch_size=3)(replay.read_dump(dump))
+    assert result['sent'] == 4
+    assert result['failed'] == 0
+    messages = queue.get_messages(num_messages=10)
+    assert positions(messages) == [0, 1, 2, 3]
+    assert messages[0].body['created_at'] == START
+
+
+def test_replay_to_queue_without_interface(dump):
+    class PlainQueue(BaseQueue):
+        name = 'plain'
+        _schema = Schema
+        backend = 'local'
+        local_path = ':memory:'
+
+    queue = PlainQueue()
+    result = replay.Replayer(queue)(replay.read_dump(dump))
+    assert result['sent'] == 4
+    assert positions(queue.get_messages(num_messages=10)) == [0, 1, 2, 3]
+
+
+def test_replay_with_new_ids(dump, queue):
+    payloads = list(replay.read_dump(dump))
+    replay.Replayer(queue, new_ids=True)(payloads)
+    ids = [message.body['id'] for message in queue.get_messages(num_messages=10)]
+    assert len(set(ids)) == 4
+    assert not set(ids) & {payload['id'] for payload in payloads}
+
+
+def test_replay_to_consumer_in_parallel():
+    received = []
+    lock = Lock()
+
+    def consumer(message):
+        with lock:
+            received.append(message.body['data']['position'])
+        assert isinstance(message.body['created_at'], datetime)
+        return message.body['data']['position'] != 5
+
+    payloads = [get_payload(position) for position in range(20)]
+    payloads[7]['guid'] = 'not a uuid'
+    payloads = [dict(p, created_at=p['created_at'].isoformat()) for p in payloads]
+    result = replay.Replayer(consumer, workers=4, batch_size=2)(payloads)
+    assert result['sent'] == 18
+    assert result['failed'] == 2
+    assert sorted(received) == [i for i in range(20) if i != 7]
+
+
+def test_rate_limit():
+    limiter = replay.RateLimiter(rate=100)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait(10)
+    # the fifth batch waits for the 40 events before it
+    assert time.monotonic() - start >= 0.4
+
+
+def test_main_replays_dump(dump, queue, monkeypatch):
+    monkeypatch.setattr(Queue, 'backend', 'local')
+    monkeypatch.setattr(Queue, 'local_path', str(dump) + '.sqlite')
+    result = replay.main([
+        '--dump', dump, '--queue', 'briefy.common.queue.event:Queue',
+        '--event-name', 'order.created', '--rate', '1000',
+    ])
+    assert result['sent'] == 2
+    messages = Queue().get_messages(num_messages=10)
+    assert positions(messages) == [0, 3]
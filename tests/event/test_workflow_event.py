@@ -0,0 +1,109 @@
+"""Tests for `briefy.common.event.workflow.WorkflowTransitionEvent` serialization."""
+from briefy.common.db import datetime_utcnow
+from briefy.common.event import BaseEvent
+from briefy.common.event.workflow import WorkflowTransitionEvent
+from collections import namedtuple
+from uuid import uuid4
+
+
+Transition = namedtuple('Transition', 'name')
+
+
+class Document:
+    """Object counting its serializations."""
+
+    __to_dict_additional_attributes__ = []
+    __listing_attributes__ = []
+
+    def __init__(self):
+        """Initialize the document."""
+        self.id = str(uuid4())
+        self.created_at = datetime_utcnow()
+        self.state_history = [{'transition': 'submit'}]
+        self.calls = []
+
+    def to_dict(self, excludes=None, includes=None):
+        """Serialize the document, adding the history as WorkflowMixin does."""
+        self.calls.append(includes)
+        data = {'id': self.id, 'title': 'A document'}
+        if includes and 'state_history' in includes:
+            data['state_history'] = self.state_history
+        return data
+
+
+class DocumentUpdated(BaseEvent):
+    """Update event of a document."""
+
+    event_name = 'document.updated'
+
+
+class Recorder(WorkflowTransitionEvent):
+    """Record the payload instead of writing it to the queue."""
+
+    def dispatch(self, payload):
+        """Record the payload."""
+        self.payload = payload
+        return self.id
+
+
+def test_object_is_serialized_once():
+    document = Document()
+    event = Recorder(document, None, Transition('submit'))
+    assert document.calls == []
+
+    assert event() == event.id
+    assert event.payload['data']['state_history'] == document.state_history
+    assert event.payload['event_name'] == 'document.workflow.submit'
+    assert event.payload['id'] == event.id
+    assert document.calls == [['state_history']]
+
+
+def test_data_is_shared_with_the_update_event():
+    document = Document()
+    event = Recorder(document, None, Transition('submit'))
+    update = DocumentUpdated(document)
+    event.share_data(update)
+
+    assert update.data == {'id': document.id, 'title': 'A document'}
+    event()
+    assert event.payload['data']['state_history'] == document.state_history
+    assert len(document.calls) == 1
+
+
+def test_data_is_not_shared_with_custom_serializations():
+    class CustomUpdated(DocumentUpdated):
+        def to_dict(self, excludes=None, includes=None):
+            return {'custom': True}
+
+    document = Document()
+    event = Recorder(document, None, Transition('submit'))
+    update = CustomUpdated(document)
+    event.share_data(update)
+
+    assert update.data == {'custom': True}
+    assert document.calls == []
+
+
+def test_shared_data_is_a_copy():
+    document = Document()
+    event = Recorder(document, None, Transition('submit'))
+    update = DocumentUpdated(document)
+    event.share_data(update)
+
+    update.data['title'] = 'Changed'
+    event()
+    assert event.payload['data']['title'] == 'A document'
+
+
+def test_shared_history_is_a_copy():
+    class ListedDocument(Document):
+        __listing_attributes__ = ['state_history']
+
+    document = ListedDocument()
+    event = Recorder(document, None, Transition('submit'))
+    update = DocumentUpdated(document)
+    event.data = document.to_dict(includes=['state_history'])
+    event.share_data(update)
+
+    update.data['state_history'][0]['transition'] = 'changed'
+    assert event.data['state_history'] == [{'transition': 'submit'}]
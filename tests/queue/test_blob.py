@@ -0,0 +1,139 @@
+"""Tests for large (`briefy.common.queue.blob`) and compressed message bodies."""
+from briefy.common.queue.blob import CLAIM_CHECK_KEY
+from briefy.common.queue.blob import LocalBlobStore
+from briefy.common.queue.event import Queue
+from briefy.common.utils.transformers import json_dumps
+from datetime import datetime
+
+import base64
+import gzip
+import json
+import pytest
+import pytz
+
+
+def get_payload(size=0):
+    """Payload for the event queue, with size bytes of data."""
+    return {
+        'event_name': 'customer.event.created',
+        'created_at': datetime(2016, 6, 21, 18, 34, 22, tzinfo=pytz.utc),
+        'guid': 'eebd5265-7201-4316-b996-722b977dbf32',
+        'actor': '8cfe3809-30e5-4589-a8b2-32afd75483dd',
+        'request_id': 'e8980ee1-37c3-43fc-8da0-973017f198ab',
+        'data': {'raw_metadata': 'x' * size}
+    }
+
+
+@pytest.fixture
+def store(tmpdir):
+    """Return a local blob store."""
+    return LocalBlobStore(str(tmpdir.join('blobs')))
+
+
+@pytest.fixture
+def queue(store):
+    """Return an events queue using an in memory local backend and a local blob store."""
+    queue = Queue()
+    queue.backend = 'local'
+    queue.local_path = ':memory:'
+    queue.offload_threshold = 1024
+    queue.blob_store = store
+    return queue
+
+
+def test_local_blob_store(store):
+    store.put('queue/key.json.gz', b'data')
+    assert store.get('queue/key.json.gz') == b'data'
+    store.delete('queue/key.json.gz')
+    store.delete('queue/key.json.gz')
+    with pytest.raises(KeyError):
+        store.get('queue/key.json.gz')
+
+
+def test_small_bodies_are_sent_inline(queue, tmpdir):
+    queue.write_message(get_payload(100))
+    raw = queue.get_raw_messages()[0]
+    assert json.loads(raw.body)['data']['raw_metadata'] == 'x' * 100
+    assert not tmpdir.join('blobs').check()
+
+
+def test_large_bodies_are_offloaded(queue, store):
+    queue.write_messages([get_payload(10), get_payload(300 * 1024)])
+    raw = queue.queue.receive_messages(MaxNumberOfMessages=10, VisibilityTimeout=0)
+    body = json.loads(raw[1].body)
+    key = body[CLAIM_CHECK_KEY]
+    assert key.startswith(queue.name + '/')
+    assert len(raw[1].body) < 200
+    assert len(store.get(key)) < 10 * 1024
+
+    messages = queue.get_messages(num_messages=10)
+    assert messages[1].body['data']['raw_metadata'] == 'x' * 300 * 1024
+    assert messages[1].body['created_at'] == get_payload()['created_at']
+    assert messages[1].claim_check == key
+    assert messages[0].claim_check == ''
+
+    assert queue.delete_messages(messages) == []
+    with pytest.raises(KeyError):
+        store.get(key)
+
+
+def test_missing_blob_is_not_a_valid_message(queue, store):
+    queue.write_message(get_payload(300 * 1024))
+    key = json.loads(queue.queue.receive_messages(VisibilityTimeout=0)[0].body)[CLAIM_CHECK_KEY]
+    store.delete(key)
+    assert queue.get_messages() == []
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'zlib'])
+def test_compressed_bodies(queue, codec):
+    queue.body_codec = codec
+    queue.write_messages([get_payload(10), get_payload(10 * 1024)])
+    raw = queue.queue.receive_messages(MaxNumberOfMessages=10, VisibilityTimeout=0)
+    assert raw[0].message_attributes.get('ContentEncoding') is None
+    assert raw[1].message_attributes['ContentEncoding']['StringValue'] == codec
+    assert len(raw[1].body) < 1024
+
+    messages = queue.get_messages(num_messages=10)
+    assert messages[1].body['data']['raw_metadata'] == 'x' * 10 * 1024
+    assert messages[1].claim_check == ''
+
+
+def test_compressed_bodies_still_too_large_are_offloaded(queue, store):
+    queue.body_codec = 'gzip'
+    queue.write_message(get_payload(1024 * 1024))
+    raw = queue.queue.receive_messages(VisibilityTimeout=0)[0]
+    assert 'ContentEncoding' not in raw.message_attributes
+    assert CLAIM_CHECK_KEY in json.loads(raw.body)
+    assert queue.get_messages()[0].body['data']['raw_metadata'] == 'x' * 1024 * 1024
+
+
+def test_corrupted_compressed_body_is_not_a_valid_message(queue):
+    queue.queue.send_message(
+        MessageBody='not base64 gzip',
+        MessageAttributes={'ContentEncoding': {'StringValue': 'gzip', 'DataType': 'String'}}
+    )
+    assert queue.get_messages() == []
+
+
+def test_truncated_compressed_body_is_not_a_valid_message(queue):
+    body = json_dumps(get_payload(10)).encode('utf-8')
+    queue.queue.send_message(
+        MessageBody=base64.b64encode(gzip.compress(body)[:-10]).decode('ascii'),
+        MessageAttributes={'ContentEncoding': {'StringValue': 'gzip', 'DataType': 'String'}}
+    )
+    assert queue.get_messages() == []
+
+
+def test_truncated_blob_is_not_a_valid_message(queue, store):
+    queue.write_message(get_payload(300 * 1024))
+    key = json.loads(queue.queue.receive_messages(VisibilityTimeout=0)[0].body)[CLAIM_CHECK_KEY]
+    store.put(key, store.get(key)[:-10])
+    assert queue.get_messages() == []
+
+
+def test_message_attributes_count_in_the_threshold(queue, store):
+    message = queue._create_sqs_message(body=get_payload(1024))
+    # the body alone is below the threshold
+    queue.offload_threshold = len(json_dumps(message.body)) + 1
+    body = json.loads(queue._prepare_sqs_payload(message)['MessageBody'])
+    assert CLAIM_CHECK_KEY in body
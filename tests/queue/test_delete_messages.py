@@ -0,0 +1,128 @@
+"""Tests for long polling and batched deletes in `briefy.common.queue.Queue`."""
+from briefy.common.queue.event import Queue
+from briefy.common.queue.message import SQSMessage
+
+import json
+import pytest
+
+
+class FakeMessage:
+    """A raw SQS message."""
+
+    def __init__(self, position):
+        self.body = json.dumps({
+            'event_name': 'customer.event.created',
+            'created_at': '2016-06-21T18:34:22+00:00',
+            'guid': 'eebd5265-7201-4316-b996-722b977dbf32',
+            'data': {'position': position},
+        })
+        self.receipt_handle = 'handle-{0}'.format(position)
+
+
+class FakeSQSQueue:
+    """Record receive_messages and delete_messages calls."""
+
+    def __init__(self, messages=0, failed=()):
+        self.messages = [FakeMessage(i) for i in range(messages)]
+        self.failed = failed
+        self.receive_calls = []
+        self.delete_calls = []
+        self.visibility_calls = []
+
+    def receive_messages(self, **kwargs):
+        self.receive_calls.append(kwargs)
+        return self.messages[:kwargs['MaxNumberOfMessages']]
+
+    def delete_messages(self, Entries):
+        self.delete_calls.append([entry['ReceiptHandle'] for entry in Entries])
+        return {
+            'Successful': [{'Id': e['Id']} for e in Entries if e['Id'] not in self.failed],
+            'Failed': [
+                {'Id': e['Id'], 'Code': 'ReceiptHandleIsInvalid', 'SenderFault': True}
+                for e in Entries if e['Id'] in self.failed
+            ],
+        }
+
+    def change_message_visibility_batch(self, Entries):
+        self.visibility_calls.append(
+            [(entry['ReceiptHandle'], entry['VisibilityTimeout']) for entry in Entries]
+        )
+        return {
+            'Successful': [{'Id': e['Id']} for e in Entries if e['Id'] not in self.failed],
+            'Failed': [
+                {'Id': e['Id'], 'Code': 'MessageNotInflight', 'SenderFault': True}
+                for e in Entries if e['Id'] in self.failed
+            ],
+        }
+
+
+@pytest.fixture
+def queue():
+    """Return an event queue using a fake SQS queue."""
+    queue = Queue()
+    queue._queue = FakeSQSQueue(messages=25)
+    return queue
+
+
+def test_get_messages_long_polling(queue):
+    messages = queue.get_messages(num_messages=25, wait_time=20)
+
+    assert len(messages) == 10
+    assert all(isinstance(message, SQSMessage) for message in messages)
+    assert queue.queue.receive_calls == [{
+        'MaxNumberOfMessages': 10,
+        'MessageAttributeNames': ['ContentEncoding'],
+        'WaitTimeSeconds': 20,
+    }]
+
+    queue.get_messages()
+    assert queue.queue.receive_calls[-1] == {
+        'MaxNumberOfMessages': 1,
+        'MessageAttributeNames': ['ContentEncoding'],
+    }
+
+
+def test_delete_messages_in_batches(queue):
+    messages = [SQSMessage(queue.schema, message=FakeMessage(i)) for i in range(12)]
+    not_deleted = queue.delete_messages(messages)
+
+    assert not_deleted == []
+    assert [len(call) for call in queue.queue.delete_calls] == [10, 2]
+    with pytest.raises(ValueError):
+        messages[0].message
+
+
+def test_delete_messages_returns_failed_messages(queue):
+    queue._queue = FakeSQSQueue(failed=('1', ))
+    messages = [SQSMessage(queue.schema, message=FakeMessage(i)) for i in range(3)]
+    not_deleted = queue.delete_messages(messages)
+
+    assert not_deleted == [messages[1]]
+    assert messages[1].message.receipt_handle == 'handle-1'
+
+
+def test_change_visibility_in_batches(queue):
+    messages = [SQSMessage(queue.schema, message=FakeMessage(i)) for i in range(12)]
+    not_changed = queue.change_visibility(messages, 60)
+
+    assert not_changed == []
+    calls = queue.queue.visibility_calls
+    assert [len(call) for call in calls] == [10, 2]
+    assert calls[1] == [('handle-10', 60), ('handle-11', 60)]
+
+
+def test_change_visibility_returns_failed_messages(queue):
+    queue._queue = FakeSQSQueue(failed=('0', ))
+    messages = [SQSMessage(queue.schema, message=FakeMessage(i)) for i in range(2)]
+
+    assert queue.change_visibility(messages, 30) == [messages[0]]
+
+
+def test_sqs_message_pickle_drops_raw_message(queue):
+    import pickle  # noQA
+    message = SQSMessage(queue.schema, message=FakeMessage(1))
+    clone = pickle.loads(pickle.dumps(message))
+
+    assert clone.body['data'] == {'position': 1}
+    with pytest.raises(ValueError):
+        clone.message
@@ -0,0 +1,170 @@
+"""Tests for `briefy.common.queue.local`."""
+from briefy.common.queue.event import Queue
+from briefy.common.queue.local import LocalSQSQueue
+from briefy.common.worker import QueueWorker
+from datetime import datetime
+from threading import Thread
+
+import pytest
+import pytz
+import time
+
+
+def get_payload(position=0):
+    """Payload for the event queue."""
+    return {
+        'event_name': 'customer.event.created',
+        'created_at': datetime(2016, 6, 21, 18, 34, 22, tzinfo=pytz.utc),
+        'guid': 'eebd5265-7201-4316-b996-722b977dbf32',
+        'actor': '8cfe3809-30e5-4589-a8b2-32afd75483dd',
+        'request_id': 'e8980ee1-37c3-43fc-8da0-973017f198ab',
+        'data': {'position': position}
+    }
+
+
+@pytest.fixture
+def path(tmpdir):
+    """Return the path of a local queue database."""
+    return str(tmpdir.join('queues.sqlite'))
+
+
+@pytest.fixture
+def queue(path):
+    """Return an event queue using the local backend."""
+    queue = Queue()
+    queue.backend = 'local'
+    queue.local_path = path
+    return queue
+
+
+def send(sqs_queue, count):
+    """Send count messages to a LocalSQSQueue."""
+    entries = [{'Id': str(i), 'MessageBody': str(i)} for i in range(count)]
+    return sqs_queue.send_messages(Entries=entries)
+
+
+def test_queue_uses_local_backend(queue, path):
+    assert isinstance(queue.queue, LocalSQSQueue)
+    assert queue.queue.path == path
+    assert queue.queue.name == queue.name
+
+
+def test_write_and_read_messages(queue):
+    message_id = queue.write_message(get_payload())
+    message_ids = queue.write_messages([get_payload(i) for i in range(1, 15)])
+
+    assert message_id
+    assert len(set(message_ids)) == 14
+    messages = queue.get_messages(num_messages=10)
+    assert [m.body['data']['position'] for m in messages] == list(range(10))
+    assert messages[0].body['created_at'] == get_payload()['created_at']
+    assert messages[0].message.message_id == message_id
+    assert queue.delete_messages(messages) == []
+    messages = queue.get_messages(num_messages=10)
+    assert [m.body['data']['position'] for m in messages] == list(range(10, 15))
+    messages[0].delete()
+    assert queue.queue.attributes == {
+        'ApproximateNumberOfMessages': '0',
+        'ApproximateNumberOfMessagesNotVisible': '4',
+    }
+
+
+def test_visibility_timeout(path):
+    sqs_queue = LocalSQSQueue('visibility', path, visibility_timeout=0.2)
+    send(sqs_queue, 2)
+
+    first = sqs_queue.receive_messages(MaxNumberOfMessages=10)
+    assert [m.body for m in first] == ['0', '1']
+    assert sqs_queue.receive_messages(MaxNumberOfMessages=10) == []
+    time.sleep(0.25)
+    again = sqs_queue.receive_messages(MaxNumberOfMessages=10)
+    assert [m.body for m in again] == ['0', '1']
+    assert again[0].attributes['ApproximateReceiveCount'] == '2'
+
+    # the receipt handle of a previous receive is no longer valid
+    response = sqs_queue.delete_messages(
+        Entries=[{'Id': 'a', 'ReceiptHandle': first[0].receipt_handle}]
+    )
+    assert response['Failed'][0]['Code'] == 'ReceiptHandleIsInvalid'
+
+    again[0].change_visibility(VisibilityTimeout=0)
+    assert [m.body for m in sqs_queue.receive_messages(MaxNumberOfMessages=10)] == ['0']
+
+
+def test_long_polling(path):
+    sqs_queue = LocalSQSQueue('polling', path)
+    Thread(target=lambda: (time.sleep(0.2), send(sqs_queue, 1))).start()
+
+    start = time.monotonic()
+    messages = sqs_queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=5)
+    assert [m.body for m in messages] == ['0']
+    assert time.monotonic() - start < 2
+
+    start = time.monotonic()
+    assert sqs_queue.receive_messages(WaitTimeSeconds=0.2) == []
+    assert time.monotonic() - start >= 0.2
+
+
+def test_queues_share_database(path):
+    first = LocalSQSQueue('first', path)
+    second = LocalSQSQueue('second', path)
+    send(first, 3)
+
+    assert second.receive_messages(MaxNumberOfMessages=10) == []
+    assert len(first.receive_messages(MaxNumberOfMessages=10)) == 3
+
+
+def test_concurrent_consumers_receive_each_message_once(path):
+    send(LocalSQSQueue('concurrent', path), 200)
+    received = []
+
+    def consume():
+        sqs_queue = LocalSQSQueue('concurrent', path)
+        while True:
+            messages = sqs_queue.receive_messages(MaxNumberOfMessages=10)
+            if not messages:
+                return
+            received.extend(m.body for m in messages)
+            entries = [
+                {'Id': str(i), 'ReceiptHandle': m.receipt_handle} for i, m in enumerate(messages)
+            ]
+            assert sqs_queue.delete_messages(Entries=entries)['Failed'] == []
+
+    threads = [Thread(target=consume) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(received, key=int) == [str(i) for i in range(200)]
+
+
+def test_memory_database():
+    sqs_queue = LocalSQSQueue('memory', ':memory:')
+    send(sqs_queue, 3)
+    messages = sqs_queue.receive_messages(MaxNumberOfMessages=10)
+    assert len(messages) == 3
+    messages[0].delete()
+    with pytest.raises(ValueError):
+        messages[0].delete()
+
+
+def test_queue_worker_with_local_backend(queue):
+    processed = []
+
+    class LocalWorker(QueueWorker):
+        name = 'local'
+
+        def process(self):
+            result = super().process()
+            if not result:
+                self.running = False
+            return result
+
+        def process_message(self, message):
+            processed.append(message.body['data']['position'])
+            return True
+
+    queue.write_messages([get_payload(i) for i in range(25)])
+    LocalWorker(queue, run_interval=0, wait_time=0, concurrency=4)()
+    assert sorted(processed) == list(range(25))
+    assert queue.queue.attributes['ApproximateNumberOfMessagesNotVisible'] == '0'
@@ -1,4 +1,5 @@
 """Rests for briefy.common.queue.message."""
+from briefy.common.queue.message import get_schema
 from briefy.common.queue.message import SQSMessage
 from conftest import BaseSQSTest
 from datetime import date
@@ -132,3 +133,24 @@ class TestSQSMessageWithDateTime(BaseSQSTest):
         assert isinstance(message.body['timestamp'], datetime)
         assert message.body['date'] == today
         assert message.body['timestamp'] == now
+
+
+def test_schema_instances_are_shared():
+    """Messages with the same schema class share a single schema instance."""
+    first = SQSMessage(SimpleSchema, body={'event_name': 'job.created'})
+    second = SQSMessage(SimpleSchema, body={'event_name': 'job.updated'})
+
+    assert first.schema is second.schema
+    assert first.schema is get_schema(SimpleSchema)
+    assert first.schema.unknown == 'ignore'
+    assert get_schema(DateSchema) is not get_schema(SimpleSchema)
+
+
+def test_trusted_body_is_validated():
+    """Bodies from trusted producers are validated in a single pass."""
+    body = {'event_name': 'job.created', 'foo': 'bar'}
+    message = SQSMessage(SimpleSchema, body=body, trusted=True)
+
+    assert message.body == SQSMessage(SimpleSchema, body=body).body
+    with pytest.raises(ValueError):
+        SQSMessage(SimpleSchema, body={'event_name': 'Job'}, trusted=True)
@@ -0,0 +1,101 @@
+"""Tests for batched writes in `briefy.common.queue.Queue`."""
+from briefy.common.queue.event import Queue
+from datetime import datetime
+
+import pytest
+import pytz
+
+
+class FakeSQSQueue:
+    """Record send_messages calls and fail entries on demand."""
+
+    def __init__(self, failures=None):
+        self.calls = []
+        self.failures = failures if failures else {}
+
+    def send_messages(self, Entries):
+        self.calls.append([entry['Id'] for entry in Entries])
+        successful = []
+        failed = []
+        for entry in Entries:
+            failure = self.failures.get(entry['Id'])
+            if failure:
+                sender_fault, times = failure
+                if times:
+                    self.failures[entry['Id']] = (sender_fault, times - 1)
+                    failed.append({
+                        'Id': entry['Id'], 'SenderFault': sender_fault,
+                        'Code': 'InternalError', 'Message': 'Failed'
+                    })
+                    continue
+            successful.append({'Id': entry['Id'], 'MessageId': 'message-{0}'.format(entry['Id'])})
+        return {'Successful': successful, 'Failed': failed}
+
+
+def get_payload():
+    """Payload for the event queue."""
+    return {
+        'event_name': 'customer.event.created',
+        'created_at': datetime(2016, 6, 21, 18, 34, 22, tzinfo=pytz.utc),
+        'guid': 'eebd5265-7201-4316-b996-722b977dbf32',
+        'actor': '8cfe3809-30e5-4589-a8b2-32afd75483dd',
+        'request_id': 'e8980ee1-37c3-43fc-8da0-973017f198ab',
+        'data': {'foo': 'bar'}
+    }
+
+
+@pytest.fixture
+def queue():
+    """Return an event queue using a fake SQS queue."""
+    queue = Queue()
+    queue.retry_delay = 0
+    queue._queue = FakeSQSQueue()
+    return queue
+
+
+def test_write_messages_in_batches_of_ten(queue):
+    message_ids = queue.write_messages([get_payload() for _ in range(25)])
+
+    assert [len(call) for call in queue.queue.calls] == [10, 10, 5]
+    assert message_ids == ['message-{0}'.format(i) for i in range(25)]
+
+
+def test_write_messages_respects_batch_size_limit(queue):
+    payloads = []
+    for _ in range(3):
+        payload = get_payload()
+        payload['data'] = {'foo': 'x' * 100 * 1024}
+        payloads.append(payload)
+
+    queue.write_messages(payloads)
+
+    assert [len(call) for call in queue.queue.calls] == [2, 1]
+
+
+def test_write_messages_retries_only_failed_entries(queue):
+    queue._queue = FakeSQSQueue(failures={'3': (False, 2), '5': (True, 1)})
+    message_ids = queue.write_messages([get_payload() for _ in range(10)])
+
+    assert queue.queue.calls == [[str(i) for i in range(10)], ['3'], ['3']]
+    assert message_ids[3] == 'message-3'
+    assert message_ids[5] == ''
+
+
+def test_write_messages_gives_up_after_retries(queue):
+    queue._queue = FakeSQSQueue(failures={'0': (False, 10)})
+    message_ids = queue.write_messages([get_payload()])
+
+    assert len(queue.queue.calls) == queue.send_retries + 1
+    assert message_ids == ['']
+
+
+def test_write_messages_validates_all_messages(queue):
+    payload = get_payload()
+    del payload['guid']
+    with pytest.raises(ValueError):
+        queue.write_messages([get_payload(), payload])
+
+    assert queue.queue.calls == []
+
+    with pytest.raises(ValueError):
+        queue.write_messages(get_payload())
@@ -1,6 +1,9 @@
 from briefy.common.utils.cache import _make_cache_key
+from briefy.common.utils.cache import async_timeout_cache
 from briefy.common.utils.cache import timeout_cache
+from threading import Thread
 
+import asyncio
 import pytest
 import time
 
@@ -151,3 +154,178 @@ def test_timeout_cache_renew():
     res = cached(2)
     assert res == 2
     assert called
+
+
+def test_timeout_cache_maxsize_evicts_least_recently_used():
+    calls = []
+
+    @timeout_cache(10, maxsize=2)
+    def cached(a):
+        calls.append(a)
+        return a
+
+    cached(1)
+    cached(2)
+    cached(1)
+    cached(3)
+    assert cached.cache_info().currsize == 2
+
+    cached(1)
+    assert calls == [1, 2, 3]
+
+    cached(2)
+    assert calls == [1, 2, 3, 2]
+
+
+def test_timeout_cache_sweeps_expired_entries():
+    @timeout_cache(0.02, sweep_interval=0.01)
+    def cached(a):
+        return a
+
+    for i in range(10):
+        cached(i)
+    assert cached.cache_info().currsize == 10
+
+    time.sleep(0.03)
+    cached(10)
+    assert cached.cache_info().currsize == 1
+
+
+def test_timeout_cache_info_and_clear():
+    @timeout_cache(10, maxsize=5)
+    def cached(a):
+        return a
+
+    cached(1)
+    cached(1)
+    cached(2)
+    assert cached.cache_info() == (1, 2, 5, 2)
+    assert cached.cache_info().hits == 1
+
+    cached.cache_clear()
+    assert cached.cache_info() == (0, 0, 5, 0)
+
+
+def test_timeout_cache_single_flight():
+    calls = 0
+
+    @timeout_cache(10)
+    def cached(a):
+        nonlocal calls
+        calls += 1
+        time.sleep(0.05)
+        return a
+
+    threads = [Thread(target=cached, args=(1, )) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == 1
+    assert cached.cache_info().hits == 4
+
+
+def test_timeout_cache_does_not_cache_exceptions():
+    calls = 0
+
+    @timeout_cache(10)
+    def cached(a):
+        nonlocal calls
+        calls += 1
+        raise RuntimeError
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            cached(1)
+    assert calls == 2
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_async_timeout_cache_caches_awaited_result():
+    calls = 0
+
+    @async_timeout_cache(0.02)
+    async def cached(a):
+        nonlocal calls
+        calls += 1
+        return a * 2
+
+    assert run(cached(2)) == 4
+    assert run(cached(2)) == 4
+    assert calls == 1
+
+    time.sleep(0.03)
+    assert run(cached(2)) == 4
+    assert calls == 2
+    assert cached.cache_info().hits == 1
+
+
+def test_async_timeout_cache_deduplicates_in_flight_calls():
+    calls = 0
+
+    @async_timeout_cache(10)
+    async def cached(a):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return a
+
+    async def main():
+        return await asyncio.gather(*[cached(1) for _ in range(5)], cached(2))
+
+    assert run(main()) == [1, 1, 1, 1, 1, 2]
+    assert calls == 2
+
+
+def test_async_timeout_cache_cancelled_caller_does_not_cancel_call():
+    @async_timeout_cache(10)
+    async def cached(a):
+        await asyncio.sleep(0.02)
+        return a
+
+    async def main():
+        first = asyncio.ensure_future(cached(1))
+        second = asyncio.ensure_future(cached(1))
+        await asyncio.sleep(0.001)
+        first.cancel()
+        return await second
+
+    assert run(main()) == 1
+    assert cached.cache_info().misses == 1
+
+
+def test_async_timeout_cache_does_not_cache_exceptions():
+    calls = 0
+
+    @async_timeout_cache(10)
+    async def cached(a):
+        nonlocal calls
+        calls += 1
+        raise RuntimeError
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            run(cached(1))
+    assert calls == 2
+
+
+def test_timeout_cache_decorates_coroutine_functions():
+    calls = 0
+
+    @timeout_cache(10)
+    async def cached(a):
+        nonlocal calls
+        calls += 1
+        return a
+
+    assert run(cached(1)) == 1
+    assert run(cached(1)) == 1
+    assert calls == 1
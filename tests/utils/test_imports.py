@@ -0,0 +1,13 @@
+"""Test briefy.common.utils.imports."""
+from briefy.common.utils.imports import resolve
+from briefy.common.utils.phone import validate_phone
+
+import pytest
+
+
+def test_resolve():
+    assert resolve('briefy.common.utils.phone:validate_phone') is validate_phone
+    with pytest.raises(AttributeError):
+        resolve('briefy.common.utils.phone:missing')
+    with pytest.raises(ImportError):
+        resolve('briefy.common.utils.missing:validate_phone')
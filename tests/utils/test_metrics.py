@@ -0,0 +1,92 @@
+"""Tests for `briefy.common.utils.metrics`."""
+from briefy.common.utils import metrics
+from conftest import MockLogger
+
+import pytest
+import socket
+
+
+def test_histogram_summary():
+    histogram = metrics.Histogram(buckets=(1, 10, 100))
+    for value in (0.5, 5, 5, 50, 500):
+        histogram.add(value)
+
+    summary = histogram.summary()
+    assert summary['count'] == 5
+    assert summary['sum'] == 560.5
+    assert summary['min'] == 0.5
+    assert summary['max'] == 500
+    assert summary['p50'] == 10
+    assert summary['p99'] == 500
+
+
+def test_histogram_empty_summary():
+    summary = metrics.Histogram().summary()
+    assert summary['count'] == 0
+    assert summary['avg'] is None
+    assert summary['p95'] is None
+
+
+def test_memory_sink():
+    sink = metrics.MemorySink()
+    sink.incr('foo')
+    sink.incr('foo', 2)
+    sink.gauge('bar', 10)
+    sink.gauge('bar', 5)
+    sink.timing('baz', 12.5)
+    sink.histogram('baz', 7.5)
+
+    snapshot = sink.snapshot()
+    assert snapshot['counters'] == {'foo': 3}
+    assert snapshot['gauges'] == {'bar': 5}
+    assert snapshot['histograms']['baz']['count'] == 2
+    assert snapshot['histograms']['baz']['avg'] == 10
+
+    sink.reset()
+    assert sink.snapshot()['counters'] == {}
+
+
+def test_logging_sink():
+    class Logger(MockLogger):
+        def log(self, level, msg, *args, **kw):
+            self.info_messages.append(msg)
+
+    mock_logger = Logger()
+    sink = metrics.LoggingSink(logger_=mock_logger)
+    sink.incr('foo')
+    sink.timing('bar', 2)
+    assert mock_logger.info_messages == ['metric counter foo=1', 'metric timing bar=2']
+
+
+def test_statsd_sink():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(1)
+    port = server.getsockname()[1]
+    sink = metrics.StatsdSink('127.0.0.1', port, prefix='briefy')
+
+    sink.incr('cache.hit')
+    sink.timing('cache.get', 1.5)
+    sink.gauge('queue.depth', 3)
+    sink.histogram('cache.size', 1024)
+
+    received = [server.recv(1024).decode('utf-8') for _ in range(4)]
+    server.close()
+    assert received == [
+        'briefy.cache.hit:1|c',
+        'briefy.cache.get:1.5|ms',
+        'briefy.queue.depth:3|g',
+        'briefy.cache.size:1024|h',
+    ]
+
+
+def test_get_metrics_sink():
+    assert metrics.get_metrics_sink('') is metrics.get_metrics_sink('')
+    assert metrics.get_metrics_sink('').enabled is False
+    assert isinstance(metrics.get_metrics_sink('null'), metrics.NullSink)
+    memory = metrics.get_metrics_sink('memory')
+    assert isinstance(memory, metrics.MemorySink)
+    assert memory is metrics.get_metrics_sink('memory')
+
+    with pytest.raises(ValueError):
+        metrics.get_metrics_sink('foo')
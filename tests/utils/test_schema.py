@@ -130,3 +130,90 @@ class TestList:
             schema.serialize(DummySchemaNode(None), appstruct)
 
         assert '2.3 is not a list' in str(excinfo.value)
+
+
+class PlanChildSchema(colander.MappingSchema):
+    """Nested mapping."""
+
+    name = colander.SchemaNode(colander.String(), validator=colander.Length(max=5))
+    count = colander.SchemaNode(colander.Integer(), missing=0)
+
+
+class PlanSchema(colander.MappingSchema):
+    """Schema with the node types handled by the validation plan."""
+
+    guid = colander.SchemaNode(colander.String(), validator=colander.uuid)
+    created_at = colander.SchemaNode(colander.DateTime())
+    price = colander.SchemaNode(colander.Integer(), validator=colander.Range(min=0))
+    active = colander.SchemaNode(colander.Boolean(), missing=False)
+    data = colander.SchemaNode(schema.Dictionary())
+    title = colander.SchemaNode(
+        colander.String(), preparer=lambda value: value.strip() if value else value
+    )
+    child = PlanChildSchema()
+
+
+def plan_payload(**kw):
+    """Return a valid payload for PlanSchema."""
+    from datetime import datetime  # noQA
+    payload = {
+        'guid': '2fd4c4ca-1d1e-4e43-8b43-0b0fc2b0b1a3',
+        'created_at': datetime(2017, 12, 5, 18, 34, 22),
+        'price': 100,
+        'active': True,
+        'data': {'foo': 'bar'},
+        'title': ' A title ',
+        'child': {'name': 'abc', 'count': 2},
+    }
+    payload.update(kw)
+    return payload
+
+
+def test_validate_and_serialize_trusted_matches_full():
+    """Trusted validation returns the same serialized data."""
+    plan_schema = PlanSchema(unknown='ignore')
+    payload = plan_payload()
+    assert schema.validate_and_serialize(plan_schema, payload, trusted=True) == \
+        schema.validate_and_serialize(plan_schema, payload)
+
+
+@pytest.mark.parametrize('changes,error_keys', [
+    ({'guid': 'not-an-uuid'}, {'guid'}),
+    ({'guid': ''}, {'guid'}),
+    ({'price': -1}, {'price'}),
+    ({'price': '-1'}, {'price'}),
+    ({'created_at': None}, {'created_at'}),
+    ({'data': 'not a dict'}, {'data'}),
+    ({'title': colander.null}, {'title'}),
+    ({'child': {'name': 'too long', 'count': 1}}, {'child.name'}),
+    ({'child': None}, {'child'}),
+    ({'guid': 'x', 'price': -5}, {'guid', 'price'}),
+])
+def test_validate_and_serialize_trusted_errors(changes, error_keys):
+    """Trusted validation reports the same errors as the full validation."""
+    plan_schema = PlanSchema(unknown='ignore')
+    payload = plan_payload(**changes)
+    with pytest.raises(colander.Invalid) as full:
+        schema.validate_and_serialize(plan_schema, payload)
+    with pytest.raises(colander.Invalid) as trusted:
+        schema.validate_and_serialize(plan_schema, payload, trusted=True)
+    assert set(full.value.asdict()) == error_keys
+    assert set(trusted.value.asdict()) == error_keys
+
+
+def test_validation_plan_is_cached():
+    """Plans are compiled once per schema instance."""
+    plan_schema = PlanSchema(unknown='ignore')
+    plan = schema.get_validation_plan(plan_schema)
+    assert plan is schema.get_validation_plan(plan_schema)
+    assert plan is not schema.get_validation_plan(PlanSchema(unknown='ignore'))
+    kinds = {child.name: kind for _, child, (kind, _) in plan.steps}
+    assert kinds == {
+        'guid': 'string',
+        'created_at': 'typed',
+        'price': 'typed',
+        'active': 'typed',
+        'data': 'deserialize',
+        'title': 'deserialize',
+        'child': 'mapping',
+    }
@@ -0,0 +1,227 @@
+"""Tests for `briefy.common.worker.AsyncWorker` and `AsyncQueueWorker`."""
+from briefy.common.worker import AsyncQueueWorker
+from briefy.common.worker import AsyncWorker
+from conftest import MockLogger
+from threading import Lock
+from threading import Thread
+
+import asyncio
+import pytest
+import time
+
+
+class InFlightQueue:
+    """Dummy queue hiding received messages until they are deleted."""
+
+    def __init__(self, messages=()):
+        """Initialize dummy queue."""
+        self.messages = list(messages)
+        self.in_flight = []
+        self.deleted = []
+        self.delete_calls = 0
+        self.polls = []
+        self.lock = Lock()
+
+    def get_messages(self, num_messages=1, wait_time=None):
+        """Return up to num_messages, moving them in flight."""
+        with self.lock:
+            self.polls.append((num_messages, wait_time))
+            messages = self.messages[:num_messages]
+            self.messages = self.messages[num_messages:]
+            self.in_flight.extend(messages)
+        return messages
+
+    def delete_messages(self, messages):
+        """Delete messages in flight."""
+        with self.lock:
+            self.delete_calls += 1
+            for message in messages:
+                self.in_flight.remove(message)
+                self.deleted.append(message)
+        return []
+
+
+class MinimalAsyncWorker(AsyncWorker):
+    """Minimal async worker."""
+
+    name = 'MinimalAsync'
+    run_interval = 0.01
+    _runs = 5
+
+    def __init__(self, *args, **kw):
+        """Initialize the worker."""
+        self.count = 0
+        super().__init__(*args, **kw)
+
+    async def process(self):
+        """Run tasks on this worker."""
+        self.count += 1
+        if self.count >= self._runs:
+            self.running = False
+
+
+class MinimalAsyncQueueWorker(AsyncQueueWorker):
+    """Async queue worker stopping once the queue is drained."""
+
+    name = 'MinimalAsyncQueue'
+    run_interval = 0.001
+
+    def __init__(self, *args, **kw):
+        """Initialize the worker."""
+        self.active = 0
+        self.max_active = 0
+        super().__init__(*args, **kw)
+
+    async def process(self):
+        """Stop once all messages are processed."""
+        await super().process()
+        queue = self.input_queue
+        if not queue.messages and not self._tasks:
+            self.running = False
+
+    async def process_message(self, message):
+        """Record concurrency."""
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return True
+
+
+def test_async_worker_calls_process():
+    """Process is awaited until the worker stops."""
+    w = MinimalAsyncWorker()
+    w()
+    assert w.count == w._runs
+    assert w._loop is None
+
+
+def test_async_worker_logs_exceptions():
+    """Exceptions in process are logged and the worker keeps running."""
+    class FaultyWorker(MinimalAsyncWorker):
+        async def process(self):
+            await super().process()
+            raise RuntimeError
+
+    mock_logger = MockLogger()
+    w = FaultyWorker(logger_=mock_logger)
+    w()
+    assert w.count == w._runs
+    assert mock_logger.exception_called == w._runs
+
+
+def test_async_worker_stop_from_another_thread():
+    """Stop interrupts the running process call and calls shutdown."""
+    class BlockingWorker(MinimalAsyncWorker):
+        cancelled = False
+        shut_down = False
+
+        async def process(self):
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+
+        async def shutdown(self):
+            self.shut_down = True
+
+    w = BlockingWorker()
+    t = Thread(target=w)
+    t.start()
+    time.sleep(0.1)
+    start = time.time()
+    w.stop()
+    t.join(5)
+    assert not t.is_alive()
+    assert time.time() - start < 1
+    assert w.cancelled
+    assert w.shut_down
+
+
+def test_async_queue_worker_needs_a_queue():
+    """Async queue worker always needs a queue."""
+    with pytest.raises(ValueError):
+        MinimalAsyncQueueWorker(None)
+    with pytest.raises(ValueError):
+        MinimalAsyncQueueWorker(InFlightQueue(), concurrency=0)
+
+
+def test_async_queue_worker_bounded_concurrency():
+    """Messages are processed concurrently, up to the concurrency limit."""
+    queue = InFlightQueue(range(25))
+    w = MinimalAsyncQueueWorker(queue, concurrency=4, wait_time=1)
+    w()
+    assert sorted(queue.deleted) == list(range(25))
+    assert queue.in_flight == []
+    assert w.max_active == 4
+    assert all(num <= 4 for num, _ in queue.polls)
+    assert queue.delete_calls < 25
+
+
+def test_async_queue_worker_long_polls_when_idle():
+    """Long polling is only used when no message is being processed."""
+    queue = InFlightQueue(range(3))
+    w = MinimalAsyncQueueWorker(queue, wait_time=7)
+    w()
+    assert queue.polls[0] == (10, 7)
+    assert (7, 0) in queue.polls
+
+
+def test_async_queue_worker_failed_messages_are_not_deleted():
+    """Failed and raising messages stay in flight."""
+    class FailingWorker(MinimalAsyncQueueWorker):
+        async def process_message(self, message):
+            if message == 1:
+                raise RuntimeError
+            return message != 2
+
+    queue = InFlightQueue(range(4))
+    mock_logger = MockLogger()
+    w = FailingWorker(queue, logger_=mock_logger)
+    w()
+    assert sorted(queue.deleted) == [0, 3]
+    assert sorted(queue.in_flight) == [1, 2]
+    assert mock_logger.exception_called == 1
+    assert mock_logger.info_messages.count('Message was not deleted') == 2
+
+
+def test_async_queue_worker_shutdown_drains_and_cancels():
+    """On stop, fast messages finish and are deleted, slow ones are cancelled."""
+    class SlowWorker(MinimalAsyncQueueWorker):
+        shutdown_timeout = 0.2
+
+        async def process(self):
+            await AsyncQueueWorker.process(self)
+
+        async def process_message(self, message):
+            await asyncio.sleep(0.05 if message % 2 else 60)
+            return True
+
+    queue = InFlightQueue(range(4))
+    w = SlowWorker(queue, logger_=MockLogger())
+    t = Thread(target=w)
+    t.start()
+    time.sleep(0.1)
+    w.stop()
+    t.join(5)
+    assert not t.is_alive()
+    assert sorted(queue.deleted) == [1, 3]
+    assert sorted(queue.in_flight) == [0, 2]
+
+
+def test_async_worker_adaptive_loop():
+    """Process is awaited without waiting while it finds work."""
+    class BusyWorker(MinimalAsyncWorker):
+        run_interval = 1
+        _runs = 50
+
+        async def process(self):
+            await super().process()
+            return 1
+
+    w = BusyWorker()
+    start = time.time()
+    w()
+    assert w.count == w._runs
+    assert time.time() - start < 0.5
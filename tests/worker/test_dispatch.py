@@ -0,0 +1,126 @@
+"""Tests for `briefy.common.worker.dispatch`."""
+from briefy.common.utils.metrics import MemorySink
+from briefy.common.worker import DispatcherWorker
+from briefy.common.worker import EventRouter
+from concurrent.futures import ThreadPoolExecutor
+from conftest import MockLogger
+from threading import Lock
+
+import pickle
+import pytest
+import time
+
+
+class Message:
+    """Minimal event message."""
+
+    def __init__(self, event_name):
+        """Initialize the message."""
+        self.body = {'event_name': event_name}
+
+
+def names(handlers):
+    """Return the names of handlers."""
+    return [handler.name for handler in handlers]
+
+
+@pytest.fixture
+def router():
+    """Return a router with handlers for several patterns."""
+    router = EventRouter()
+    for pattern, name in (
+            ('order.workflow.*', 'transitions'),
+            ('order.workflow.submit', 'submit'),
+            ('*.workflow.submit', 'any_submit'),
+            ('order.**', 'order'),
+            ('**', 'all'),
+    ):
+        router.register(pattern, lambda message: True, name=name)
+    return router
+
+
+def test_router_matches_patterns(router):
+    assert names(router.match('order.workflow.submit')) == [
+        'transitions', 'submit', 'any_submit', 'order', 'all'
+    ]
+    assert names(router.match('order.workflow.cancel')) == ['transitions', 'order', 'all']
+    assert names(router.match('job.workflow.submit')) == ['any_submit', 'all']
+    assert names(router.match('order')) == ['order', 'all']
+    assert names(router.match('order.workflow.submit.extra')) == ['order', 'all']
+    assert names(router.match('job.created')) == ['all']
+
+
+def test_router_cache_is_cleared_on_register(router):
+    assert names(router.match('job.created')) == ['all']
+    router.register('job.*', lambda message: True, name='job')
+    assert names(router.match('job.created')) == ['all', 'job']
+
+
+def test_router_rejects_invalid_patterns():
+    router = EventRouter()
+    for pattern in ('order..created', '**.created', ''):
+        with pytest.raises(ValueError):
+            router.register(pattern, lambda message: True)
+
+
+def test_dispatcher_calls_handlers_and_records_metrics():
+    router = EventRouter()
+    calls = []
+
+    @router.handler('order.*')
+    def orders(message):
+        calls.append(('orders', message.body['event_name']))
+        return True
+
+    @router.handler('order.created', name='failing')
+    def failing(message):
+        raise RuntimeError
+
+    metrics = MemorySink()
+    logger = MockLogger()
+    worker = DispatcherWorker(object(), router=router, metrics=metrics, logger_=logger)
+    assert worker.process_message(Message('order.updated'))
+    assert not worker.process_message(Message('order.created'))
+    assert calls == [('orders', 'order.updated'), ('orders', 'order.created')]
+    assert logger.exception_called == 1
+    assert metrics.counters['worker.dispatcher.handler.failing.failed'] == 1
+    assert metrics.histograms['worker.dispatcher.handler.orders'].count == 2
+
+    assert worker.process_message(Message('job.created'))
+    worker.ack_unmatched = False
+    assert not worker.process_message(Message('job.created'))
+
+
+def test_dispatcher_needs_a_router():
+    with pytest.raises(ValueError):
+        DispatcherWorker(object())
+
+
+def test_handler_concurrency_limit():
+    router = EventRouter()
+    lock = Lock()
+    state = {'active': 0, 'max_active': 0}
+
+    @router.handler('order.*', concurrency=2)
+    def limited(message):
+        with lock:
+            state['active'] += 1
+            state['max_active'] = max(state['max_active'], state['active'])
+        time.sleep(0.02)
+        with lock:
+            state['active'] -= 1
+        return True
+
+    worker = DispatcherWorker(object(), router=router, logger_=MockLogger())
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(worker.process_message, [Message('order.x')] * 16))
+    assert all(results)
+    assert state['max_active'] == 2
+
+
+def test_handlers_can_be_pickled():
+    router = EventRouter()
+    handler = router.register('order.*', len, concurrency=2)
+    restored = pickle.loads(pickle.dumps(handler))
+    assert restored._semaphore is not None
+    assert restored('abc') == 3
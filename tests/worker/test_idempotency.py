@@ -0,0 +1,178 @@
+"""Tests for `briefy.common.worker.idempotency` and its use by QueueWorker."""
+from briefy.common.queue.event import Queue
+from briefy.common.utils.metrics import MemorySink
+from briefy.common.worker import QueueWorker
+from briefy.common.worker.idempotency import IdempotencyStore
+from briefy.common.worker.idempotency import RedisIdempotencyStore
+from conftest import MockLogger
+from datetime import datetime
+
+import pytest
+import pytz
+
+
+EVENT_ID = '0b0f3c4e-3a21-4a8b-9f36-0d9a1b7f5e11'
+
+
+def get_payload(event_id=EVENT_ID, position=0):
+    """Payload for the event queue."""
+    return {
+        'id': event_id,
+        'event_name': 'customer.event.created',
+        'created_at': datetime(2016, 6, 21, 18, 34, 22, tzinfo=pytz.utc),
+        'guid': 'eebd5265-7201-4316-b996-722b977dbf32',
+        'data': {'position': position}
+    }
+
+
+class FakeRedis:
+    """Redis client keeping the keys in a dictionary."""
+
+    def __init__(self):
+        """Initialize the client."""
+        self.keys = {}
+        self.executed = 0
+
+    def pipeline(self, transaction=True):
+        """Return a pipeline."""
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Pipeline running the commands of a FakeRedis on execute."""
+
+    def __init__(self, client):
+        """Initialize the pipeline."""
+        self.client = client
+        self.commands = []
+
+    def exists(self, key):
+        """Queue an EXISTS command."""
+        self.commands.append(lambda: int(key in self.client.keys))
+
+    def set(self, key, value, ex=None):
+        """Queue a SET command."""
+        self.commands.append(lambda: self.client.keys.__setitem__(key, (value, ex)))
+
+    def execute(self):
+        """Run the queued commands."""
+        self.client.executed += 1
+        return [command() for command in self.commands]
+
+
+class BrokenStore:
+    """Shared store always failing."""
+
+    def seen(self, keys):
+        """Fail."""
+        raise ConnectionError
+
+    add = seen
+
+
+class RecordingWorker(QueueWorker):
+    """Worker recording the positions it processes, failing odd ones if asked."""
+
+    name = 'recording'
+
+    def __init__(self, *args, fail=(), **kwargs):
+        """Initialize the worker."""
+        self.positions = []
+        self.fail = fail
+        super().__init__(*args, **kwargs)
+
+    def process_message(self, message):
+        """Record the message position."""
+        position = message.body['data']['position']
+        self.positions.append(position)
+        return position not in self.fail
+
+
+@pytest.fixture
+def queue(tmpdir):
+    """Return an event queue using the local backend."""
+    queue = Queue()
+    queue.backend = 'local'
+    queue.local_path = str(tmpdir.join('queues.sqlite'))
+    return queue
+
+
+def test_store_evicts_least_recently_used_keys():
+    store = IdempotencyStore(max_size=3)
+    store.add(['a', 'b', 'c'])
+    assert store.seen(['a', 'x']) == {'a'}
+    store.add(['d'])
+    assert len(store) == 3
+    assert store.seen(['a', 'b', 'c', 'd']) == {'a', 'c', 'd'}
+
+
+def test_store_checks_and_caches_the_shared_store():
+    client = FakeRedis()
+    shared = RedisIdempotencyStore(client, ttl=60, prefix='test:')
+    other = IdempotencyStore(shared=shared)
+    other.add(['a', 'b'])
+    assert client.keys == {'test:a': (1, 60), 'test:b': (1, 60)}
+
+    store = IdempotencyStore(shared=shared)
+    executed = client.executed
+    assert store.seen(['a', 'c']) == {'a'}
+    assert client.executed == executed + 1
+    # known keys are answered locally
+    assert store.seen(['a']) == {'a'}
+    assert client.executed == executed + 1
+
+
+def test_store_ignores_shared_store_errors():
+    logger = MockLogger()
+    store = IdempotencyStore(shared=BrokenStore(), logger_=logger)
+    store.add(['a'])
+    assert store.seen(['a', 'b']) == {'a'}
+    assert logger.exception_called == 2
+
+
+def test_worker_skips_processed_events(queue):
+    metrics = MemorySink()
+    store = IdempotencyStore()
+    worker = RecordingWorker(queue, idempotency_store=store, wait_time=0, metrics=metrics)
+    queue.write_messages([
+        get_payload(position=0),
+        get_payload(position=1),
+        get_payload(event_id='5a4d8d38-6f2a-4b65-8d2c-3e7c0f0b9a01', position=2),
+        {k: v for k, v in get_payload(position=3).items() if k != 'id'},
+    ])
+    assert worker.process() == 4
+    assert worker.positions == [0, 2, 3]
+    assert queue.queue.attributes['ApproximateNumberOfMessagesNotVisible'] == '0'
+    assert metrics.counters['worker.recording.messages.duplicate'] == 1
+
+    # redelivered
+    queue.write_message(get_payload(position=4))
+    worker.process()
+    assert worker.positions == [0, 2, 3]
+    assert metrics.counters['worker.recording.messages.duplicate'] == 2
+
+    # another consumer of the same events is not affected
+    other = RecordingWorker(queue, idempotency_store=store, wait_time=0)
+    other.name = 'other'
+    queue.write_message(get_payload(position=5))
+    other.process()
+    assert other.positions == [5]
+
+
+def test_worker_processes_failed_events_again(queue):
+    store = IdempotencyStore()
+    worker = RecordingWorker(
+        queue, idempotency_store=store, wait_time=0, concurrency=2, fail=(0,),
+        logger_=MockLogger()
+    )
+    queue.write_messages([get_payload(position=0), get_payload(position=1)])
+    worker.process()
+    # the copy was deleted, the failed message is still in flight
+    assert worker.positions == [0]
+    assert queue.queue.attributes['ApproximateNumberOfMessagesNotVisible'] == '1'
+
+    worker.fail = ()
+    queue.write_message(get_payload(position=2))
+    worker.process()
+    assert worker.positions == [0, 2]
+    assert store.seen(['recording:' + EVENT_ID])
@@ -1,7 +1,10 @@
 """Tests for `briefy.common.worker.queue.QueueWorker`."""
 from briefy.common.worker import QueueWorker
 from conftest import MockLogger
+from threading import Barrier
+from threading import Thread
 
+import pickle
 import pytest
 import time
 
@@ -46,6 +49,36 @@ class DummyQueue:
     def __init__(self):
         """Initialize dummy queue."""
         self.messages = []
+        self.deleted_batches = []
+        self.visibility_changes = []
+
+    def write_message(self, payload):
+        """Write message to the queue."""
+        self.messages.append(payload)
+
+    def get_messages(self, num_messages=10, wait_time=None):
+        """Return a list of MinimalMessage from this queue."""
+        return [MinimalMessage(self, message) for message in self.messages[:num_messages]]
+
+    def delete_messages(self, messages):
+        """Delete a list of MinimalMessage from this queue."""
+        self.deleted_batches.append(len(messages))
+        for message in messages:
+            message.delete()
+        return []
+
+    def change_visibility(self, messages, timeout):
+        """Record a visibility timeout change."""
+        self.visibility_changes.append((len(messages), timeout))
+        return []
+
+
+class LegacyQueue:
+    """Queue without the batch methods of IQueue."""
+
+    def __init__(self):
+        """Initialize legacy queue."""
+        self.messages = []
 
     def write_message(self, payload):
         """Write message to the queue."""
@@ -107,7 +140,6 @@ class TestQueueWorker:
 
     def test_threaded_queue_worker_consume_messages(self):
         """Test write_message."""
-        from threading import Thread  # noQA
         queue = self.queue()
         w = MinimalQueueWorker(queue)
         w._iterations = 100
@@ -137,3 +169,168 @@ class TestQueueWorker:
         w()
         assert len(list(queue.get_messages())) == 1
         assert 'Message was not deleted' in mock_logger.info_messages
+
+    def test_queue_worker_deletes_messages_in_batch(self):
+        """Processed messages are deleted in a single call."""
+        queue = self.queue()
+        w = MinimalQueueWorker(queue, batch_size=5, wait_time=1)
+        for i in range(7):
+            queue.write_message({'message': i})
+        w()
+        assert queue.deleted_batches == [5]
+        assert len(queue.messages) == 2
+
+    def test_queue_worker_deletes_processed_messages_on_error(self):
+        """Messages processed before an error are still deleted."""
+        queue = self.queue()
+
+        class RaisingQueueWorker(MinimalQueueWorker):
+            def process_message(self, message):
+                if message.body['message'] == 2:
+                    raise RuntimeError
+                return True
+
+        w = RaisingQueueWorker(queue, logger_=MockLogger())
+        for i in range(4):
+            queue.write_message({'message': i})
+        w()
+        assert queue.deleted_batches == [2]
+        assert [m['message'] for m in queue.messages] == [2, 3]
+
+    def test_queue_worker_processes_messages_concurrently(self):
+        """Messages are processed in a pool of threads and deleted in batch."""
+        queue = self.queue()
+        barrier = Barrier(3, timeout=5)
+
+        class ConcurrentQueueWorker(MinimalQueueWorker):
+            def process_message(self, message):
+                # only passes if the three messages are processed at the same time
+                barrier.wait()
+                return True
+
+        w = ConcurrentQueueWorker(queue, concurrency=3)
+        for i in range(3):
+            queue.write_message({'message': i})
+        w()
+        assert queue.deleted_batches == [3]
+        assert queue.messages == []
+        assert w._executor is None
+
+    def test_queue_worker_concurrent_failures_are_not_deleted(self):
+        """Failed and raising messages stay in the queue."""
+        queue = self.queue()
+
+        class FailingQueueWorker(MinimalQueueWorker):
+            def process_message(self, message):
+                value = message.body['message']
+                if value == 1:
+                    raise RuntimeError
+                return value != 2
+
+        mock_logger = MockLogger()
+        w = FailingQueueWorker(queue, logger_=mock_logger, concurrency=2)
+        for i in range(4):
+            queue.write_message({'message': i})
+        w()
+        assert queue.deleted_batches == [2]
+        assert [m['message'] for m in queue.messages] == [1, 2]
+        assert mock_logger.exception_called == 1
+        assert mock_logger.info_messages.count('Message was not deleted') == 2
+
+    def test_queue_worker_extends_visibility_of_slow_messages(self):
+        """Visibility timeout is extended while messages are being processed."""
+        queue = self.queue()
+
+        class SlowQueueWorker(MinimalQueueWorker):
+            visibility_timeout = 0.1
+
+            def process_message(self, message):
+                time.sleep(0.2)
+                return True
+
+        w = SlowQueueWorker(queue, concurrency=2)
+        for i in range(2):
+            queue.write_message({'message': i})
+        w()
+        assert queue.visibility_changes
+        assert queue.visibility_changes[0] == (2, 0.1)
+        assert queue.deleted_batches == [2]
+
+    def test_sequential_queue_worker_extends_visibility_of_slow_batches(self):
+        """Processed messages are deleted and the others extended during slow batches."""
+        queue = self.queue()
+
+        class SlowQueueWorker(MinimalQueueWorker):
+            visibility_timeout = 0.1
+
+            def process_message(self, message):
+                time.sleep(0.08)
+                return True
+
+        w = SlowQueueWorker(queue)
+        for i in range(3):
+            queue.write_message({'message': i})
+        w()
+        assert queue.visibility_changes == [(2, 0.1), (1, 0.1)]
+        assert queue.deleted_batches == [1, 1, 1]
+        assert queue.messages == []
+
+    def test_queue_worker_preserve_order(self):
+        """Messages of the same group are processed in order, stopping on failure."""
+        queue = self.queue()
+        processed = []
+
+        class OrderedQueueWorker(MinimalQueueWorker):
+            preserve_order = True
+
+            def process_message(self, message):
+                body = message.body
+                processed.append((body['guid'], body['message']))
+                return body['message'] != 1
+
+        w = OrderedQueueWorker(queue, concurrency=4, logger_=MockLogger())
+        for i in range(4):
+            queue.write_message({'guid': 'a', 'message': i})
+        queue.write_message({'guid': 'b', 'message': 0})
+        w()
+        assert [item for item in processed if item[0] == 'a'] == [('a', 0), ('a', 1)]
+        assert ('b', 0) in processed
+        assert [(m['guid'], m['message']) for m in queue.messages] == [
+            ('a', 1), ('a', 2), ('a', 3)
+        ]
+
+    def test_queue_worker_unknown_pool(self):
+        """Only thread and process pools are supported."""
+        with pytest.raises(ValueError):
+            MinimalQueueWorker(self.queue(), pool='greenlet')
+
+    def test_queue_worker_pickle(self):
+        """Workers sent to a process pool do not carry the queue and the logger."""
+        w = MinimalQueueWorker(self.queue(), concurrency=2, pool='process')
+        clone = pickle.loads(pickle.dumps(w))
+        assert clone.input_queue is None
+        assert clone.concurrency == 2
+        assert clone.logger is not None
+
+    def test_queue_worker_process_returns_received_messages(self):
+        """Process reports the number of messages received, used for scheduling."""
+        queue = self.queue()
+        w = MinimalQueueWorker(queue, batch_size=3)
+        for i in range(5):
+            queue.write_message({'message': i})
+        assert w.process() == 3
+        assert w.process() == 2
+        assert w.process() == 0
+
+    def test_queue_worker_with_legacy_queue(self):
+        """Queues without the batch API are polled without arguments and deleted one by one."""
+        class FailingQueueWorker(MinimalQueueWorker):
+            def process_message(self, message):
+                return message.body['message'] != 1
+
+        queue = LegacyQueue()
+        w = FailingQueueWorker(queue, logger_=MockLogger(), concurrency=2)
+        for i in range(3):
+            queue.write_message({'message': i})
+        w()
+        assert queue.messages == [{'message': 1}]
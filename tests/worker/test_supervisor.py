@@ -0,0 +1,111 @@
+"""Tests for `briefy.common.worker.supervisor.Supervisor`."""
+from briefy.common.worker import Worker
+from briefy.common.worker.supervisor import Supervisor
+from conftest import MockLogger
+from threading import Thread
+
+import os
+import pytest
+import time
+
+
+class CountingWorker(Worker):
+    """Worker processing 3 items per run, for a limited number of runs."""
+
+    name = 'Counting'
+    run_interval = 0.001
+    runs = 5
+
+    def process(self):
+        """Run tasks on this worker."""
+        if self.stats['runs'] + 1 >= self.runs:
+            self.running = False
+        return 3
+
+
+class EndlessWorker(CountingWorker):
+    """Worker running until stopped."""
+
+    runs = float('inf')
+
+    def process(self):
+        """Run tasks on this worker."""
+        time.sleep(0.01)
+        return 1
+
+
+def counting_worker():
+    """Return a CountingWorker."""
+    return CountingWorker()
+
+
+def endless_worker():
+    """Return an EndlessWorker."""
+    return EndlessWorker()
+
+
+class CrashingFactory:
+    """Factory crashing the first times it is called in each child slot."""
+
+    def __init__(self, path, crashes):
+        """Initialize the factory."""
+        self.path = path
+        self.crashes = crashes
+
+    def __call__(self):
+        """Crash, recording the attempt, until enough crashes happened."""
+        with open(self.path, 'a') as fh:
+            fh.write('x')
+        with open(self.path) as fh:
+            attempts = len(fh.read())
+        if attempts <= self.crashes:
+            os._exit(3)
+        return CountingWorker()
+
+
+def test_supervisor_runs_workers_and_aggregates_stats():
+    """All children run and their stats are summed."""
+    supervisor = Supervisor(counting_worker, processes=3, logger_=MockLogger(), check_interval=0.05)
+    totals = supervisor()
+    assert totals['runs'] == 15
+    assert totals['items'] == 45
+    assert totals['errors'] == 0
+    assert totals['restarts'] == 0
+    assert totals['alive'] == 0
+
+
+def test_supervisor_restarts_crashed_children(tmpdir):
+    """Children exiting with an error are restarted with backoff."""
+    factory = CrashingFactory(str(tmpdir.join('attempts')), crashes=2)
+    supervisor = Supervisor(
+        factory, processes=1, logger_=MockLogger(), restart_backoff=0.1, check_interval=0.05
+    )
+    start = time.monotonic()
+    totals = supervisor()
+    assert totals['restarts'] == 2
+    assert totals['runs'] == 5
+    # 0.1s then 0.2s of backoff
+    assert time.monotonic() - start >= 0.3
+
+
+def test_supervisor_stop_propagates_to_children():
+    """Stopping the supervisor stops the children gracefully."""
+    supervisor = Supervisor(
+        endless_worker, processes=2, logger_=MockLogger(), check_interval=0.05, stats_interval=0.05
+    )
+    result = {}
+    t = Thread(target=lambda: result.update(supervisor()))
+    t.start()
+    time.sleep(0.5)
+    supervisor.stop()
+    t.join(10)
+    assert not t.is_alive()
+    assert result['alive'] == 0
+    assert result['items'] > 0
+    assert all(child.process is None for child in supervisor.children)
+
+
+def test_supervisor_rejects_unknown_options():
+    """Only class attributes can be overridden."""
+    with pytest.raises(TypeError):
+        Supervisor(counting_worker, processes=1, restart_delay=3)
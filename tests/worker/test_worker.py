@@ -77,3 +77,80 @@ def test_worker_calls_logger():
     w = RaiserWorker(logger_=mock_logger)
     w()
     assert mock_logger.info_called and mock_logger.exception_called
+
+
+def test_worker_next_interval_legacy():
+    """Without a process result the worker always waits run_interval."""
+    w = MinimalWorker(run_interval=0.5, max_run_interval=8)
+    assert [w.next_interval(None) for _ in range(3)] == [0.5, 0.5, 0.5]
+
+
+def test_worker_next_interval_adaptive():
+    """Busy workers do not wait, idle ones back off up to the ceiling."""
+    w = MinimalWorker(run_interval=0.5, max_run_interval=3)
+    w.jitter = 0
+    assert w.next_interval(3) == 0
+    assert [w.next_interval(0) for _ in range(6)] == [0.5, 1, 2, 3, 3, 3]
+    assert w.next_interval(1) == 0
+    assert w.next_interval(0) == 0.5
+
+
+def test_worker_next_interval_without_ceiling():
+    """Without max_run_interval idle workers wait run_interval."""
+    w = MinimalWorker(run_interval=0.5)
+    w.jitter = 0
+    assert [w.next_interval(0) for _ in range(3)] == [0.5, 0.5, 0.5]
+
+
+def test_worker_next_interval_jitter():
+    """Idle intervals are randomized within the jitter fraction."""
+    w = MinimalWorker(run_interval=1, max_run_interval=1)
+    w.jitter = 0.2
+    intervals = {w.next_interval(0) for _ in range(50)}
+    assert len(intervals) > 1
+    assert all(0.8 <= interval <= 1.2 for interval in intervals)
+
+
+def test_worker_adaptive_loop():
+    """Process is called without waiting while it finds work."""
+    class BusyWorker(MinimalWorker):
+        run_interval = 1
+        _runs = 50
+
+        def process(self):
+            super().process()
+            return 1
+
+    w = BusyWorker()
+    start = time.time()
+    w()
+    assert w._count == w._runs
+    assert time.time() - start < 0.5
+
+
+def test_worker_stats():
+    """Runs, items and errors are counted."""
+    class StatsWorker(MinimalWorker):
+        def process(self):
+            super().process()
+            if self._count == 2:
+                raise RuntimeError
+            return 2
+
+    w = StatsWorker(logger_=MockLogger())
+    w()
+    assert w.stats == {'runs': 5, 'items': 8, 'errors': 1}
+
+
+def test_worker_ignores_other_process_results():
+    """Values other than ints returned by process are not counted as work."""
+    class LegacyWorker(MinimalWorker):
+        def process(self):
+            super().process()
+            return ('done', True, {'status': 'ok'})[self._count % 3]
+
+    w = LegacyWorker(logger_=MockLogger(), run_interval=0.5, max_run_interval=8)
+    assert [w.next_interval(result) for result in (True, 'done', {})] == [0.5, 0.5, 0.5]
+    w.run_interval = 0.01
+    w()
+    assert w.stats == {'runs': 5, 'items': 0, 'errors': 0}
@@ -0,0 +1,176 @@
+"""Tests for worker metrics."""
+from briefy.common.utils.metrics import MemorySink
+from briefy.common.utils.metrics import NullSink
+from briefy.common.worker import AsyncQueueWorker
+from briefy.common.worker import QueueWorker
+from briefy.common.worker import Worker
+from conftest import MockLogger
+
+import asyncio
+import pytest
+import time
+
+
+class ListQueue:
+    """Queue returning messages from a list, deleting them on request."""
+
+    def __init__(self, messages=()):
+        """Initialize the queue."""
+        self.messages = list(messages)
+
+    def get_messages(self, num_messages=1, wait_time=None):
+        """Return up to num_messages."""
+        messages = self.messages[:num_messages]
+        self.messages = self.messages[num_messages:]
+        return messages
+
+    def delete_messages(self, messages):
+        """Delete messages."""
+        return []
+
+
+class SummaryLogger(MockLogger):
+    """Logger recording the extra argument of info calls."""
+
+    def __init__(self):
+        """Initialize the logger."""
+        super().__init__()
+        self.summaries = []
+
+    def info(self, *args, **kw):
+        """Record summaries."""
+        super().info(*args, **kw)
+        extra = kw.get('extra') or {}
+        if 'worker_summary' in extra:
+            self.summaries.append(extra['worker_summary'])
+
+
+class CountingQueueWorker(QueueWorker):
+    """Queue worker failing odd messages, stopping when the queue is empty."""
+
+    name = 'counting'
+    run_interval = 0.001
+
+    def process(self):
+        """Stop once the queue is empty."""
+        result = super().process()
+        if not self.input_queue.messages:
+            self.running = False
+        return result
+
+    def process_message(self, message):
+        """Fail odd messages."""
+        return message % 2 == 0
+
+
+@pytest.fixture
+def sink():
+    """Return an in memory sink."""
+    return MemorySink()
+
+
+def test_worker_uses_configured_sink_by_default():
+    """Without config, metrics are discarded."""
+    class MinimalWorker(Worker):
+        name = 'minimal'
+
+        def process(self):
+            pass
+
+    assert isinstance(MinimalWorker().metrics, NullSink)
+
+
+def test_worker_with_legacy_result_waits_run_interval(sink):
+    """Results other than ints neither skip nor grow the interval, and are not counted."""
+    class LegacyWorker(Worker):
+        name = 'legacy'
+        run_interval = 0.05
+        max_run_interval = 5
+        jitter = 0
+        runs = 0
+
+        def process(self):
+            self.runs += 1
+            if self.runs >= 5:
+                self.running = False
+            return object()
+
+    w = LegacyWorker(metrics=sink)
+    start = time.monotonic()
+    w()
+    elapsed = time.monotonic() - start
+    # 5 waits of run_interval: no busy loop, no idle backoff (0.05 * 31)
+    assert 0.25 <= elapsed < 0.6
+    assert w.stats == {'runs': 5, 'items': 0, 'errors': 0}
+    assert sink.snapshot()['histograms']['worker.legacy.loop']['count'] == 5
+
+
+@pytest.mark.parametrize('concurrency', [0, 2])
+def test_queue_worker_metrics(sink, concurrency):
+    """Messages are counted and timed."""
+    logger = SummaryLogger()
+    w = CountingQueueWorker(
+        ListQueue(range(5)), logger_=logger, batch_size=2, metrics=sink, concurrency=concurrency
+    )
+    w()
+    snapshot = sink.snapshot()
+    counters = snapshot['counters']
+    assert counters['worker.counting.runs'] == 3
+    assert counters['worker.counting.messages.received'] == 5
+    assert counters['worker.counting.messages.processed'] == 3
+    assert counters['worker.counting.messages.failed'] == 2
+    histograms = snapshot['histograms']
+    assert histograms['worker.counting.message']['count'] == 5
+    assert histograms['worker.counting.receive']['count'] == 3
+    assert histograms['worker.counting.loop']['count'] == 3
+    assert 0 <= snapshot['gauges']['worker.counting.idle_ratio'] <= 1
+
+    summary = logger.summaries[-1]
+    assert summary['messages.processed'] == 3
+    assert summary['messages.failed'] == 2
+    assert summary['message.avg_ms'] >= 0
+    assert summary['processed_rate'] > 0
+
+
+def test_worker_summary_window(sink):
+    """The summary covers the time since the last report."""
+    logger = SummaryLogger()
+    w = CountingQueueWorker(ListQueue(), logger_=logger, metrics=sink)
+    w.incr('messages.processed', 4)
+    w.timing('message', 0.5)
+    w.timing('message', 1.5)
+    w.idle(5)
+    summary = w.summary(now=w._window_start + 10)
+    assert summary['messages.processed'] == 4
+    assert summary['message.avg_ms'] == 1000
+    assert summary['idle_ratio'] == 0.5
+    assert summary['processed_rate'] == 0.4
+
+    w.report()
+    assert logger.summaries[-1]['messages.processed'] == 4
+    assert 'messages.processed' not in w.summary()
+
+
+def test_async_queue_worker_metrics(sink):
+    """Async workers record the same metrics."""
+    class AsyncCountingWorker(AsyncQueueWorker):
+        name = 'async_counting'
+        run_interval = 0.001
+
+        async def process(self):
+            result = await super().process()
+            if not self.input_queue.messages and not self._tasks:
+                self.running = False
+            return result
+
+        async def process_message(self, message):
+            await asyncio.sleep(0)
+            return message % 2 == 0
+
+    w = AsyncCountingWorker(ListQueue(range(5)), logger_=MockLogger(), metrics=sink)
+    w()
+    counters = sink.snapshot()['counters']
+    assert counters['worker.async_counting.messages.received'] == 5
+    assert counters['worker.async_counting.messages.processed'] == 3
+    assert counters['worker.async_counting.messages.failed'] == 2
+    assert sink.snapshot()['histograms']['worker.async_counting.message']['count'] == 5
@@ -5,6 +5,8 @@ from base_workflow import LegacyCustomer
 from base_workflow import User
 from briefy import common
 from briefy.common import workflow
+from briefy.common.event import BaseEvent
+from briefy.common.event.workflow import WorkflowTransitionEvent
 from briefy.common.workflow import WorkflowPermissionException
 from conftest import queue_url
 from datetime import datetime
@@ -12,6 +14,7 @@ from zope.configuration.xmlconfig import XMLConfig
 
 import botocore
 import pytest
+import zope.event
 
 
 class TestWorkflow:
@@ -89,6 +92,39 @@ class TestWorkflow:
         assert customer.workflow.state == customer.workflow.pending
         assert customer.workflow.history[-1]['message'] == msg
 
+    def test_update_event_is_sent_after_transition_subscribers(self, monkeypatch):
+        """Both events are sent once the subscribers of both ran, update first."""
+        calls = []
+
+        class Registry:
+            def notify(self, event):
+                calls.append('update subscribers')
+
+        class Request:
+            registry = Registry()
+
+        class CustomerUpdated(BaseEvent):
+            event_name = 'customer.updated'
+
+            def dispatch(self, payload):
+                calls.append('update')
+                return self.id
+
+        def dispatch(event, payload):
+            calls.append('transition')
+            return event.id
+
+        customer = Customer('12345')
+        customer.workflow.context = User('12345')
+        customer.request = Request()
+        monkeypatch.setattr(CustomerWorkflow, 'update_event', CustomerUpdated)
+        monkeypatch.setattr(WorkflowTransitionEvent, 'dispatch', dispatch)
+        monkeypatch.setattr(zope.event, 'subscribers', [
+            lambda event: calls.append('transition subscribers')
+        ])
+        customer.workflow.submit()
+        assert calls == ['update subscribers', 'transition subscribers', 'update', 'transition']
+
     def test_transitions_declared_with_multiple_state(self):
         """Test transitions for an object."""
         from briefy.common.workflow import WorkflowTransitionException